@@ -1,4 +1,5 @@
 from filebase_api.templates import *  # noqa: F403, F401
 from filebase_api.webservice import *  # noqa: F403, F401
 from filebase_api.webserver import *  # noqa: F403, F401
+from filebase_api.transport import *  # noqa: F403, F401
 from filebase_api.decorators import *  # noqa: F403, F401
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class FilebaseLRUCache(object):
+    _missing = object()
+
+    def __init__(self, max_size: int = 1024, max_bytes: int = None, size_of: Callable[[Any], int] = None):
+        """A thread safe, bounded, least recently used cache.
+
+        Args:
+            max_size (int, optional): The max number of items to keep. If None, unlimited. Defaults to 1024.
+            max_bytes (int, optional): The max total size of the items (as measured by size_of).
+                If None, unlimited. Defaults to None.
+            size_of (Callable[[Any], int], optional): A method to measure the size of an item. Defaults to
+                len of the value (if any), otherwise 1.
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._size_of = size_of
+        self._items: OrderedDict = OrderedDict()
+        self._sizes = dict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    @property
+    def total_bytes(self) -> int:
+        """The total measured size of the cached items."""
+        return self._total_bytes
+
+    @property
+    def stats(self) -> dict:
+        """The cache counters (hits, misses, evictions, size, bytes)"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+            "bytes": self.total_bytes,
+        }
+
+    def _measure(self, val) -> int:
+        if self._size_of is not None:
+            return self._size_of(val)
+        try:
+            return len(val)
+        except TypeError:
+            return 1
+
+    def _evict_overflow(self):
+        while len(self._items) > 0 and (
+            (self.max_size is not None and len(self._items) > self.max_size)
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            key, _ = self._items.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default=None):
+        """Returns the cached value and marks it as recently used.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any, optional): The value to return if not found. Defaults to None.
+        """
+        with self._lock:
+            val = self._items.get(key, self._missing)
+            if val is self._missing:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def set(self, key: Hashable, val):
+        """Sets a value in the cache, evicting the least recently used items if over the limits.
+
+        Args:
+            key (Hashable): The cache key.
+            val (Any): The value.
+        """
+        size = self._measure(val)
+        with self._lock:
+            if key in self._items:
+                self._total_bytes -= self._sizes.pop(key, 0)
+            self._items[key] = val
+            self._items.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict_overflow()
+
+    def get_or_create(self, key: Hashable, create: Callable[[], Any]):
+        """Returns the cached value or creates (and caches) a new one.
+
+        Args:
+            key (Hashable): The cache key.
+            create (Callable[[], Any]): Called to create the value if missing.
+        """
+        val = self.get(key, self._missing)
+        if val is self._missing:
+            val = create()
+            self.set(key, val)
+        return val
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Removes a key from the cache. Returns true if removed.
+        """
+        with self._lock:
+            if key not in self._items:
+                return False
+            del self._items[key]
+            self._total_bytes -= self._sizes.pop(key, 0)
+            return True
+
+    def invalidate_where(self, predict: Callable[[Hashable], bool]) -> int:
+        """Removes all keys that match the predict. Returns the number of removed keys.
+        """
+        with self._lock:
+            keys = [k for k in self._items.keys() if predict(k)]
+            for key in keys:
+                self.invalidate(key)
+            return len(keys)
+
+    def clear(self):
+        """Clears the cache items (the counters are kept)"""
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
@@ -0,0 +1,343 @@
+import types
+import inspect
+import typing
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Tuple
+
+from filebase_api.serialization import DATETIME_MARKER
+
+NONE_TYPE = type(None)
+
+
+class FilebaseApiCallException(TypeError):
+    """Raised when the arguments of a remote method call do not match the method signature."""
+
+    pass
+
+
+class FilebaseApiCallParameter(object):
+    def __init__(self, parameter: inspect.Parameter, hint: Any = None, coerce: bool = True):
+        """A remote method parameter, with its (compiled) argument coercion.
+
+        Args:
+            parameter (inspect.Parameter): The signature parameter.
+            hint (Any, optional): The parameter type hint. Defaults to None.
+            coerce (bool, optional): If true, arguments are validated and coerced to the type hint.
+                Defaults to True.
+        """
+        super().__init__()
+        self.name = parameter.name
+        self.kind = parameter.kind
+        self.has_default = parameter.default is not inspect.Parameter.empty
+        self.hint = hint
+        self.coerce: Callable[[Any], Any] = compile_coercion(hint) if coerce and hint is not None else None
+
+    @property
+    def is_positional(self) -> bool:
+        return self.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+
+    @property
+    def is_keyword(self) -> bool:
+        return self.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+
+
+def _type_name(hint: Any) -> str:
+    return getattr(hint, "__name__", None) or str(hint).replace("typing.", "")
+
+
+def _get_origin(hint: Any) -> Any:
+    if hasattr(typing, "get_origin"):
+        return typing.get_origin(hint)
+    # python < 3.8
+    origin = getattr(hint, "__origin__", None)
+    return getattr(origin, "__extra__", None) or origin
+
+
+def _get_args(hint: Any) -> tuple:
+    if hasattr(typing, "get_args"):
+        return typing.get_args(hint)
+    # python < 3.8
+    return getattr(hint, "__args__", None) or ()
+
+
+def _coerce_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        value = value[len(DATETIME_MARKER) :] if value.startswith(DATETIME_MARKER) else value
+        if value.endswith("Z"):
+            # fromisoformat does not accept the utc designator before python 3.11.
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+    raise TypeError()
+
+
+def _coerce_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return _coerce_datetime(value).date() if value.startswith(DATETIME_MARKER) else date.fromisoformat(value)
+    raise TypeError()
+
+
+def _coerce_int(value):
+    if isinstance(value, bool):
+        raise TypeError()
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value)
+    raise TypeError()
+
+
+def _coerce_float(value):
+    if isinstance(value, bool):
+        raise TypeError()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value)
+    raise TypeError()
+
+
+def _check_type(value_type: type):
+    def check(value):
+        if not isinstance(value, value_type):
+            raise TypeError()
+        return value
+
+    return check
+
+
+def _coerce_enum(enum_type: type):
+    def coerce(value):
+        if isinstance(value, enum_type):
+            return value
+        try:
+            return enum_type(value)
+        except ValueError:
+            if isinstance(value, str) and value in enum_type.__members__:
+                return enum_type[value]
+            raise
+
+    return coerce
+
+
+def _coerce_list(value_type: type, coerce_item: Callable):
+    def coerce(value):
+        if not isinstance(value, (list, tuple)):
+            raise TypeError()
+        if coerce_item is not None:
+            value = [coerce_item(item) for item in value]
+        return value if value_type is list and isinstance(value, list) else value_type(value)
+
+    return coerce
+
+
+def _coerce_dict(coerce_value: Callable):
+    def coerce(value):
+        if not isinstance(value, dict):
+            raise TypeError()
+        if coerce_value is None:
+            return value
+        return {key: coerce_value(item) for key, item in value.items()}
+
+    return coerce
+
+
+def _coerce_union(coercions: List[Tuple[type, Callable]], allow_none: bool):
+    def coerce(value):
+        if value is None and allow_none:
+            return value
+        for value_type, _ in coercions:
+            # exact matches first (e.g. Union[int, str] keeps "1" a string).
+            if value_type is not None and type(value) is value_type:
+                return value
+        for _, coerce_value in coercions:
+            try:
+                return coerce_value(value)
+            except (TypeError, ValueError):
+                continue
+        raise TypeError()
+
+    return coerce
+
+
+def compile_coercion(hint: Any) -> Callable[[Any], Any]:
+    """Compiles a type hint into an argument coercion function, that returns the coerced value or raises
+    a TypeError/ValueError. Returns None if the hint is not validated (e.g. Any, or an arbitrary class).
+
+    Supported: bool, int, float, str, datetime and date (from iso strings, or DT:: strings of the json codec),
+    Enum types (by value or name), list/tuple/set/dict (and their typing generics) and Optional/Union.
+
+    Args:
+        hint (Any): The type hint.
+    """
+    if hint is None or hint is Any or hint is inspect.Parameter.empty:
+        return None
+    if hint is NONE_TYPE:
+        return _check_type(NONE_TYPE)
+
+    origin = _get_origin(hint)
+    if origin is typing.Union or (origin is not None and origin is getattr(types, "UnionType", None)):
+        members = _get_args(hint)
+        allow_none = NONE_TYPE in members
+        coercions = []
+        for member in members:
+            if member is NONE_TYPE:
+                continue
+            coerce_member = compile_coercion(member)
+            if coerce_member is None:
+                # not validated, any value.
+                return None
+            coercions.append((member if _get_origin(member) is None else None, coerce_member))
+        return _coerce_union(coercions, allow_none)
+
+    if origin in (list, tuple, set, frozenset):
+        args = [arg for arg in _get_args(hint) if arg is not Ellipsis]
+        coerce_item = compile_coercion(args[0]) if len(args) == 1 else None
+        return _coerce_list(origin, coerce_item)
+    if origin is dict:
+        args = _get_args(hint)
+        return _coerce_dict(compile_coercion(args[1]) if len(args) == 2 else None)
+    if origin is not None:
+        return None
+
+    if not isinstance(hint, type):
+        return None
+    if hint is bool:
+        return _check_type(bool)
+    if hint is int:
+        return _coerce_int
+    if hint is float:
+        return _coerce_float
+    if hint is str:
+        return _check_type(str)
+    if hint is datetime:
+        return _coerce_datetime
+    if hint is date:
+        return _coerce_date
+    if issubclass(hint, Enum):
+        return _coerce_enum(hint)
+    if hint in (list, tuple, set, frozenset):
+        return _coerce_list(hint, None)
+    if hint is dict:
+        return _check_type(dict)
+    return None
+
+
+class FilebaseApiCallPlan(object):
+    def __init__(self, name: str, method: Callable, coerce: bool = True):
+        """A remote method call plan, compiled once from the method signature and type hints.
+        Binds the command arguments (a list of positional arguments, a dict of keyword arguments or a single value)
+        to the method parameters, validates and coerces the typed arguments and raises a FilebaseApiCallException
+        describing the bad argument.
+
+        The first method parameter is the page, and is not bound.
+
+        Args:
+            name (str): The remote method name.
+            method (Callable): The remote method.
+            coerce (bool, optional): If true, validate and coerce the arguments by the method type hints.
+                Defaults to True.
+        """
+        super().__init__()
+        self.name = name
+        self.method = method
+
+        self.signature = signature = inspect.signature(method)
+        try:
+            hints = typing.get_type_hints(method)
+        except Exception:
+            # unresolvable (string) annotations are not validated.
+            hints = dict()
+
+        self.parameters: List[FilebaseApiCallParameter] = [
+            FilebaseApiCallParameter(parameter, hints.get(parameter.name), coerce)
+            for parameter in list(signature.parameters.values())[1:]
+        ]
+        self.by_name: Dict[str, FilebaseApiCallParameter] = {
+            p.name: p for p in self.parameters if p.kind != inspect.Parameter.VAR_POSITIONAL
+        }
+        self.positional = [p for p in self.parameters if p.is_positional]
+        self.var_positional = next((p for p in self.parameters if p.kind == inspect.Parameter.VAR_POSITIONAL), None)
+        self.var_keyword = next((p for p in self.parameters if p.kind == inspect.Parameter.VAR_KEYWORD), None)
+        self.required = [p.name for p in self.parameters if not p.has_default and (p.is_positional or p.is_keyword)]
+        self.client_by_name = any(p.kind == inspect.Parameter.KEYWORD_ONLY for p in self.parameters) and not any(
+            p.kind == inspect.Parameter.POSITIONAL_ONLY for p in self.parameters
+        )
+
+    @property
+    def client_parameters(self) -> List[FilebaseApiCallParameter]:
+        """The parameters of the client (javascript) method. Positional parameters, and keyword only
+        parameters if the client calls the method by name (see client_by_name)"""
+        if self.client_by_name:
+            return [p for p in self.parameters if p.is_keyword]
+        return list(self.positional)
+
+    def _error(self, message: str) -> FilebaseApiCallException:
+        return FilebaseApiCallException(f"{self.name}: {message}")
+
+    def _coerce(self, parameter: FilebaseApiCallParameter, value: Any) -> Any:
+        if parameter.coerce is None or (value is None and parameter.has_default):
+            # the client stubs send null for omitted arguments.
+            return value
+        try:
+            return parameter.coerce(value)
+        except (TypeError, ValueError):
+            raise self._error(
+                f"invalid value for argument '{parameter.name}', expected {_type_name(parameter.hint)}"
+                + f", got {type(value).__name__} ({repr(value)[:50]})"
+            )
+
+    def bind(self, args: Any) -> Tuple[list, dict]:
+        """Binds the command arguments to the method parameters. Returns the (coerced) positional and
+        keyword arguments.
+
+        Args:
+            args (Any): A list of positional arguments, a dict of keyword arguments, a single
+                argument value, or None (no arguments).
+        """
+        if isinstance(args, dict):
+            return self._bind_keywords(args)
+        if not isinstance(args, list):
+            args = [args] if args is not None else []
+        return self._bind_positional(args)
+
+    def _bind_positional(self, args: list) -> Tuple[list, dict]:
+        positional = self.positional
+        if len(args) > len(positional) and self.var_positional is None:
+            raise self._error(f"takes {len(positional)} positional arguments but {len(args)} were given")
+
+        bound = []
+        for index, value in enumerate(args):
+            parameter = positional[index] if index < len(positional) else self.var_positional
+            bound.append(self._coerce(parameter, value))
+
+        missing = [p.name for p in positional[len(args) :] if not p.has_default]
+        missing += [p.name for p in self.parameters if p.kind == inspect.Parameter.KEYWORD_ONLY and not p.has_default]
+        if len(missing) > 0:
+            raise self._error("missing required arguments: " + ", ".join(f"'{name}'" for name in missing))
+        return bound, dict()
+
+    def _bind_keywords(self, args: dict) -> Tuple[list, dict]:
+        bound = dict()
+        for name, value in args.items():
+            parameter = self.by_name.get(name)
+            if parameter is None or parameter.kind == inspect.Parameter.VAR_KEYWORD:
+                if self.var_keyword is None:
+                    raise self._error(f"got an unexpected argument '{name}'")
+                parameter = self.var_keyword
+            elif parameter.kind == inspect.Parameter.POSITIONAL_ONLY:
+                raise self._error(f"argument '{name}' is positional only")
+            bound[name] = self._coerce(parameter, value)
+
+        missing = [name for name in self.required if name not in bound]
+        if len(missing) > 0:
+            raise self._error("missing required arguments: " + ", ".join(f"'{name}'" for name in missing))
+        return [], bound
@@ -0,0 +1,75 @@
+from datetime import date, datetime
+from enum import Enum
+from typing import Dict, List, Optional
+
+import pytest
+
+from filebase_api.calls import FilebaseApiCallPlan, FilebaseApiCallException
+
+
+class Color(Enum):
+    red = "r"
+    blue = "b"
+
+
+def typed(page, at: datetime, count: int, ratio: float = 1.0, color: Color = None, *, tags: List[str] = None):
+    pass
+
+
+def untyped(page, a, b=2, *args, **kwargs):
+    pass
+
+
+def test_bind_and_coerce():
+    plan = FilebaseApiCallPlan("typed", typed)
+    args, kwargs = plan.bind(["DT::2020-01-02T03:04:05", "3", 2, "blue"])
+    assert args == [datetime(2020, 1, 2, 3, 4, 5), 3, 2.0, Color.blue] and kwargs == {}
+
+    args, kwargs = plan.bind({"at": datetime(2020, 1, 1), "count": 1.0, "tags": ["a"], "color": "r"})
+    assert args == [] and kwargs == {"at": datetime(2020, 1, 1), "count": 1, "tags": ["a"], "color": Color.red}
+    # the utc designator.
+    assert plan.bind(["2020-01-02T03:04:05Z", 1])[0][0] == datetime.fromisoformat("2020-01-02T03:04:05+00:00")
+    # null defaults (omitted by the client stubs) are not validated.
+    assert plan.bind(["2020-01-01", 1, None])[0][2] is None
+
+
+@pytest.mark.parametrize(
+    "args,error",
+    [
+        (["2020-01-01"], "missing required arguments: 'count'"),
+        (["2020-01-01", 1, 1, None, 5], "takes 4 positional arguments but 5 were given"),
+        ({"at": "2020-01-01", "count": 1, "size": 2}, "unexpected argument 'size'"),
+        (["2020-01-01", "many"], "invalid value for argument 'count', expected int, got str"),
+        ({"at": "2020-01-01", "count": 1, "tags": [1]}, "invalid value for argument 'tags'"),
+        (["2020-01-01", 1, 1, "green"], "invalid value for argument 'color', expected Color"),
+    ],
+)
+def test_bind_errors(args, error):
+    with pytest.raises(FilebaseApiCallException) as ex:
+        FilebaseApiCallPlan("typed", typed).bind(args)
+    assert str(ex.value).startswith("typed: ")
+    assert error in str(ex.value)
+
+
+def test_bind_untyped_and_coercion_disabled():
+    plan = FilebaseApiCallPlan("untyped", untyped)
+    assert plan.bind(1) == ([1], {})
+    assert plan.bind([1, 2, 3, 4]) == ([1, 2, 3, 4], {})
+    assert plan.bind({"a": 1, "c": 3}) == ([], {"a": 1, "c": 3})
+    assert [p.name for p in plan.client_parameters] == ["a", "b"] and not plan.client_by_name
+
+    plan = FilebaseApiCallPlan("typed", typed, coerce=False)
+    assert plan.bind(["x", "y"]) == (["x", "y"], {})
+    assert plan.client_by_name
+
+
+def test_bind_typing_generics():
+    def method(page, days: Optional[List[date]], counts: Dict[str, int] = None):
+        pass
+
+    plan = FilebaseApiCallPlan("method", method)
+    assert plan.bind([["2020-01-01", "DT::2020-01-02T10:00:00"], {"a": "1"}]) == (
+        [[date(2020, 1, 1), date(2020, 1, 2)], {"a": 1}],
+        {},
+    )
+    assert plan.bind([None]) == ([None], {})
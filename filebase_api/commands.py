@@ -0,0 +1,136 @@
+import asyncio
+import inspect
+from typing import Any, Awaitable, Callable, Set
+
+from zcommon.shell import logger
+from filebase_api.helpers import FilebaseApiModuleInfo
+
+
+def invoke_remote_method_in_process(module_path: str, name: str, args: list, kwargs: dict):
+    """Executes a remote method of a code module in the current process (a process pool worker).
+    The method is called with page=None, see FilebaseApiRemoteMethodExecutionMode.
+
+    Args:
+        module_path (str): The code module path.
+        name (str): The remote method name.
+        args (list): The call args.
+        kwargs (dict): The call kwargs.
+    """
+    module_info = FilebaseApiModuleInfo.load_from_path(module_path)
+    handler = module_info.get_module_command_handler(name) if module_info is not None else None
+    if handler is None:
+        raise Exception(f"Command not found: {name} (@ {module_path})")
+    rslt = handler(None, *args, **kwargs)
+    return list(rslt) if inspect.isgenerator(rslt) else rslt
+
+
+class FilebaseApiCommandDispatcher(object):
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[Any]],
+        send: Callable[[Any], Awaitable],
+        max_in_flight: int = 32,
+        ordered: bool = False,
+    ):
+        """Executes the websocket commands of a single connection as independent tasks.
+
+        Args:
+            process (Callable[[Any], Awaitable[Any]]): Processes a received message, returns the response
+                to send (None = nothing to send).
+            send (Callable[[Any], Awaitable]): Sends a response.
+            max_in_flight (int, optional): The max number of commands executing at once. When reached, dispatch
+                waits (and the connection is not read) until a command completes. If None, unlimited.
+                Defaults to 32.
+            ordered (bool, optional): If true, responses are sent in the order the commands were received,
+                otherwise as soon as each command completes. Defaults to False.
+        """
+        super().__init__()
+        self._process = process
+        self._send = send
+        self.max_in_flight = max_in_flight
+        self.ordered = ordered
+
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight is not None else None
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_send_gate: asyncio.Future = None
+
+        self.dispatched = 0
+        self.cancelled = 0
+        self.peak_in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """The number of commands currently executing"""
+        return len(self._tasks)
+
+    @property
+    def stats(self) -> dict:
+        """The dispatcher counters"""
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "dispatched": self.dispatched,
+            "cancelled": self.cancelled,
+        }
+
+    async def dispatch(self, message: Any) -> asyncio.Task:
+        """Starts executing a message in a new task. Waits if the max in flight commands was reached.
+
+        Args:
+            message (Any): The received message.
+
+        Returns:
+            asyncio.Task: The command task.
+        """
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+
+        previous_send_gate = None
+        send_gate = None
+        if self.ordered:
+            previous_send_gate = self._last_send_gate
+            send_gate = asyncio.get_event_loop().create_future()
+            self._last_send_gate = send_gate
+
+        task = asyncio.ensure_future(self._execute(message, previous_send_gate, send_gate))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+        self.dispatched += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return task
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._semaphore is not None:
+            self._semaphore.release()
+        if task.cancelled():
+            self.cancelled += 1
+
+    async def _execute(self, message: Any, previous_send_gate: asyncio.Future, send_gate: asyncio.Future):
+        try:
+            rsp = await self._process(message)
+            if previous_send_gate is not None:
+                await asyncio.shield(previous_send_gate)
+            if rsp is not None:
+                await self._send(rsp)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Error while executing websocket command: {ex}")
+        finally:
+            if send_gate is not None and not send_gate.done():
+                send_gate.set_result(None)
+
+    async def join(self):
+        """Waits for all the executing commands to complete."""
+        while len(self._tasks) > 0:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def cancel(self):
+        """Cancels all the executing commands, and waits for them to stop."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,60 @@
+import asyncio
+from filebase_api.commands import FilebaseApiCommandDispatcher
+
+
+def run_dispatcher(messages, **kwargs):
+    sent = []
+
+    async def process(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    async def send(rsp):
+        sent.append(rsp)
+
+    async def run():
+        dispatcher = FilebaseApiCommandDispatcher(process, send, **kwargs)
+        for message in messages:
+            await dispatcher.dispatch(message)
+        await dispatcher.join()
+        return dispatcher
+
+    return asyncio.run(run()), sent
+
+
+def test_commands_execute_concurrently():
+    dispatcher, sent = run_dispatcher([0.1, 0.01, 0.05])
+    assert sent == [0.01, 0.05, 0.1]
+    assert dispatcher.peak_in_flight == 3
+
+
+def test_ordered_responses():
+    _, sent = run_dispatcher([0.1, 0.01, 0.05], ordered=True)
+    assert sent == [0.1, 0.01, 0.05]
+
+
+def test_max_in_flight():
+    dispatcher, sent = run_dispatcher([0.01] * 10, max_in_flight=2)
+    assert len(sent) == 10
+    assert dispatcher.peak_in_flight == 2
+
+
+def test_cancel_in_flight_commands():
+    sent = []
+
+    async def process(message):
+        await asyncio.sleep(10)
+
+    async def send(rsp):
+        sent.append(rsp)
+
+    async def run():
+        dispatcher = FilebaseApiCommandDispatcher(process, send)
+        for i in range(3):
+            await dispatcher.dispatch(i)
+        await dispatcher.cancel()
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert dispatcher.in_flight == 0 and dispatcher.cancelled == 3
+    assert sent == []
@@ -18,17 +18,27 @@ def fapi_remote(fun):
     return fun
 
 
-def fapi_remote_config(config: FilebaseApiRemoteMethodConfig = None):
+def fapi_remote_config(config: FilebaseApiRemoteMethodConfig = None, **kwargs):
     """Add configuration to a remote websocket function.
 
+    Example:
+        @fapi_remote
+        @fapi_remote_config(execution_mode="process")
+        def crunch(page, values):
+            ...
+
     Args:
         config (FilebaseApiRemoteMethodConfig, optional): The configuration. If none ignored. Defaults to None.
+        kwargs: Configuration values (see FilebaseApiRemoteMethodConfig), override the config values.
     """
+    config = FilebaseApiRemoteMethodConfig(**{**(config or {}), **kwargs})
 
     def decorator(fun):
         setattr(fun, FILEBASE_API_REMOTE_METHOD_MARKER_CONFIG_ATTRIB_NAME, config)
         return fun
 
+    return decorator
+
 
 def fapi_extra_logs(fun):
     """Adds extra server side logs to remote websocket client method.
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable
+
+
+class FilebaseExecutorOverloadedException(Exception):
+    pass
+
+
+class FilebaseExecutor(object):
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queue: int = None,
+        name: str = "filebase",
+        use_processes=False,
+        process_start_method: str = "spawn",
+    ):
+        """An asyncio friendly wrapper for a thread (or process) pool, with a queue limit and
+        execution counters.
+
+        Args:
+            max_workers (int, optional): The number of workers in the pool. Defaults to 4.
+            max_queue (int, optional): The max number of calls waiting for a free worker. Calls over the
+                limit are rejected (FilebaseExecutorOverloadedException). If None, unlimited. Defaults to None.
+            name (str, optional): The executor name (thread name prefix). Defaults to "filebase".
+            use_processes (bool, optional): If true, use a process pool. Defaults to False.
+            process_start_method (str, optional): The multiprocessing start method of the process pool workers.
+                Spawned workers do not inherit the server sockets and threads. Defaults to "spawn".
+        """
+        super().__init__()
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.name = name
+        self.use_processes = use_processes
+        self.process_start_method = process_start_method
+
+        self._pool: Executor = None
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def pool(self) -> Executor:
+        """The executor pool (created on first use)"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = (
+                        ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context(self.process_start_method),
+                        )
+                        if self.use_processes
+                        else ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                    )
+        return self._pool
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of calls waiting for a free worker"""
+        return max(0, self.in_flight - self.max_workers)
+
+    @property
+    def stats(self) -> dict:
+        """The executor counters"""
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def _on_call_done(self, future: asyncio.Future):
+        with self._lock:
+            self.in_flight -= 1
+            if not future.cancelled() and future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def run(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """Runs a method in the executor pool. Returns an awaitable future.
+
+        Args:
+            fn (Callable): The method to run.
+        """
+        with self._lock:
+            if self.max_queue is not None and self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise FilebaseExecutorOverloadedException(
+                    f"Executor {self.name} is overloaded ({self.queue_depth} calls waiting)"
+                )
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            future = asyncio.get_event_loop().run_in_executor(self.pool, partial(fn, *args, **kwargs))
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._on_call_done)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        """Shuts down the executor pool. A new pool is created on next use."""
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown(wait=wait)
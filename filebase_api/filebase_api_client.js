@@ -76,6 +76,92 @@ class Emitter extends EventTarget {
     }
 }
 
+/**
+ * An async iterator over the chunks streamed by a remote method (see FilebaseApi.stream_command).
+ * More chunks are requested from the server (credits) as the chunks are consumed.
+ */
+class FilebaseApiStreamReader {
+    constructor(api, command_id, credits = null) {
+        this.api = api
+        this.command_id = command_id
+        this.credits = credits
+        this.chunks = []
+        this.done = false
+        this.error = null
+        this.consumed = 0
+        this.waiting = null
+    }
+
+    push(rsp) {
+        if (this.done) return
+        if (rsp.__end) {
+            this.done = true
+            try {
+                this.api.process_common_command_rsp(rsp)
+            } catch (ex) {
+                this.error = ex
+            }
+            this.api.pending_streams.delete(this.command_id)
+        } else this.chunks.push(rsp.__chunk)
+        this.wake()
+    }
+
+    wake() {
+        if (this.waiting == null) return
+        let waiting = this.waiting
+        this.waiting = null
+        waiting()
+    }
+
+    grant_credits() {
+        if (this.credits == null || this.done) return
+        this.consumed += 1
+        if (this.consumed < Math.max(1, Math.floor(this.credits / 2))) return
+        this.api.send_message({
+            __command_id: this.command_id,
+            __stream_credit: this.consumed,
+        })
+        this.consumed = 0
+    }
+
+    async next() {
+        while (this.chunks.length == 0 && !this.done)
+            await new Promise((resolve) => (this.waiting = resolve))
+
+        if (this.chunks.length > 0) {
+            let value = this.chunks.shift()
+            this.grant_credits()
+            return { value: value, done: false }
+        }
+        if (this.error != null) throw this.error
+        return { value: undefined, done: true }
+    }
+
+    async return() {
+        this.cancel()
+        return { value: undefined, done: true }
+    }
+
+    /**
+     * Stops the stream (on the server as well)
+     */
+    cancel() {
+        if (this.done) return
+        this.done = true
+        this.chunks = []
+        this.api.pending_streams.delete(this.command_id)
+        this.api.send_message({
+            __command_id: this.command_id,
+            __stream_cancel: true,
+        })
+        this.wake()
+    }
+
+    [Symbol.asyncIterator]() {
+        return this
+    }
+}
+
 class FilebaseApi extends Emitter {
     constructor(websocket_url = null) {
         super()
@@ -89,7 +175,21 @@ class FilebaseApi extends Emitter {
         this.FILEBASE_API_PAGE_TYPE_MARKER =
             '{!%FILEBASE_API_PAGE_TYPE_MARKER%!}'
 
-        this.pending_command_ids = new Set()
+        // the message codecs, by preference (selected at handshake). msgpack requires the
+        // @msgpack/msgpack library (window.MessagePack) to be loaded before the websocket opens.
+        this.codecs = ['msgpack', 'json']
+        this.codec = 'json'
+
+        this.pending_commands = new Map()
+        this.pending_attachments = null
+        this.pending_streams = new Map()
+        // the number of chunks a stream can send before more are requested.
+        this.stream_credits = 16
+        this.command_batch = null
+        // pub/sub topic handlers, by topic (see subscribe)
+        this.topic_handlers = new Map()
+        // if true, commands executed in the same tick are sent in one frame (see exec_command)
+        this.micro_batching = false
         this.websocket_url =
             websocket_url ||
             `ws://${window.location.host}/${this.FILEBASE_API_WEBSOCKET_MARKER}?${this.FILEBASE_API_PAGE_TYPE_MARKER}=${window.location.pathname}}`
@@ -101,7 +201,7 @@ class FilebaseApi extends Emitter {
 
     get status() {
         let status_list = new Set()
-        if (this.pending_command_ids.size > 0) {
+        if (this.pending_commands.size > 0) {
             status_list.add('waiting_on_commands')
         }
 
@@ -122,9 +222,22 @@ class FilebaseApi extends Emitter {
     process_common_command_rsp(rsp) {
         if (rsp.__error != null) throw Error(rsp.__error)
         if (rsp.__warning != null) console.warn(rsp.__warning)
+        if (rsp.__errors != null) {
+            // some of the methods of the command failed, the error holds the other results.
+            let error = Error(
+                Object.entries(rsp.__errors)
+                    .map(([name, message]) => `${name}: ${message}`)
+                    .join('; ')
+            )
+            error.errors = rsp.__errors
+            error.response = rsp
+            throw error
+        }
     }
 
     parse_json_with_datetime(str) {
+        // the reviver is slow, skip it when there are no dates.
+        if (str.indexOf('"DT::') < 0) return JSON.parse(str)
         return JSON.parse(str, (k, v) => {
             if (typeof v === 'string' && v.startsWith('DT::'))
                 return new Date(Date.parse(v.substr(4)))
@@ -133,36 +246,160 @@ class FilebaseApi extends Emitter {
         })
     }
 
+    get available_codecs() {
+        return this.codecs.filter(
+            (codec) => codec != 'msgpack' || window.MessagePack != null
+        )
+    }
+
+    encode_message(message) {
+        if (this.codec == 'msgpack') return window.MessagePack.encode(message)
+        return JSON.stringify(message)
+    }
+
+    decode_message(data) {
+        if (typeof data === 'string') return this.parse_json_with_datetime(data)
+        return window.MessagePack.decode(new Uint8Array(data))
+    }
+
+    /**
+     * Receives a websocket frame, returns the message or null if the message is
+     * incomplete (waiting for its binary attachments).
+     */
+    receive_frame(data) {
+        let pending = this.pending_attachments
+        if (pending != null && typeof data !== 'string') {
+            pending.buffers.push(data)
+            if (pending.buffers.length < pending.count) return null
+            this.pending_attachments = null
+            return this.resolve_attachments(pending.message, pending.buffers)
+        }
+
+        let message = this.decode_message(data)
+        if (message.__attachments == null) return message
+
+        // the attachments are sent as binary frames, right after the message.
+        this.pending_attachments = {
+            message: message.__message,
+            count: message.__attachments,
+            buffers: [],
+        }
+        return null
+    }
+
+    /**
+     * Replaces the attachment references in a message with the attachment
+     * ArrayBuffer, or a typed array (with a shape property) if the attachment has a dtype.
+     */
+    resolve_attachments(value, buffers) {
+        if (value == null || typeof value !== 'object') return value
+        if (value instanceof Date || ArrayBuffer.isView(value)) return value
+        if (Array.isArray(value)) {
+            for (let i = 0; i < value.length; i++)
+                value[i] = this.resolve_attachments(value[i], buffers)
+            return value
+        }
+        if (value.__attachment != null) {
+            let buffer = buffers[value.__attachment]
+            let array_type =
+                value.dtype != null
+                    ? FilebaseApi.ATTACHMENT_ARRAY_TYPES[value.dtype]
+                    : null
+            if (array_type == null) return buffer
+            let array = new array_type(buffer)
+            array.shape = value.shape
+            return array
+        }
+        for (let key in value)
+            value[key] = this.resolve_attachments(value[key], buffers)
+        return value
+    }
+
+    process_message(data) {
+        if (data.__batch != null)
+            data.__batch.forEach((rsp) => this.process_command_rsp(rsp))
+        else if (data.__command_id != null) this.process_command_rsp(data)
+        else if (data.__topic != null) {
+            let handlers = this.topic_handlers.get(data.__topic) || []
+            handlers.forEach((handler) => handler(data.payload, data.__topic))
+        } else if (data.__event_name != null) {
+            this.emit(data.__event_name, ...(data.args || []), data.kwargs || {})
+        } else this.process_common_command_rsp(data)
+    }
+
+    send_message(message) {
+        this.ws.send(this.encode_message(message))
+    }
+
+    /**
+     * Sends a command to the server. If batch, the command is queued and all the
+     * commands queued in the same tick are sent in a single (__batch) frame.
+     * @param {object} command
+     * @param {boolean} batch
+     */
+    send_command(command, batch = false) {
+        if (!batch) {
+            this.send_message(command)
+            return
+        }
+        if (this.command_batch == null) {
+            this.command_batch = []
+            queueMicrotask(() => this.flush_command_batch())
+        }
+        this.command_batch.push(command)
+    }
+
+    flush_command_batch() {
+        let batch = this.command_batch
+        this.command_batch = null
+        if (batch == null || batch.length == 0) return
+        if (batch.length == 1) this.send_message(batch[0])
+        else this.send_message({ __batch: batch })
+    }
+
+    process_command_rsp(rsp) {
+        let stream = this.pending_streams.get(rsp.__command_id)
+        if (stream != null) {
+            stream.push(rsp)
+            return
+        }
+        let pending = this.pending_commands.get(rsp.__command_id)
+        if (pending != null) pending.resolve(rsp)
+        this.emit('command', rsp)
+    }
+
     /**
      * Execute a command on the server.
      * @param {object} command
      * @param {number} timeout
+     * @param {boolean} batch If true, coalesce with the other commands executed in the same
+     * tick into one websocket frame. Defaults to this.micro_batching.
      */
-    async exec_command(command, timeout = 1000 * 30) {
+    async exec_command(command, timeout = 1000 * 30, batch = null) {
         let command_id = this.next_command_id()
         command['__command_id'] = command_id
 
         let rsp = null
-        let handler = null
+        let timeout_handle = null
 
-        this.pending_command_ids.add(command_id)
         this.emit_async('status_changed').catch(() => {})
         await new Promise((resolve, reject) => {
-            handler = this.on('command', (ev, data) => {
-                if (command.__command_id != data.__command_id) return
-                rsp = data
-                resolve()
+            this.pending_commands.set(command_id, {
+                resolve: (data) => {
+                    rsp = data
+                    resolve()
+                },
             })
-            this.ws.send(JSON.stringify(command))
+            this.send_command(command, batch == null ? this.micro_batching : batch)
             if (timeout > 0) {
-                window.setTimeout(
+                timeout_handle = window.setTimeout(
                     () => reject(new Error('command timedout')),
                     timeout
                 )
             }
         }).finally(() => {
-            this.clear(handler)
-            this.pending_command_ids.delete(command_id)
+            if (timeout_handle != null) window.clearTimeout(timeout_handle)
+            this.pending_commands.delete(command_id)
             this.emit_async('status_changed').catch(() => {})
         })
 
@@ -170,6 +407,58 @@ class FilebaseApi extends Emitter {
         return rsp
     }
 
+    /**
+     * Execute a streamed command on the server (a remote generator method). Returns an
+     * async iterator over the streamed chunks, e.g.
+     * for await (let row of fapi.stream_command({ rows: [100] })) ...
+     * @param {object} command
+     * @param {number} credits The number of chunks the server can send ahead of consumption
+     * (flow control). If null, unlimited. Defaults to this.stream_credits.
+     */
+    stream_command(command, credits = undefined) {
+        let command_id = this.next_command_id()
+        credits = credits === undefined ? this.stream_credits : credits
+        command['__command_id'] = command_id
+        command['__stream'] = credits == null ? true : credits
+
+        let reader = new FilebaseApiStreamReader(this, command_id, credits)
+        this.pending_streams.set(command_id, reader)
+        this.send_command(command)
+        return reader
+    }
+
+    stream(name, ...args) {
+        let cmnd = {}
+        cmnd[name] = args
+        return this.stream_command(cmnd)
+    }
+
+    subscribe(topic, handler) {
+        let handlers = this.topic_handlers.get(topic)
+        if (handlers == null) {
+            handlers = []
+            this.topic_handlers.set(topic, handlers)
+            // otherwise subscribed when the websocket opens.
+            if (this.ws != null && this.ws.readyState == 1)
+                this.send_message({ __subscribe: topic })
+        }
+        handlers.push(handler)
+    }
+
+    unsubscribe(topic, handler = null) {
+        let handlers = this.topic_handlers.get(topic)
+        if (handlers == null) return
+        if (handler != null) handlers = handlers.filter((h) => h != handler)
+        else handlers = []
+        if (handlers.length > 0) {
+            this.topic_handlers.set(topic, handlers)
+            return
+        }
+        this.topic_handlers.delete(topic)
+        if (this.ws != null && this.ws.readyState == 1)
+            this.send_message({ __unsubscribe: topic })
+    }
+
     async exec(...args) {
         if (typeof args[0] == 'string') {
             let name = args[0]
@@ -182,11 +471,14 @@ class FilebaseApi extends Emitter {
     }
 
     ready(action) {
-        this.on('ready', action)
+        // the websocket may open before the page scripts run (inline bundle)
+        if (this.is_ready) action()
+        else this.on('ready', action)
     }
 
     check_ready() {
         if (this.websocket_open && this.scripts_loaded) {
+            this.is_ready = true
             this.emit('ready')
             this.emit('status_changed')
         }
@@ -210,14 +502,25 @@ class FilebaseApi extends Emitter {
 
         // Let us open a web socket
         try {
-            this.create_exposed_module_scripts_source()
+            // already loaded by the client bundle.
+            if (!this.scripts_loaded) this.create_exposed_module_scripts_source()
 
-            let ws = new WebSocket(this.websocket_url)
+            let ws = new WebSocket(
+                this.websocket_url,
+                this.available_codecs.map((codec) => 'fapi.' + codec)
+            )
+            ws.binaryType = 'arraybuffer'
             let commander = this
             commander.ws = ws
 
             ws.onopen = function () {
+                commander.codec = ws.protocol.startsWith('fapi.')
+                    ? ws.protocol.substr(5)
+                    : 'json'
                 console.log('Filebase api command websocket open')
+                commander.topic_handlers.forEach((_, topic) =>
+                    commander.send_message({ __subscribe: topic })
+                )
                 commander.waiting_for_initialization = false
                 commander.emit('open')
                 commander.websocket_open = true
@@ -225,16 +528,8 @@ class FilebaseApi extends Emitter {
             }
             ws.onmessage = function (ev) {
                 try {
-                    let data = commander.parse_json_with_datetime(ev.data)
-                    if (data.__command_id != null)
-                        commander.emit('command', data)
-                    else if (data.__event_name != null) {
-                        commander.emit(
-                            data.__event_name,
-                            ...(data.args || []),
-                            data.kwargs || {}
-                        )
-                    } else commander.process_common_command_rsp(data)
+                    let data = commander.receive_frame(ev.data)
+                    if (data != null) commander.process_message(data)
                 } catch (ex) {
                     console.error(ex)
                 }
@@ -252,6 +547,20 @@ class FilebaseApi extends Emitter {
     }
 }
 
+// typed arrays of binary attachments, by dtype (see resolve_attachments)
+FilebaseApi.ATTACHMENT_ARRAY_TYPES = {
+    int8: Int8Array,
+    uint8: Uint8Array,
+    int16: Int16Array,
+    uint16: Uint16Array,
+    int32: Int32Array,
+    uint32: Uint32Array,
+    int64: window.BigInt64Array,
+    uint64: window.BigUint64Array,
+    float32: Float32Array,
+    float64: Float64Array,
+}
+
 if (window.filebase_api == null) {
     window.filebase_api = new FilebaseApi()
     window.addEventListener('load', (event) => {
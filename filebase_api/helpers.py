@@ -1,28 +1,145 @@
+import re
+import time
+import asyncio
 import inspect
 from types import ModuleType
-from typing import List, Dict, Callable
+from typing import Any, List, Dict, Callable, Set, Tuple, Union
 from enum import Enum
 
-from sanic.websocket import WebSocketConnection
+from sanic.websocket import WebSocketConnection, ConnectionClosed
 from sanic.request import Request
 
 from match_pattern import Pattern
 from zcommon.textops import create_unique_string_id
 from zcommon.fs import load_config_files_from_path, relative_abspath
+from zcommon.shell import logger
 from zcommon.modules import try_load_module_dynamic_with_timestamp
-from zcommon.textops import json_dump_with_types
-from zcommon.collections import SerializableDict
+from zcommon.collections import SerializableDict, StringEnum
 from zthreading.events import AsyncEventHandler
 
+from filebase_api.cache import FilebaseLRUCache
+from filebase_api.responses import compute_etag, minify_javascript
+from filebase_api.streams import FilebaseApiStream
+from filebase_api.serialization import FilebaseApiCodec, FilebaseApiJsonCodec
+from filebase_api.outbound import FilebaseApiOutboundQueue, FilebaseApiOverflowPolicy
+from filebase_api.calls import FilebaseApiCallPlan
+
 FILEBASE_API_REMOTE_METHOD_MARKER_ATTRIB_NAME = "__filebase_api_remote_method"
 FILEBASE_API_REMOTE_METHOD_MARKER_CONFIG_ATTRIB_NAME = FILEBASE_API_REMOTE_METHOD_MARKER_ATTRIB_NAME + "_config"
 FILEBASE_API_WEBSOCKET_MARKER = "__filebase_api_websocket"
 FILEBASE_API_CORE_ROUTES_MARKER = "__filebase_api_core"
 FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER = "__filebase_api_websocket_methods.js"
+FILEBASE_API_CLIENT_BUNDLE_MARKER = "__filebase_api_bundle"
 FILEBASE_API_PAGE_TYPE_MARKER = "__filebase_pt"
+FILEBASE_API_PAGE_CACHE_POLICY_ATTRIB_NAME = "fapi_cache_policy"
+FILEBASE_API_MODULE_SETTING_ATTRIB_PREFIX = "fapi_"
+FILEBASE_API_SERVER_DRAINING_EVENT_NAME = "server_draining"
+MIME_TYPE_EXTENSION_PATTERN = re.compile(r"^\*\.([^*?\[\]/|]+)$")
+SCRIPT_END_TAG_PATTERN = re.compile(r"</(script)", re.IGNORECASE)
+
+
+class FilebaseTemplateFreshness(StringEnum):
+    """How the template service checks that a cached template file is up to date.
+
+    always - check the file modified time on every render.
+    interval - check the file modified time at most once every template_check_interval seconds.
+    watch - templates are invalidated by the file watcher, no checks on render. While no file watcher is
+        running, checked as interval.
+    production - never check after the template was loaded.
+    """
+
+    always = "always"
+    interval = "interval"
+    watch = "watch"
+    production = "production"
+
+
+class FilebaseApiRemoteMethodExecutionMode(StringEnum):
+    """Where a synchronous (non coroutine) remote method is executed.
+
+    thread - in the api remote methods thread pool.
+    process - in the api remote methods process pool. The arguments and the return value must be picklable,
+        and the method is called with page=None.
+    inline - on the event loop (for trivial methods only, blocks the server while executing).
+    """
+
+    thread = "thread"
+    process = "process"
+    inline = "inline"
+
+
+class FilebaseCompiledDict(SerializableDict):
+    def __init__(self, **kwargs):
+        """A serializable dictionary that holds values compiled from its items (patterns, tables..).
+        The compiled values are created once and cleared on any mutation of the dictionary.
+        """
+        self._compiled = dict()
+        super().__init__(**kwargs)
+
+    def __getstate__(self):
+        # compiled values are not serialized.
+        return {}
+
+    def __setstate__(self, state):
+        self._compiled = dict()
+
+    def _compiled_value(self, key, create: Callable):
+        """Internal, returns a compiled value or creates it if missing.
+
+        Args:
+            key (Hashable): The compiled value key.
+            create (Callable): Called to create the value if missing.
+        """
+        compiled = getattr(self, "_compiled", None)
+        if compiled is None:
+            # not created when unpickling (the items are restored before the state).
+            compiled = self._compiled = dict()
+        val = compiled.get(key, None)
+        if val is None:
+            val = create()
+            compiled[key] = val
+        return val
+
+    def _clear_compiled(self):
+        """Internal, clears all compiled values. Called on any mutation."""
+        compiled = getattr(self, "_compiled", None)
+        if compiled is not None:
+            compiled.clear()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._clear_compiled()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._clear_compiled()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._clear_compiled()
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, *args):
+        val = super().pop(*args)
+        self._clear_compiled()
+        return val
+
+    def popitem(self):
+        val = super().popitem()
+        self._clear_compiled()
+        return val
+
+    def clear(self):
+        super().clear()
+        self._clear_compiled()
 
 
-class FilebaseTemplateServiceConfig(SerializableDict):
+class FilebaseTemplateServiceConfig(FilebaseCompiledDict):
     def __init__(self, **kwargs):
         super().__init__()
         self.update(kwargs)
@@ -52,11 +169,23 @@ class FilebaseTemplateServiceConfig(SerializableDict):
 
         return Pattern(pattern)
 
+    def _get_pattern(self, key: str, default_pattern: str = None) -> Pattern:
+        """Internal, returns the compiled pattern for a config key. The pattern is
+        parsed once and recompiled only if the config changes.
+
+        Args:
+            key (str): The config key.
+            default_pattern (str, optional): The pattern to use if the key is missing. Defaults to None.
+        """
+        return self._compiled_value(
+            ("pattern", key, default_pattern), lambda: self._parse_pattern(self.get(key, default_pattern))
+        )
+
     @property
     def jinja_files(self) -> Pattern:
         """The pattern to match files that require jinja templeting.
         """
-        return self._parse_pattern(self.get("jinja_files", None))
+        return self._get_pattern("jinja_files")
 
     @jinja_files.setter
     def jinja_files(self, val: Pattern):
@@ -80,7 +209,7 @@ class FilebaseTemplateServiceConfig(SerializableDict):
     def macro_files_pattern(self) -> Pattern:
         """The pattern to match files that are macro files.
         """
-        return self._parse_pattern(self.get("macro_files_pattern", None))
+        return self._get_pattern("macro_files_pattern")
 
     @macro_files_pattern.setter
     def macro_files_pattern(self, val: Pattern):
@@ -103,13 +232,97 @@ class FilebaseTemplateServiceConfig(SerializableDict):
         """
         self["src_subpath"] = val
 
+    @property
+    def watch_files(self) -> bool:
+        """If true, watch the source files for changes (and refresh the in memory indexes). Defaults to True.
+        """
+        return self.get("watch_files", True)
+
+    @watch_files.setter
+    def watch_files(self, val: bool):
+        self["watch_files"] = val
+
+    @property
+    def watch_interval(self) -> float:
+        """The file watcher interval (polling or events collection), in seconds. Defaults to 1.
+        """
+        return self.get("watch_interval", 1.0)
+
+    @watch_interval.setter
+    def watch_interval(self, val: float):
+        self["watch_interval"] = val
+
+    @property
+    def template_freshness(self) -> FilebaseTemplateFreshness:
+        """How cached template files are checked for changes, see FilebaseTemplateFreshness. Defaults to always.
+        """
+        return FilebaseTemplateFreshness.parse(self.get("template_freshness", "always"))
+
+    @template_freshness.setter
+    def template_freshness(self, val: FilebaseTemplateFreshness):
+        self["template_freshness"] = str(val)
+
+    @property
+    def template_check_interval(self) -> float:
+        """The min time between template file checks, in seconds, when template_freshness is interval.
+        Defaults to 1.
+        """
+        return self.get("template_check_interval", 1.0)
+
+    @template_check_interval.setter
+    def template_check_interval(self, val: float):
+        self["template_check_interval"] = val
+
+    @property
+    def render_threads(self) -> int:
+        """The number of threads used to render templates asynchronically. Defaults to 4.
+        """
+        return self.get("render_threads", 4)
+
+    @render_threads.setter
+    def render_threads(self, val: int):
+        self["render_threads"] = val
+
+    @property
+    def render_max_queue(self) -> int:
+        """The max number of async renders waiting for a render thread, over which renders are rejected.
+        If None, unlimited. Defaults to None.
+        """
+        return self.get("render_max_queue", None)
+
+    @render_max_queue.setter
+    def render_max_queue(self, val: int):
+        self["render_max_queue"] = val
+
+    @property
+    def template_cache_size(self) -> int:
+        """The max number of string templates to keep compiled in memory. Defaults to 256.
+        """
+        return self.get("template_cache_size", 256)
+
+    @template_cache_size.setter
+    def template_cache_size(self, val: int):
+        self["template_cache_size"] = val
+
+    @property
+    def template_cache_max_bytes(self) -> int:
+        """The max total source size of the string templates to keep compiled in memory. Defaults to 16MB.
+        """
+        return self.get("template_cache_max_bytes", 16 * 1024 * 1024)
+
+    @template_cache_max_bytes.setter
+    def template_cache_max_bytes(self, val: int):
+        self["template_cache_max_bytes"] = val
+
     def save(self, config_path):
         """Save this configuration to file.
         """
         raise NotImplementedError()
 
 
-class FilebaseApiConfigMimeTypes(SerializableDict):
+class FilebaseApiConfigMimeTypes(FilebaseCompiledDict):
+    DEFAULT_MIME_TYPE = "text/plain"
+
     def __init__(self, **kwargs):
         """A dictionary of file types to mime types.
         """
@@ -125,10 +338,10 @@ class FilebaseApiConfigMimeTypes(SerializableDict):
             "*.bmp": "image/bmp",
             "*.gif": "image/gif",
             "*.ico|*.cur": "image/x-icon",
-            "*.jpg|*.jpeg,": "image/jpeg",
+            "*.jpg|*.jpeg": "image/jpeg",
             "*.png": "image/png",
             "*.svg": "image/svg+xml",
-            "*.tif, .tiff": "image/tiff",
+            "*.tif|*.tiff": "image/tiff",
             "*.webp": "image/webp",
         }
 
@@ -136,19 +349,146 @@ class FilebaseApiConfigMimeTypes(SerializableDict):
 
         self.update(init_types)
 
+    @classmethod
+    def _split_pattern_key(cls, key: str) -> List[str]:
+        """Internal, splits a mime pattern key into its glob parts. Allows "," as a
+        separator and ".ext" as a shorthand for "*.ext"
+        """
+        if key.startswith("re::"):
+            return [key]
+        parts = [p.strip() for p in re.split(r"[|,]", key)]
+        return ["*" + p if p.startswith(".") else p for p in parts if len(p) > 0]
+
+    def _compile_table(self):
+        """Internal, compiles the mime table into an extension dictionary (ext -> (order, mime type))
+        and a list of (order, Pattern) for patterns that are not simple extensions.
+        """
+        extensions = dict()
+        patterns = []
+        for order, key in enumerate(self.keys()):
+            for part in self._split_pattern_key(key):
+                ext_match = MIME_TYPE_EXTENSION_PATTERN.match(part)
+                if ext_match is not None:
+                    extensions.setdefault(ext_match.group(1), (order, self[key]))
+                else:
+                    patterns.append((order, Pattern(part), self[key]))
+        return extensions, patterns
+
+    @property
+    def compiled_table(self):
+        """The compiled mime table, (extensions, patterns). Recompiled on change."""
+        return self._compiled_value("table", self._compile_table)
+
+    @property
+    def lookup_cache(self) -> FilebaseLRUCache:
+        """The cache of resolved mime types by path"""
+        return self._compiled_value("lookup_cache", lambda: FilebaseLRUCache(4096))
+
+    def _resolve_mime_type(self, src: str) -> str:
+        extensions, patterns = self.compiled_table
+        best_order = None
+        best_mime = None
+
+        filename = src.rsplit("/", 1)[-1]
+        dot_index = filename.find(".")
+        while dot_index != -1:
+            match = extensions.get(filename[dot_index + 1 :])  # noqa: E203
+            if match is not None and (best_order is None or match[0] < best_order):
+                best_order, best_mime = match
+            dot_index = filename.find(".", dot_index + 1)
+
+        for order, pattern, mime_type in patterns:
+            if best_order is not None and order >= best_order:
+                break
+            if pattern.test(src):
+                return mime_type
+
+        return best_mime or self.DEFAULT_MIME_TYPE
+
     def match_mime_type(self, src: str):
         """Match the mime type file pattern to the mime type.
 
         Args:
-            src (str): [description]
+            src (str): The file path.
 
         Returns:
-            [type]: [description]
+            str: The mime type (defaults to text/plain)
         """
-        for key in self.keys():
-            if Pattern.test(key, src):
-                return self[key]
-        return "text/plain"
+        return self.lookup_cache.get_or_create(src, lambda: self._resolve_mime_type(src))
+
+
+class FilebaseApiPageCachePolicy(SerializableDict):
+    def __init__(self, **kwargs):
+        """The rendered page output cache policy. A page output is cached by its template version and the
+        vary by values, and is served for any page (the page_id is replaced per page).
+
+        Can be declared in the page code module, as fapi_cache_policy = ..., or in the config, see
+        FilebaseApiConfig.page_cache_policies. The value can be,
+            "static" - cache until the template changes.
+            number - the cache ttl in seconds.
+            dict - {ttl, vary_by_query_args, vary_by_headers}
+        """
+        super().__init__()
+        self.update(kwargs)
+
+    @property
+    def ttl(self) -> float:
+        """The time to keep the cached output, in seconds. If None, until the template changes.
+        """
+        return self.get("ttl", None)
+
+    @ttl.setter
+    def ttl(self, val: float):
+        self["ttl"] = val
+
+    @property
+    def vary_by_query_args(self) -> List[str]:
+        """The request query args that change the page output.
+        """
+        return self.get("vary_by_query_args", [])
+
+    @vary_by_query_args.setter
+    def vary_by_query_args(self, val: List[str]):
+        self["vary_by_query_args"] = val
+
+    @property
+    def vary_by_headers(self) -> List[str]:
+        """The request headers that change the page output.
+        """
+        return self.get("vary_by_headers", [])
+
+    @vary_by_headers.setter
+    def vary_by_headers(self, val: List[str]):
+        self["vary_by_headers"] = val
+
+    def is_expired(self, cached_at: float) -> bool:
+        """True if an output cached at (time.monotonic) is expired"""
+        return self.ttl is not None and time.monotonic() - cached_at > self.ttl
+
+    def create_vary_key(self, request: Request) -> Tuple:
+        """Creates the cache key part that depends on the request.
+        """
+        if request is None:
+            return ()
+        query_args = request.args
+        return tuple(
+            [tuple(query_args.getlist(name, [])) for name in self.vary_by_query_args]
+            + [request.headers.get(name) for name in self.vary_by_headers]
+        )
+
+    @classmethod
+    def parse(cls, val: Union[str, float, dict, "FilebaseApiPageCachePolicy"]) -> "FilebaseApiPageCachePolicy":
+        """Parse a cache policy from its declared value. Returns None if no policy.
+        """
+        if val is None or val is False or isinstance(val, cls):
+            return val or None
+        if val is True or val == "static":
+            return cls()
+        if isinstance(val, (int, float)):
+            return cls(ttl=val)
+        if isinstance(val, dict):
+            return cls(**val)
+        raise ValueError(f"Invalid page cache policy: {val}")
 
 
 class FilebaseApiConfig(FilebaseTemplateServiceConfig):
@@ -161,6 +501,17 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def index_files(self, val: List[str]):
         self["index_files"] = val
 
+    @property
+    def template_freshness(self) -> FilebaseTemplateFreshness:
+        """How cached template files are checked for changes, see FilebaseTemplateFreshness.
+        Defaults to watch (the api watches the source files, see watch_files, otherwise checked as interval)
+        """
+        return FilebaseTemplateFreshness.parse(self.get("template_freshness", "watch"))
+
+    @template_freshness.setter
+    def template_freshness(self, val: FilebaseTemplateFreshness):
+        self["template_freshness"] = str(val)
+
     @property
     def mime_types(self) -> FilebaseApiConfigMimeTypes:
         """The collection of mime types to file patterns"""
@@ -174,7 +525,7 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def jinja_files(self) -> Pattern:
         """The pattern to match files that require jinja templeting.
         """
-        return self._parse_pattern(self.get("jinja_files", "*.htm?|*.css"))
+        return self._get_pattern("jinja_files", "*.htm?|*.css")
 
     @jinja_files.setter
     def jinja_files(self, val: Pattern):
@@ -184,7 +535,7 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def public_files(self) -> Pattern:
         """The pattern to match files which are public.
         """
-        return self._parse_pattern(self.get("public_files", None))
+        return self._get_pattern("public_files")
 
     @public_files.setter
     def public_files(self, val: Pattern):
@@ -194,7 +545,7 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def private_files(self) -> Pattern:
         """The pattern to match files which are private. Defaults to *.py.
         """
-        return self._parse_pattern(self.get("private_files", "*,py"))
+        return self._get_pattern("private_files", "*,py")
 
     @private_files.setter
     def private_files(self, val: Pattern):
@@ -205,7 +556,7 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def private_path_marker(self) -> Pattern:
         """The pattern to match files which are forced private by file name. Defaults to "*.private.*"
         """
-        return self._parse_pattern(self.get("private_path_marker", "*.private.*"))
+        return self._get_pattern("private_path_marker", "*.private.*")
 
     @private_path_marker.setter
     def private_path_marker(self, val: Pattern):
@@ -215,7 +566,7 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def public_path_marker(self) -> Pattern:
         """The pattern to match files which are forced public by file name. Defaults to "*.public.*"
         """
-        return self._parse_pattern(self.get("public_path_marker", "*.public.*"))
+        return self._get_pattern("public_path_marker", "*.public.*")
 
     @public_path_marker.setter
     def public_path_marker(self, val: Pattern):
@@ -231,10 +582,541 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def module_file_marker(self, val: Pattern):
         self["module_file_marker"] = val
 
+    @property
+    def preload_code_modules(self) -> bool:
+        """If true, all the code modules are imported when the service is registered (and reloaded
+        by the file watcher), see FilebaseApiModuleRegistry. Otherwise, imported on first use. Defaults to True.
+        """
+        return self.get("preload_code_modules", True)
+
+    @preload_code_modules.setter
+    def preload_code_modules(self, val: bool):
+        self["preload_code_modules"] = val
+
+    @property
+    def preload_code_modules_threads(self) -> int:
+        """The number of threads used to import the code modules on preload (1 = serial). Defaults to 1.
+        """
+        return self.get("preload_code_modules_threads", 1)
+
+    @preload_code_modules_threads.setter
+    def preload_code_modules_threads(self, val: int):
+        self["preload_code_modules_threads"] = val
+
+    @property
+    def access_cache_size(self) -> int:
+        """The max number of sub paths to keep in the access decisions cache. Defaults to 4096.
+        """
+        return self.get("access_cache_size", 4096)
+
+    @access_cache_size.setter
+    def access_cache_size(self, val: int):
+        self["access_cache_size"] = val
+
+    @property
+    def access_decisions(self) -> FilebaseLRUCache:
+        """The cache of access decisions (is_private, is_remote_access_allowed) by path.
+        Cleared on any config change.
+        """
+        return self._compiled_value("access_decisions", lambda: FilebaseLRUCache(self.access_cache_size))
+
+    def _cached_access_decision(self, name: str, path: str, decide: Callable) -> bool:
+        key = (name, path)
+        decision = self.access_decisions.get(key)
+        if decision is None:
+            decision = decide(path)
+            self.access_decisions.set(key, decision)
+        return decision
+
+    @property
+    def page_cache_policies(self) -> Dict[str, FilebaseApiPageCachePolicy]:
+        """A dictionary of file pattern to page output cache policy. The first matching pattern is used.
+        See FilebaseApiPageCachePolicy.
+        """
+        return self.get("page_cache_policies", {})
+
+    @page_cache_policies.setter
+    def page_cache_policies(self, val: Dict[str, FilebaseApiPageCachePolicy]):
+        self["page_cache_policies"] = val
+
+    @property
+    def page_cache_size(self) -> int:
+        """The max number of rendered page outputs to keep in memory. Defaults to 512.
+        """
+        return self.get("page_cache_size", 512)
+
+    @page_cache_size.setter
+    def page_cache_size(self, val: int):
+        self["page_cache_size"] = val
+
+    @property
+    def page_cache_max_bytes(self) -> int:
+        """The max total size of the rendered page outputs to keep in memory. Defaults to 64MB.
+        """
+        return self.get("page_cache_max_bytes", 64 * 1024 * 1024)
+
+    @page_cache_max_bytes.setter
+    def page_cache_max_bytes(self, val: int):
+        self["page_cache_max_bytes"] = val
+
+    @property
+    def cache_control(self) -> Dict[str, str]:
+        """A dictionary of path pattern to the Cache-Control header value to send. The first matching
+        pattern is used. e.g. {"*.js|*.css": "public, max-age=3600", "*": "no-cache"}
+        """
+        return self.get("cache_control", {})
+
+    @cache_control.setter
+    def cache_control(self, val: Dict[str, str]):
+        self["cache_control"] = val
+
+    @property
+    def compression_enabled(self) -> bool:
+        """If true, compress responses (gzip, or br if brotli is installed) by the request Accept-Encoding.
+        Precompressed sibling files (file.gz, file.br) are served when found. Defaults to True.
+        """
+        return self.get("compression_enabled", True)
+
+    @compression_enabled.setter
+    def compression_enabled(self, val: bool):
+        self["compression_enabled"] = val
+
+    @property
+    def compress_mime_types(self) -> Pattern:
+        """The pattern to match the mime types to compress on the fly.
+        """
+        return self._get_pattern(
+            "compress_mime_types", "text/*|application/javascript|application/json|image/svg+xml|image/x-icon"
+        )
+
+    @compress_mime_types.setter
+    def compress_mime_types(self, val: Pattern):
+        self["compress_mime_types"] = str(val)
+
+    @property
+    def compress_min_size(self) -> int:
+        """The min response size (bytes) to compress on the fly. Defaults to 1024.
+        """
+        return self.get("compress_min_size", 1024)
+
+    @compress_min_size.setter
+    def compress_min_size(self, val: int):
+        self["compress_min_size"] = val
+
+    @property
+    def compress_max_size(self) -> int:
+        """The max static file size (bytes) to compress on the fly. Defaults to 8MB.
+        """
+        return self.get("compress_max_size", 8 * 1024 * 1024)
+
+    @compress_max_size.setter
+    def compress_max_size(self, val: int):
+        self["compress_max_size"] = val
+
+    @property
+    def compress_level(self) -> int:
+        """The compression level. If None, uses the encoding default (gzip 6, br 5). Defaults to None.
+        """
+        return self.get("compress_level", None)
+
+    @compress_level.setter
+    def compress_level(self, val: int):
+        self["compress_level"] = val
+
+    @property
+    def compression_cache_max_bytes(self) -> int:
+        """The max total size of the compressed variants of static files and core routes kept
+        in memory. Defaults to 64MB.
+        """
+        return self.get("compression_cache_max_bytes", 64 * 1024 * 1024)
+
+    @compression_cache_max_bytes.setter
+    def compression_cache_max_bytes(self, val: int):
+        self["compression_cache_max_bytes"] = val
+
+    @property
+    def stream_min_size(self) -> int:
+        """Static files of this size (bytes) or more are streamed in chunks instead of being read
+        into memory. Defaults to 1MB.
+        """
+        return self.get("stream_min_size", 1024 * 1024)
+
+    @stream_min_size.setter
+    def stream_min_size(self, val: int):
+        self["stream_min_size"] = val
+
+    @property
+    def stream_chunk_size(self) -> int:
+        """The chunk size (bytes) when streaming static files. Defaults to 256KB.
+        """
+        return self.get("stream_chunk_size", 256 * 1024)
+
+    @stream_chunk_size.setter
+    def stream_chunk_size(self, val: int):
+        self["stream_chunk_size"] = val
+
+    @property
+    def client_bundle(self) -> bool:
+        """If true, the filebase_api() template global prints a single script, the client bundle (the client
+        javascript and the page remote method bindings, see FilebaseApiClientBundle). Defaults to True.
+        """
+        return self.get("client_bundle", True)
+
+    @client_bundle.setter
+    def client_bundle(self, val: bool):
+        self["client_bundle"] = val
+
+    @property
+    def client_bundle_minify(self) -> bool:
+        """If true, minify the client bundle (requires rjsmin). Defaults to True.
+        """
+        return self.get("client_bundle_minify", True)
+
+    @client_bundle_minify.setter
+    def client_bundle_minify(self, val: bool):
+        self["client_bundle_minify"] = val
+
+    @property
+    def client_bundle_inline(self) -> bool:
+        """If true, the filebase_api() template global prints the client bundle inline (in the page html),
+        and the websocket is opened at once, without waiting for the page to load. Can be overridden per
+        template, filebase_api(inline=True). Defaults to False.
+        """
+        return self.get("client_bundle_inline", False)
+
+    @client_bundle_inline.setter
+    def client_bundle_inline(self, val: bool):
+        self["client_bundle_inline"] = val
+
+    @property
+    def client_bundle_cache_control(self) -> str:
+        """The Cache-Control header of the client bundle (the bundle url changes with its content).
+        Defaults to public, max-age=31536000, immutable
+        """
+        return self.get("client_bundle_cache_control", "public, max-age=31536000, immutable")
+
+    @client_bundle_cache_control.setter
+    def client_bundle_cache_control(self, val: str):
+        self["client_bundle_cache_control"] = val
+
+    @property
+    def websocket_max_in_flight_commands(self) -> int:
+        """The max number of commands executing at once per websocket connection. When reached, the connection
+        is not read until a command completes. If None, unlimited. Can be overridden per page with a
+        fapi_websocket_max_in_flight_commands value in the code module. Defaults to 32.
+        """
+        return self.get("websocket_max_in_flight_commands", 32)
+
+    @websocket_max_in_flight_commands.setter
+    def websocket_max_in_flight_commands(self, val: int):
+        self["websocket_max_in_flight_commands"] = val
+
+    @property
+    def websocket_ordered_responses(self) -> bool:
+        """If true, websocket command responses are sent in the order the commands were received, otherwise
+        as soon as each command completes. Can be overridden per page with a fapi_websocket_ordered_responses
+        value in the code module. Defaults to False.
+        """
+        return self.get("websocket_ordered_responses", False)
+
+    @websocket_ordered_responses.setter
+    def websocket_ordered_responses(self, val: bool):
+        self["websocket_ordered_responses"] = val
+
+    @property
+    def websocket_codecs(self) -> List[str]:
+        """The websocket message codecs (json, msgpack) that clients can select at handshake (by the websocket
+        subprotocol fapi.[codec]), by preference. Codecs with missing packages are ignored, json is always
+        available. Defaults to ["msgpack", "json"].
+        """
+        return self.get("websocket_codecs", ["msgpack", "json"])
+
+    @websocket_codecs.setter
+    def websocket_codecs(self, val: List[str]):
+        self["websocket_codecs"] = val
+
+    @property
+    def websocket_compression(self) -> bool:
+        """Enable websocket permessage-deflate compression (requires running the sanic app with
+        protocol=FilebaseApiWebSocketProtocol, see transport.py). Defaults to True.
+        """
+        return self.get("websocket_compression", True)
+
+    @websocket_compression.setter
+    def websocket_compression(self, val: bool):
+        self["websocket_compression"] = val
+
+    @property
+    def websocket_compression_threshold(self) -> int:
+        """The min websocket message size (bytes) to compress, smaller messages are sent
+        uncompressed. Defaults to 1024.
+        """
+        return self.get("websocket_compression_threshold", 1024)
+
+    @websocket_compression_threshold.setter
+    def websocket_compression_threshold(self, val: int):
+        self["websocket_compression_threshold"] = val
+
+    @property
+    def websocket_compression_level(self) -> int:
+        """The websocket compression (zlib) level, 1-9. Defaults to the zlib default.
+        """
+        return self.get("websocket_compression_level", None)
+
+    @websocket_compression_level.setter
+    def websocket_compression_level(self, val: int):
+        self["websocket_compression_level"] = val
+
+    @property
+    def websocket_max_message_size(self) -> int:
+        """The max size (bytes) of a message received from the client, larger messages close the
+        connection. Defaults to the sanic WEBSOCKET_MAX_SIZE (1MB).
+        """
+        return self.get("websocket_max_message_size", None)
+
+    @websocket_max_message_size.setter
+    def websocket_max_message_size(self, val: int):
+        self["websocket_max_message_size"] = val
+
+    @property
+    def websocket_max_queue(self) -> int:
+        """The max number of received messages waiting to be processed. Defaults to the sanic
+        WEBSOCKET_MAX_QUEUE (32).
+        """
+        return self.get("websocket_max_queue", None)
+
+    @websocket_max_queue.setter
+    def websocket_max_queue(self, val: int):
+        self["websocket_max_queue"] = val
+
+    @property
+    def websocket_ping_interval(self) -> float:
+        """The keepalive ping interval (seconds), if 0 no pings are sent. Defaults to the sanic
+        WEBSOCKET_PING_INTERVAL (20).
+        """
+        return self.get("websocket_ping_interval", None)
+
+    @websocket_ping_interval.setter
+    def websocket_ping_interval(self, val: float):
+        self["websocket_ping_interval"] = val
+
+    @property
+    def websocket_ping_timeout(self) -> float:
+        """The max time (seconds) to wait for a keepalive pong before the connection is closed.
+        Defaults to the sanic WEBSOCKET_PING_TIMEOUT (20).
+        """
+        return self.get("websocket_ping_timeout", None)
+
+    @websocket_ping_timeout.setter
+    def websocket_ping_timeout(self, val: float):
+        self["websocket_ping_timeout"] = val
+
+    @property
+    def websocket_idle_timeout(self) -> float:
+        """Close websocket connections that did not send a message for this long (seconds),
+        if None never. Defaults to None.
+        """
+        return self.get("websocket_idle_timeout", None)
+
+    @websocket_idle_timeout.setter
+    def websocket_idle_timeout(self, val: float):
+        self["websocket_idle_timeout"] = val
+
+    @property
+    def websocket_outbound_queue_size(self) -> int:
+        """The max number of messages (responses, events ..) queued per websocket connection. Defaults to 1024.
+        """
+        return self.get("websocket_outbound_queue_size", 1024)
+
+    @websocket_outbound_queue_size.setter
+    def websocket_outbound_queue_size(self, val: int):
+        self["websocket_outbound_queue_size"] = val
+
+    @property
+    def websocket_outbound_overflow_policy(self) -> FilebaseApiOverflowPolicy:
+        """What to do when a client falls behind and its outbound queue is full (block, drop_oldest,
+        drop_newest, coalesce by event name, disconnect). Applies to bound events, command responses are never
+        dropped. Defaults to block.
+        """
+        return FilebaseApiOverflowPolicy.parse(self.get("websocket_outbound_overflow_policy", "block"))
+
+    @websocket_outbound_overflow_policy.setter
+    def websocket_outbound_overflow_policy(self, val: FilebaseApiOverflowPolicy):
+        self["websocket_outbound_overflow_policy"] = str(val)
+
+    @property
+    def websocket_outbound_block_timeout(self) -> float:
+        """The max time (seconds) to wait for a client with a full outbound queue to catch up, before
+        it is disconnected. Defaults to 30.
+        """
+        return self.get("websocket_outbound_block_timeout", 30)
+
+    @websocket_outbound_block_timeout.setter
+    def websocket_outbound_block_timeout(self, val: float):
+        self["websocket_outbound_block_timeout"] = val
+
+    @property
+    def pubsub_queue_size(self) -> int:
+        """The max number of published messages queued per websocket connection. Defaults to 256.
+        """
+        return self.get("pubsub_queue_size", 256)
+
+    @pubsub_queue_size.setter
+    def pubsub_queue_size(self, val: int):
+        self["pubsub_queue_size"] = val
+
+    @property
+    def pubsub_overflow_policy(self) -> FilebaseApiOverflowPolicy:
+        """What to do when a client falls behind on published messages and its queue is full
+        (drop_oldest, drop_newest, coalesce by topic, disconnect). Defaults to drop_oldest.
+        """
+        return FilebaseApiOverflowPolicy.parse(self.get("pubsub_overflow_policy", "drop_oldest"))
+
+    @pubsub_overflow_policy.setter
+    def pubsub_overflow_policy(self, val: FilebaseApiOverflowPolicy):
+        self["pubsub_overflow_policy"] = str(val)
+
+    @property
+    def pubsub_client_topics(self) -> Pattern:
+        """The pattern to match the topics the client (browser) is allowed to subscribe to. Defaults to *.
+        """
+        return self._get_pattern("pubsub_client_topics", "*")
+
+    @pubsub_client_topics.setter
+    def pubsub_client_topics(self, val: Pattern):
+        self["pubsub_client_topics"] = str(val)
+
+    @property
+    def remote_method_execution_mode(self) -> FilebaseApiRemoteMethodExecutionMode:
+        """The default execution mode of synchronous remote methods (thread, process or inline), can be
+        set per method with fapi_remote_config. Defaults to thread.
+        """
+        return FilebaseApiRemoteMethodExecutionMode.parse(self.get("remote_method_execution_mode", "thread"))
+
+    @remote_method_execution_mode.setter
+    def remote_method_execution_mode(self, val: FilebaseApiRemoteMethodExecutionMode):
+        self["remote_method_execution_mode"] = str(val)
+
+    @property
+    def io_threads(self) -> int:
+        """The number of threads used for static file work (etag hashing, reading and compressing files),
+        separate from the render threads so a render overload does not reject static files. Defaults to 4.
+        """
+        return self.get("io_threads", 4)
+
+    @io_threads.setter
+    def io_threads(self, val: int):
+        self["io_threads"] = val
+
+    @property
+    def io_max_queue(self) -> int:
+        """The max number of static file calls waiting for an io thread, over which requests are rejected.
+        If None, unlimited. Defaults to None.
+        """
+        return self.get("io_max_queue", None)
+
+    @io_max_queue.setter
+    def io_max_queue(self, val: int):
+        self["io_max_queue"] = val
+
+    @property
+    def overload_retry_after(self) -> int:
+        """The Retry-After header (seconds) of the 503 response sent when a request is rejected because an
+        executor queue is full (see render_max_queue, io_max_queue). Defaults to 1.
+        """
+        return self.get("overload_retry_after", 1)
+
+    @overload_retry_after.setter
+    def overload_retry_after(self, val: int):
+        self["overload_retry_after"] = val
+
+    @property
+    def remote_threads(self) -> int:
+        """The number of threads executing synchronous remote methods. Defaults to 8.
+        """
+        return self.get("remote_threads", 8)
+
+    @remote_threads.setter
+    def remote_threads(self, val: int):
+        self["remote_threads"] = val
+
+    @property
+    def remote_threads_max_queue(self) -> int:
+        """The max number of remote method calls waiting for a free thread. Calls over the limit are rejected.
+        If None, unlimited. Defaults to None.
+        """
+        return self.get("remote_threads_max_queue", None)
+
+    @remote_threads_max_queue.setter
+    def remote_threads_max_queue(self, val: int):
+        self["remote_threads_max_queue"] = val
+
+    @property
+    def remote_processes(self) -> int:
+        """The number of processes executing remote methods in process execution mode. If None, the number of cpus.
+        Defaults to None.
+        """
+        return self.get("remote_processes", None)
+
+    @remote_processes.setter
+    def remote_processes(self, val: int):
+        self["remote_processes"] = val
+
+    @property
+    def remote_processes_max_queue(self) -> int:
+        """The max number of remote method calls waiting for a free process. Calls over the limit are rejected.
+        If None, unlimited. Defaults to None.
+        """
+        return self.get("remote_processes_max_queue", None)
+
+    @remote_processes_max_queue.setter
+    def remote_processes_max_queue(self, val: int):
+        self["remote_processes_max_queue"] = val
+
+    def is_compressible(self, mime_type: str, size: int) -> bool:
+        """True if a response of this mime type and size should be compressed on the fly.
+        """
+        return (
+            self.compression_enabled
+            and self.compress_min_size <= size <= self.compress_max_size
+            and self.compress_mime_types.test(mime_type)
+        )
+
+    def _match_pattern_table(self, key: str, path: str, parse: Callable = None):
+        """Internal, matches a path against a config dictionary of pattern -> value. The
+        dictionary is compiled once. Returns the first matching (parsed) value or None.
+
+        Args:
+            key (str): The config key of the dictionary.
+            path (str): The path to match.
+            parse (Callable, optional): Parse the value when compiled. Defaults to None.
+        """
+
+        def compile_table():
+            return [
+                (Pattern(pattern), parse(val) if parse is not None else val)
+                for pattern, val in (self.get(key, None) or {}).items()
+            ]
+
+        for pattern, val in self._compiled_value(("pattern_table", key), compile_table):
+            if pattern.test(path):
+                return val
+        return None
+
+    def match_page_cache_policy(self, path: str) -> FilebaseApiPageCachePolicy:
+        """Returns the page cache policy for a path from the config, see page_cache_policies. None if no policy.
+        """
+        return self._match_pattern_table("page_cache_policies", path, FilebaseApiPageCachePolicy.parse)
+
+    def match_cache_control(self, path: str) -> str:
+        """Returns the Cache-Control header value for a path, see cache_control. None if no match.
+        """
+        return self._match_pattern_table("cache_control", path)
+
     def is_private(self, path: str) -> bool:
         """Helper, check if a path is private.
         """
-        return self.private_files.test(path)
+        return self._cached_access_decision("private", path, self.private_files.test)
 
     def is_public(self, path: str) -> bool:
         """Helper, check if a path is public.
@@ -244,7 +1126,11 @@ class FilebaseApiConfig(FilebaseTemplateServiceConfig):
     def is_remote_access_allowed(self, path: str):
         """Helper, check if remote access is allowed for this file.
         """
-        return self.public_path_marker.test(path) or self.is_public(path) and not self.is_private(path)
+        return self._cached_access_decision(
+            "remote_access",
+            path,
+            lambda path: self.public_path_marker.test(path) or self.is_public(path) and not self.is_private(path),
+        )
 
 
 class FilebaseApiRemoteMethodConfig(SerializableDict):
@@ -252,10 +1138,39 @@ class FilebaseApiRemoteMethodConfig(SerializableDict):
     def expose_js_method(self) -> bool:
         return self.get("expose_js_method", True)
 
+    @expose_js_method.setter
+    def expose_js_method(self, val: bool):
+        self["expose_js_method"] = val
+
+    @property
+    def execution_mode(self) -> FilebaseApiRemoteMethodExecutionMode:
+        """Where the method is executed if synchronous (thread, process or inline). If None, the
+        api config remote_method_execution_mode. Defaults to None.
+        """
+        val = self.get("execution_mode", None)
+        return FilebaseApiRemoteMethodExecutionMode.parse(val) if val is not None else None
+
+    @execution_mode.setter
+    def execution_mode(self, val: FilebaseApiRemoteMethodExecutionMode):
+        self["execution_mode"] = str(val) if val is not None else None
+
+    @property
+    def coerce_args(self) -> bool:
+        """If true, the call arguments are validated and coerced by the method type hints
+        (see FilebaseApiCallPlan). Otherwise the arguments are passed as received. Defaults to False.
+        """
+        return self.get("coerce_args", False)
+
+    @coerce_args.setter
+    def coerce_args(self, val: bool):
+        self["coerce_args"] = val
+
 
 class FilebaseApiCoreRoutes(SerializableDict):
     def __init__(self):
         super().__init__()
+        self.etags: Dict[str, str] = dict()
+        self.loaded_at = time.time()
         self.load_core_object("filebase_api_client.js")
 
     def load_core_object(self, src):
@@ -270,26 +1185,264 @@ class FilebaseApiCoreRoutes(SerializableDict):
                 FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER=FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER,
                 FILEBASE_API_PAGE_TYPE_MARKER=FILEBASE_API_PAGE_TYPE_MARKER,
             )
+        self.etags[src] = compute_etag(self[src])
+
+    @property
+    def client_source(self) -> str:
+        """The client javascript (filebase_api_client.js)"""
+        return self["filebase_api_client.js"]
+
+
+class FilebaseApiClientBundle(object):
+    def __init__(self, client_source: str, bindings: str = None, minify: bool = False):
+        """The client javascript bundle of a page, the client (filebase_api_client.js) and the page
+        remote method bindings (see FilebaseApiModuleInfo.client_bindings). Generated once per code module version,
+        and served at a content hash url.
+
+        Args:
+            client_source (str): The client javascript.
+            bindings (str, optional): The remote method bindings javascript. Defaults to None.
+            minify (bool, optional): If true, minify the bundle (see minify_javascript). Defaults to False.
+        """
+        super().__init__()
+        source = "\n".join(
+            [
+                client_source,
+                bindings or "// no available bindings",
+                # the bindings are loaded, see register_websocket.
+                "filebase_api.scripts_loaded = true",
+            ]
+        )
+        self.source = minify_javascript(source) if minify else source
+        self.etag = compute_etag(self.source)
+        self.hash = self.etag.strip('"')[:16]
+
+    @property
+    def filename(self) -> str:
+        """The bundle (content hash) file name"""
+        return f"{FILEBASE_API_CLIENT_BUNDLE_MARKER}.{self.hash}.js"
+
+    def get_inline_script(self, connect: bool = True) -> str:
+        """Returns the bundle as an inline html script.
+
+        Args:
+            connect (bool, optional): If true, opens the websocket at once (see register_websocket).
+                Defaults to True.
+        """
+        source = SCRIPT_END_TAG_PATTERN.sub(r"<\\/\1", self.source)
+        if connect:
+            source += "\nfilebase_api.register_websocket()"
+        return f'<script language="javascript">\n{source}\n</script>'
+
+    def get_url(self, sub_path: str) -> str:
+        """Returns the bundle url of a page
+
+        Args:
+            sub_path (str): The page sub path.
+        """
+        return f"/{FILEBASE_API_CORE_ROUTES_MARKER}/{self.filename}?{FILEBASE_API_PAGE_TYPE_MARKER}={sub_path}"
 
 
 class FilebaseApiWebSocket(AsyncEventHandler):
-    def __init__(self, websocket: WebSocketConnection, on_event=None):
+    def __init__(
+        self,
+        websocket: WebSocketConnection,
+        on_event=None,
+        codec: FilebaseApiCodec = None,
+        publish_queue_size: int = 256,
+        publish_overflow_policy: FilebaseApiOverflowPolicy = FilebaseApiOverflowPolicy.drop_oldest,
+        outbound_queue_size: int = 1024,
+        outbound_overflow_policy: FilebaseApiOverflowPolicy = FilebaseApiOverflowPolicy.block,
+        outbound_block_timeout: float = 30,
+    ):
+        """A websocket connection to a page. Messages are sent by a writer task from a bounded
+        outbound queue (see FilebaseApiOutboundQueue), so a slow client never blocks the sender
+        until its queue is full.
+
+        Args:
+            websocket (WebSocketConnection): The sanic websocket.
+            on_event (Callable, optional): Called on any event. Defaults to None.
+            codec (FilebaseApiCodec, optional): The messages codec, selected at handshake. Defaults to json.
+            publish_queue_size (int, optional): The max number of queued published messages. Defaults to 256.
+            publish_overflow_policy (FilebaseApiOverflowPolicy, optional): The published messages queue
+                overflow policy. Defaults to drop_oldest.
+            outbound_queue_size (int, optional): The max number of queued messages (responses, events ..).
+                Defaults to 1024.
+            outbound_overflow_policy (FilebaseApiOverflowPolicy, optional): The outbound queue overflow policy,
+                applies to events (coalesced by event name). Responses are never dropped. Defaults to block.
+            outbound_block_timeout (float, optional): The max time (seconds) to wait for a client with a full
+                queue to catch up before it is disconnected. Defaults to 30.
+        """
         super().__init__(on_event=on_event)
         self.websocket = websocket
+        self.codec = codec or FilebaseApiJsonCodec()
         self.register_handler_events = True
+        self.publish_queue_size = publish_queue_size
+        self.publish_overflow_policy = publish_overflow_policy
+        self.outbound_queue_size = outbound_queue_size
+        self.outbound_overflow_policy = outbound_overflow_policy
+        self.outbound_block_timeout = outbound_block_timeout
+        self.disconnected_as_lagging = False
+        self._streams: Dict[Any, FilebaseApiStream] = dict()
+        self._send_lock = asyncio.Lock()
+        self._topics: Set[str] = set()
+        self._publish_queue: FilebaseApiOutboundQueue = None
+        self._outbound_queue: FilebaseApiOutboundQueue = None
+
+    @property
+    def streams(self) -> Dict[Any, FilebaseApiStream]:
+        """The active result streams, by command id"""
+        return self._streams
+
+    @property
+    def topics(self) -> Set[str]:
+        """The subscribed pub/sub topics, see FilebaseApiPubSub"""
+        return self._topics
+
+    @property
+    def publish_queue(self) -> FilebaseApiOutboundQueue:
+        """The queue of published messages waiting to be sent (created on first use)"""
+        if self._publish_queue is None:
+            self._publish_queue = FilebaseApiOutboundQueue(
+                self._send_frames,
+                max_size=self.publish_queue_size,
+                policy=self.publish_overflow_policy,
+                on_overflow=self._on_queue_overflow,
+            )
+        return self._publish_queue
 
-    async def send(self, messge, as_json=False):
+    @property
+    def outbound_queue(self) -> FilebaseApiOutboundQueue:
+        """The queue of messages waiting to be sent (created on first use)"""
+        if self._outbound_queue is None:
+            self._outbound_queue = FilebaseApiOutboundQueue(
+                self._send_frames,
+                max_size=self.outbound_queue_size,
+                policy=self.outbound_overflow_policy,
+                on_overflow=self._on_queue_overflow,
+                block_timeout=self.outbound_block_timeout,
+            )
+        return self._outbound_queue
+
+    @property
+    def outbound_stats(self) -> dict:
+        """The outbound and publish queues counters"""
+        return {
+            "outbound": self.outbound_queue.stats,
+            "publish": self.publish_queue.stats,
+            "disconnected_as_lagging": self.disconnected_as_lagging,
+        }
+
+    def _on_queue_overflow(self, queue: FilebaseApiOutboundQueue):
+        if self.disconnected_as_lagging:
+            return
+        self.disconnected_as_lagging = True
+        logger.warning(f"Websocket client is too far behind ({queue.depth} queued messages), disconnecting")
+        asyncio.ensure_future(self.websocket.close(code=1008, reason="Client too far behind"))
+
+    async def _send_frames(self, frames: list):
         if self.websocket.closed is True:
             return
+        # attachments must follow their message, without other frames in between.
+        async with self._send_lock:
+            try:
+                for frame in frames:
+                    await self.websocket.send(frame)
+            except ConnectionClosed:
+                pass
+
+    async def send(self, messge, as_json=False, coalesce_key=None, droppable: bool = False) -> bool:
+        """Queues a message to be sent (see outbound_queue). Waits if the queue is full, and the message is
+        not droppable or the overflow policy is block. Returns false if the message was dropped.
+
+        Args:
+            messge (any): The message.
+            as_json (bool, optional): If true, encode the message with the connection codec
+                (json by default). Buffer values (bytes, arrays ..) are sent as binary attachments
+                (see FilebaseApiCodec.encode_frames). Defaults to False.
+            coalesce_key (any, optional): With the coalesce overflow policy, a queued message with the same
+                key is replaced. Defaults to None.
+            droppable (bool, optional): If true, the message may be dropped by the overflow policy.
+                Defaults to False.
+        """
+        if self.websocket.closed is True:
+            return False
         if as_json:
-            messge = json_dump_with_types(messge)
-        try:
-            await self.websocket.send(str(messge))
-        except Exception:
-            pass
+            frames = self.codec.encode_frames(messge)
+        else:
+            frames = [messge if isinstance(messge, (str, bytes)) else str(messge)]
+        return await self.outbound_queue.send(frames, coalesce_key, droppable)
+
+    async def close_outbound(self):
+        """Stops sending queued messages (on disconnect)"""
+        for queue in [self._outbound_queue, self._publish_queue]:
+            if queue is not None:
+                await queue.close()
 
     async def send_event(self, name: str, *args, **kwargs):
-        await self.send({"__event_name": name, "args": args, "dis": kwargs}, True)
+        """Sends an event to the client. Events are droppable, and coalesced by name with the
+        coalesce overflow policy.
+
+        Args:
+            name (str): The event name.
+        """
+        await self.send(
+            {"__event_name": name, "args": args, "kwargs": kwargs},
+            True,
+            coalesce_key=("__event_name", name),
+            droppable=True,
+        )
+
+    def start_stream(self, stream: FilebaseApiStream):
+        """Starts a result stream, see FilebaseApiStream.
+
+        Args:
+            stream (FilebaseApiStream): The stream.
+        """
+        self._streams[stream.command_id] = stream
+
+        def on_stream_done(task):
+            if self._streams.get(stream.command_id) is stream:
+                del self._streams[stream.command_id]
+
+        stream.start().add_done_callback(on_stream_done)
+
+    def process_stream_control_message(self, message: dict) -> bool:
+        """Processes a stream control message sent by the client, either
+        {"__command_id": id, "__stream_credit": n} or {"__command_id": id, "__stream_cancel": true}.
+        Returns false if the message is not a stream control message. Raises a ValueError if the message
+        is invalid.
+
+        Args:
+            message (dict): The client message.
+        """
+        if "__stream_credit" not in message and "__stream_cancel" not in message:
+            return False
+        command_id = message.get("__command_id")
+        if not isinstance(command_id, (str, int)):
+            raise ValueError(f"Invalid stream command id: {repr(command_id)[:50]}")
+        credit = message.get("__stream_credit")
+        if not message.get("__stream_cancel") and (
+            not isinstance(credit, int) or isinstance(credit, bool) or credit <= 0
+        ):
+            raise ValueError(f"Invalid stream credit (a positive integer): {repr(credit)[:50]}")
+
+        stream = self._streams.get(command_id)
+        if stream is None:
+            return True
+        if message.get("__stream_cancel"):
+            stream.cancel()
+        else:
+            stream.grant(credit)
+        return True
+
+    async def cancel_streams(self):
+        """Cancels all the active result streams, and waits for them to stop."""
+        streams = list(self._streams.values())
+        for stream in streams:
+            stream.cancel()
+        if len(streams) > 0:
+            await asyncio.gather(*[stream.task for stream in streams], return_exceptions=True)
 
 
 class FilebaseApiModuleInfo:
@@ -300,11 +1453,42 @@ class FilebaseApiModuleInfo:
         self._module = module
         self._websocket_command_functions: dict = None
         self._websocket_javascript_command_functions: dict = None
+        self._call_plans: Dict[str, FilebaseApiCallPlan] = None
+        self._client_bindings: str = None
+        self._cache_policy: FilebaseApiPageCachePolicy = None
 
     @property
     def module(self) -> ModuleType:
         return self._module
 
+    @property
+    def module_path(self) -> str:
+        """The code module file path"""
+        return getattr(self.module, "__file__", None)
+
+    @property
+    def cache_policy(self) -> FilebaseApiPageCachePolicy:
+        """The page output cache policy declared in the module (fapi_cache_policy), if any.
+        """
+        if self._cache_policy is None:
+            self._cache_policy = (
+                FilebaseApiPageCachePolicy.parse(getattr(self.module, FILEBASE_API_PAGE_CACHE_POLICY_ATTRIB_NAME, None))
+                or False
+            )
+        return self._cache_policy or None
+
+    def get_module_setting(self, name: str, default=None):
+        """Returns a page setting declared in the code module (as fapi_[name]), or the default if
+        not declared.
+
+        Args:
+            name (str): The setting name (e.g. websocket_max_in_flight_commands)
+            default (any, optional): The default value. Defaults to None.
+        """
+        if self.module is None:
+            return default
+        return getattr(self.module, FILEBASE_API_MODULE_SETTING_ATTRIB_PREFIX + name, default)
+
     @property
     def websocket_command_functions(self) -> Dict[str, Callable]:
         """A collection of command functions to be exposed.
@@ -319,6 +1503,32 @@ class FilebaseApiModuleInfo:
 
         return self._websocket_command_functions
 
+    @property
+    def call_plans(self) -> Dict[str, FilebaseApiCallPlan]:
+        """The compiled call plans (argument binding and coercion) of the command functions, by name"""
+        if self._call_plans is None:
+            call_plans = dict()
+            for name, command in self.websocket_command_functions.items():
+                config = self.get_module_command_handler_config(name) or FilebaseApiRemoteMethodConfig()
+                call_plans[name] = FilebaseApiCallPlan(name, command, coerce=config.coerce_args)
+            self._call_plans = call_plans
+        return self._call_plans
+
+    @property
+    def command_signatures(self) -> Dict[str, inspect.Signature]:
+        """The signatures of the command functions, by name"""
+        return {name: plan.signature for name, plan in self.call_plans.items()}
+
+    def precompute(self) -> "FilebaseApiModuleInfo":
+        """Computes the module metadata (command tables, call plans, client bindings and cache policy),
+        so it is not computed on first use.
+        """
+        self.websocket_command_functions
+        self.call_plans
+        self.client_bindings
+        self.cache_policy
+        return self
+
     @property
     def websocket_javascript_command_functions(self) -> Dict[str, str]:
         """A collection of javascript functions to be printed on the client page javascript"""
@@ -331,19 +1541,29 @@ class FilebaseApiModuleInfo:
                 config = self.get_module_command_handler_config(name) or FilebaseApiRemoteMethodConfig()
                 if not config.expose_js_method:
                     continue
-                signature = inspect.signature(self.websocket_command_functions[name])
+                plan = self.call_plans[name]
                 args = []
                 input_args = []
-                for arg_name in list(signature.parameters.keys())[1:]:
-                    if signature.parameters[arg_name].default != inspect._empty:
-                        input_args.append(arg_name + "=null")
-                    else:
-                        input_args.append(arg_name)
-                    args.append(arg_name)
-                js_code = f"""
+                for parameter in plan.client_parameters:
+                    input_args.append(parameter.name + "=null" if parameter.has_default else parameter.name)
+                    args.append(parameter.name)
+                # sent by name if the method has keyword only parameters.
+                command_args = f"{{{','.join(args)}}}" if plan.client_by_name else f"[{','.join(args)}]"
+                command = self.websocket_command_functions[name]
+                if inspect.isasyncgenfunction(command) or inspect.isgeneratorfunction(command):
+                    # streamed, returns an async iterator.
+                    js_code = f"""
+function fapi_{name}({','.join(input_args)}) {{
+    return filebase_api.stream_command({{
+        {name}:{command_args}
+    }})
+}}
+"""
+                else:
+                    js_code = f"""
 async function fapi_{name}({','.join(input_args)}) {{
     return (await filebase_api.exec({{
-        {name}:[{','.join(args)}]
+        {name}:{command_args}
     }})).{name}
 }}
 """
@@ -351,6 +1571,13 @@ async function fapi_{name}({','.join(input_args)}) {{
 
         return self._websocket_javascript_command_functions
 
+    @property
+    def client_bindings(self) -> str:
+        """The javascript source of the exposed command functions"""
+        if self._client_bindings is None:
+            self._client_bindings = "\n".join(self.websocket_javascript_command_functions.values())
+        return self._client_bindings
+
     def get_module_command_handler(self, name: str) -> Callable:
         """Returns a command handler for the module by the name.
 
@@ -491,6 +1718,36 @@ class FilebaseApiPage(AsyncEventHandler, dict):
         """
         return self.module_info.websocket_javascript_command_functions
 
+    def get_setting(self, name: str):
+        """Returns a page setting. A value declared in the code module (as fapi_[name]) overrides
+        the api config value.
+
+        Args:
+            name (str): The setting name, a FilebaseApiConfig property (e.g. websocket_ordered_responses)
+        """
+        default = getattr(self.api.config, name)
+        if not self.has_code_module:
+            return default
+        return self.module_info.get_module_setting(name, default)
+
+    def subscribe(self, topic: str):
+        """Subscribes the page websocket to a pub/sub topic, see FilebaseApi.publish
+
+        Args:
+            topic (str): The topic.
+        """
+        assert self.is_websocket_state, Exception("Cannot subscribe in non websocket state. See is_websocket_state")
+        self.api.pubsub.subscribe(self.websocket, topic)
+
+    def unsubscribe(self, topic: str = None):
+        """Unsubscribes the page websocket from a pub/sub topic.
+
+        Args:
+            topic (str, optional): The topic. If None, from all topics. Defaults to None.
+        """
+        if self.is_websocket_state:
+            self.api.pubsub.unsubscribe(self.websocket, topic)
+
     def register_event_if_exists(self, name: str, event_handler: AsyncEventHandler):
         """Registers a new event for the command handlers in the modules, if the handler exists.
 
@@ -0,0 +1,65 @@
+import pickle
+import pytest
+from filebase_api import helpers
+
+
+def test_config_patterns_are_compiled_once():
+    config = helpers.FilebaseApiConfig()
+    assert config.jinja_files is config.jinja_files
+    assert config.jinja_files.test("index.html")
+
+
+def test_config_patterns_recompile_on_change():
+    config = helpers.FilebaseApiConfig()
+    assert config.is_remote_access_allowed("secret.txt")
+
+    config.private_files = "secret.*"
+    assert not config.is_remote_access_allowed("secret.txt")
+
+    config.update({"private_files": "other.*"})
+    assert config.is_remote_access_allowed("secret.txt")
+
+
+def test_config_pickle_round_trip():
+    config = helpers.FilebaseApiConfig(private_files="secret.*")
+    assert not config.is_remote_access_allowed("secret.txt")
+    assert config.mime_types.match_mime_type("a.css") == "text/css"
+
+    restored = pickle.loads(pickle.dumps(config))
+    assert restored == config
+    assert not restored.is_remote_access_allowed("secret.txt")
+    assert restored.mime_types.match_mime_type("a.css") == "text/css"
+
+    restored.private_files = "other.*"
+    assert restored.is_remote_access_allowed("secret.txt")
+
+
+def test_access_decisions_cache_is_bounded():
+    config = helpers.FilebaseApiConfig(access_cache_size=2)
+    for name in ["a.html", "b.html", "c.html"]:
+        config.is_private(name)
+    assert len(config.access_decisions) == 2
+
+
+def test_mime_types_match_extensions():
+    mime_types = helpers.FilebaseApiConfigMimeTypes()
+    assert mime_types.match_mime_type("/a/b/index.html") == "text/html"
+    assert mime_types.match_mime_type("photo.jpeg") == "image/jpeg"
+    assert mime_types.match_mime_type("scan.tiff") == "image/tiff"
+    assert mime_types.match_mime_type("backup.tar.gz") == "application/zip"
+    assert mime_types.match_mime_type("readme") == "text/plain"
+
+
+def test_mime_types_keep_pattern_order():
+    mime_types = helpers.FilebaseApiConfigMimeTypes()
+    mime_types["re::.*\\.special\\.html"] = "text/special"
+    assert mime_types.match_mime_type("a.special.html") == "text/html"
+
+    mime_types = helpers.FilebaseApiConfigMimeTypes(**{"*/static/*": "text/static"})
+    del mime_types["*.html"]
+    mime_types["*.html"] = "text/html"
+    assert mime_types.match_mime_type("a/static/index.html") == "text/static"
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,118 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from zcommon.shell import logger
+
+from filebase_api.executors import FilebaseExecutor
+from filebase_api.helpers import FilebaseApiModuleInfo
+
+
+class FilebaseApiModuleRegistry(object):
+    def __init__(self):
+        """The loaded code modules (.code.py) and their precomputed metadata (see FilebaseApiModuleInfo.precompute),
+        by absolute path.
+
+        Modules are loaded once (see load), and reloaded only on request (see reload, called on file watcher
+        events). A reload swaps in a new module version, calls already in flight keep using the old version.
+        Modules that failed to load are not kept, and are loaded again on the next request.
+        """
+        super().__init__()
+        self._modules: Dict[str, FilebaseApiModuleInfo] = dict()
+        self._lock = threading.Lock()
+
+        self.version = 0
+        self.loaded = 0
+        self.errors = 0
+
+    @property
+    def modules(self) -> Dict[str, FilebaseApiModuleInfo]:
+        """The loaded modules by path"""
+        return self._modules
+
+    @property
+    def stats(self) -> dict:
+        """The registry counters"""
+        return {"modules": len(self._modules), "version": self.version, "loaded": self.loaded, "errors": self.errors}
+
+    def _load_module(self, module_path: str) -> FilebaseApiModuleInfo:
+        try:
+            module_info = FilebaseApiModuleInfo.load_from_path(module_path)
+            if module_info is not None:
+                module_info.precompute()
+            self.loaded += 1
+            return module_info
+        except Exception as ex:
+            self.errors += 1
+            logger.error(f"Could not load code module {module_path}: {ex}")
+            return None
+
+    def _load_modules(self, module_paths: List[str], threads: int = 1) -> Dict[str, FilebaseApiModuleInfo]:
+        if threads is None or threads <= 1 or len(module_paths) <= 1:
+            return {module_path: self._load_module(module_path) for module_path in module_paths}
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=self.__class__.__name__) as executor:
+            return dict(zip(module_paths, executor.map(self._load_module, module_paths)))
+
+    def _swap(self, modules: Dict[str, FilebaseApiModuleInfo]):
+        # failed modules are retried on the next get.
+        self._modules = {module_path: info for module_path, info in modules.items() if info is not None}
+        self.version += 1
+
+    def load(self, module_paths: List[str], threads: int = 1) -> int:
+        """Loads the modules and replaces the registry. Returns the number of modules loaded.
+
+        Args:
+            module_paths (List[str]): The absolute module paths.
+            threads (int, optional): The number of import threads. Defaults to 1.
+        """
+        with self._lock:
+            self._swap(self._load_modules(list(module_paths), threads))
+            return len(self._modules)
+
+    def reload(self, module_paths: List[str]) -> int:
+        """Reloads the (changed) modules, deleted modules are removed. Returns the number of modules reloaded.
+
+        Args:
+            module_paths (List[str]): The absolute module paths.
+        """
+        with self._lock:
+            existing = [module_path for module_path in module_paths if os.path.isfile(module_path)]
+            modules = dict(self._modules)
+            for module_path in module_paths:
+                modules.pop(module_path, None)
+            modules.update(self._load_modules(existing))
+            self._swap(modules)
+        return len(existing)
+
+    def get(self, module_path: str) -> FilebaseApiModuleInfo:
+        """Returns the module info, the module is loaded if not in the registry (thread blocking). A module
+        loaded for the first time does not change the registry version. Returns None if the module failed to load.
+
+        Args:
+            module_path (str): The absolute module path.
+        """
+        module_info = self._modules.get(module_path)
+        if module_info is not None:
+            return module_info
+        with self._lock:
+            module_info = self._modules.get(module_path)
+            if module_info is None:
+                module_info = self._load_module(module_path)
+                if module_info is not None:
+                    modules = dict(self._modules)
+                    modules[module_path] = module_info
+                    self._modules = modules
+            return module_info
+
+    async def get_async(self, module_path: str, executor: FilebaseExecutor) -> FilebaseApiModuleInfo:
+        """Returns the module info, a module not in the registry is loaded in the executor (see get).
+
+        Args:
+            module_path (str): The absolute module path.
+            executor (FilebaseExecutor): The executor to load the module in.
+        """
+        module_info = self._modules.get(module_path)
+        if module_info is not None:
+            return module_info
+        return await executor.run(self.get, module_path)
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+from filebase_api.executors import FilebaseExecutor
+from filebase_api.modules import FilebaseApiModuleRegistry
+
+CODE_MODULE = """
+from filebase_api import fapi_remote
+
+
+@fapi_remote
+def value(page, a, b=1):
+    return {value}
+"""
+
+
+def write_module(path, value):
+    with open(path, "w") as raw:
+        raw.write(CODE_MODULE.replace("{value}", str(value)))
+    # a new module version is loaded when the modified time changes.
+    mtime = time.time() + value
+    os.utime(path, (mtime, mtime))
+
+
+def test_load_precomputes_metadata(tmp_path):
+    paths = [str(tmp_path / f"page{i}.code.py") for i in range(3)]
+    for path in paths:
+        write_module(path, 1)
+
+    registry = FilebaseApiModuleRegistry()
+    assert registry.load(paths, threads=2) == 3
+    info = registry.get(paths[0])
+    assert list(info.command_signatures["value"].parameters.keys()) == ["page", "a", "b"]
+    assert "fapi_value" in info.websocket_javascript_command_functions["value"]
+
+
+def test_reload_swaps_module_version(tmp_path):
+    path = str(tmp_path / "page.code.py")
+    write_module(path, 1)
+
+    registry = FilebaseApiModuleRegistry()
+    old_info = registry.get(path)
+    old_command = old_info.websocket_command_functions["value"]
+    assert registry.get(path) is old_info
+
+    write_module(path, 2)
+    # not reloaded until requested.
+    assert registry.get(path) is old_info
+    registry.reload([path])
+    assert registry.get(path).websocket_command_functions["value"](None, 0) == 2
+    # in flight calls keep the old version.
+    assert old_command(None, 0) == 1
+
+    os.remove(path)
+    registry.reload([path])
+    assert path not in registry.modules
+
+
+def test_get_loads_without_version_change(tmp_path):
+    path = str(tmp_path / "page.code.py")
+    write_module(path, 1)
+
+    registry = FilebaseApiModuleRegistry()
+    registry.load([])
+    version = registry.version
+    assert registry.get(path) is not None
+    # a first load is not a new version of the loaded modules (see reload).
+    assert registry.version == version
+
+
+def test_failed_module_is_retried(tmp_path):
+    path = str(tmp_path / "page.code.py")
+    with open(path, "w") as raw:
+        raw.write("raise Exception('broken')")
+
+    registry = FilebaseApiModuleRegistry()
+    assert registry.get(path) is None
+    assert path not in registry.modules
+    assert registry.errors == 1
+
+    write_module(path, 3)
+    assert registry.get(path).websocket_command_functions["value"](None, 0) == 3
+
+
+def test_get_async_loads_in_executor(tmp_path):
+    path = str(tmp_path / "page.code.py")
+    write_module(path, 4)
+
+    registry = FilebaseApiModuleRegistry()
+    executor = FilebaseExecutor(name="test")
+    loop = asyncio.new_event_loop()
+    try:
+        info = loop.run_until_complete(registry.get_async(path, executor))
+        assert info is registry.get(path)
+        assert executor.stats["completed"] == 1
+    finally:
+        loop.close()
+        executor.shutdown()
@@ -0,0 +1,223 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List
+
+from zcommon.shell import logger
+from zcommon.collections import StringEnum
+
+
+class FilebaseApiOverflowPolicy(StringEnum):
+    """What to do when a message is sent to a full outbound queue.
+
+    block - wait for the client to catch up (see FilebaseApiOutboundQueue.send), a client that does not catch up
+        within the block timeout is disconnected.
+    drop_oldest - drop the oldest (droppable) queued message.
+    drop_newest - drop the new message.
+    coalesce - a new message replaces the queued message with the same key (e.g. the same topic or event name),
+        otherwise drop the oldest (droppable) queued message.
+    disconnect - disconnect the client (too far behind).
+    """
+
+    block = "block"
+    drop_oldest = "drop_oldest"
+    drop_newest = "drop_newest"
+    coalesce = "coalesce"
+    disconnect = "disconnect"
+
+
+class FilebaseApiOutboundQueue(object):
+    def __init__(
+        self,
+        send_frames: Callable[[List[Any]], Awaitable],
+        max_size: int = 256,
+        policy: FilebaseApiOverflowPolicy = FilebaseApiOverflowPolicy.drop_oldest,
+        on_overflow: Callable[["FilebaseApiOutboundQueue"], Any] = None,
+        block_timeout: float = None,
+    ):
+        """A bounded queue of outbound (encoded) messages, sent to the client by a writer task.
+
+        Messages are either droppable (events, published messages) and handled by the overflow policy, or not
+        (command responses, stream chunks) and are never dropped; sending a message that is not droppable
+        to a full queue waits for the client to catch up.
+
+        Args:
+            send_frames (Callable[[List[Any]], Awaitable]): Sends the frames of a message.
+            max_size (int, optional): The max number of queued messages. Defaults to 256.
+            policy (FilebaseApiOverflowPolicy, optional): The overflow policy. Defaults to drop_oldest.
+            on_overflow (Callable[[FilebaseApiOutboundQueue], Any], optional): Called when the client is too far
+                behind and should be disconnected (the disconnect policy, or a block timeout). Defaults to None.
+            block_timeout (float, optional): The max time (seconds) to wait for the client to catch up,
+                if None wait forever. Defaults to None.
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.policy = FilebaseApiOverflowPolicy.parse(str(policy))
+        self.block_timeout = block_timeout
+
+        self._send_frames = send_frames
+        self._on_overflow = on_overflow
+        # key -> (frames, droppable)
+        self._items: OrderedDict = OrderedDict()
+        self._item_index = 0
+        self._has_items = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._writer: asyncio.Task = None
+        self._closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.overflows = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """The number of queued messages"""
+        return len(self._items)
+
+    @property
+    def is_full(self) -> bool:
+        """True if the queue is full"""
+        return self.max_size is not None and len(self._items) >= self.max_size
+
+    @property
+    def is_closed(self) -> bool:
+        """True if the queue was closed"""
+        return self._closed
+
+    @property
+    def stats(self) -> dict:
+        """The queue counters"""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "overflows": self.overflows,
+        }
+
+    def put(self, frames: List[Any], key: Any = None) -> bool:
+        """Queues a droppable message without waiting. Returns false if the message was dropped. With the
+        block policy, the message is dropped if the queue is full.
+
+        Args:
+            frames (List[Any]): The message frames (see FilebaseApiCodec.encode_frames)
+            key (Any, optional): The coalesce key, with the coalesce policy a queued message with the same
+                key is replaced. Defaults to None.
+        """
+        if self._closed:
+            return False
+        if self._coalesce(frames, key):
+            return True
+        if self.is_full and not self._make_room(True):
+            if self.policy == FilebaseApiOverflowPolicy.block:
+                self.dropped += 1
+            return False
+        self._append(frames, key, True)
+        return True
+
+    async def send(self, frames: List[Any], key: Any = None, droppable: bool = False) -> bool:
+        """Queues a message, waiting for the client to catch up if needed (the block policy, or messages
+        that are not droppable). Returns false if the message was dropped or the client is too far behind.
+
+        Args:
+            frames (List[Any]): The message frames (see FilebaseApiCodec.encode_frames)
+            key (Any, optional): The coalesce key (droppable messages only), see put. Defaults to None.
+            droppable (bool, optional): If true, the message can be dropped by the overflow policy.
+                Defaults to False.
+        """
+        if self._closed:
+            return False
+        if droppable and self._coalesce(frames, key):
+            return True
+
+        if self.is_full and not self._make_room(droppable):
+            if droppable and self.policy != FilebaseApiOverflowPolicy.block:
+                return False
+            if self.policy == FilebaseApiOverflowPolicy.disconnect or not await self._wait_for_space():
+                self._overflow()
+                return False
+            if self._closed:
+                return False
+
+        self._append(frames, key, droppable)
+        return True
+
+    def _coalesce(self, frames: List[Any], key: Any) -> bool:
+        if key is None or self.policy != FilebaseApiOverflowPolicy.coalesce or key not in self._items:
+            return False
+        # replaced in place, keeps the queue position.
+        self._items[key] = (frames, True)
+        self.coalesced += 1
+        return True
+
+    def _make_room(self, droppable: bool) -> bool:
+        """Applies the overflow policy to a full queue, returns true if there is room for the new message."""
+        if self.policy in (FilebaseApiOverflowPolicy.drop_oldest, FilebaseApiOverflowPolicy.coalesce):
+            for key, (_, is_droppable) in self._items.items():
+                if is_droppable:
+                    del self._items[key]
+                    self.dropped += 1
+                    return True
+        if droppable:
+            if self.policy == FilebaseApiOverflowPolicy.disconnect:
+                self._overflow()
+            if self.policy != FilebaseApiOverflowPolicy.block:
+                self.dropped += 1
+        return False
+
+    async def _wait_for_space(self) -> bool:
+        try:
+            while self.is_full and not self._closed:
+                self._has_space.clear()
+                await asyncio.wait_for(self._has_space.wait(), self.block_timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _overflow(self):
+        self.overflows += 1
+        if self._on_overflow is not None:
+            self._on_overflow(self)
+
+    def _append(self, frames: List[Any], key: Any, droppable: bool):
+        if key is None or self.policy != FilebaseApiOverflowPolicy.coalesce:
+            self._item_index += 1
+            key = (FilebaseApiOutboundQueue, self._item_index)
+        self._items[key] = (frames, droppable)
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._has_items.set()
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        while not self._closed:
+            if len(self._items) == 0:
+                self._has_items.clear()
+                await self._has_items.wait()
+                continue
+            _, (frames, _) = self._items.popitem(last=False)
+            self._has_space.set()
+            try:
+                await self._send_frames(frames)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self.failed += 1
+                logger.error(f"Error while sending a queued message: {ex}")
+
+    async def close(self):
+        """Stops the writer task, queued messages are discarded."""
+        self._closed = True
+        self._items.clear()
+        self._has_space.set()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
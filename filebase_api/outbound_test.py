@@ -0,0 +1,91 @@
+import asyncio
+from filebase_api.outbound import FilebaseApiOutboundQueue, FilebaseApiOverflowPolicy
+
+
+def run_queue(items, policy, max_size=2):
+    sent = []
+    overflows = []
+
+    async def send_frames(frames):
+        sent.append(frames[0])
+
+    async def run():
+        queue = FilebaseApiOutboundQueue(send_frames, max_size, policy, on_overflow=overflows.append)
+        # all queued before the writer task runs.
+        results = [queue.put([value], key) for value, key in items]
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return queue, results
+
+    queue, results = asyncio.run(run())
+    return queue, results, sent, overflows
+
+
+def test_drop_oldest():
+    queue, results, sent, _ = run_queue([(1, None), (2, None), (3, None)], FilebaseApiOverflowPolicy.drop_oldest)
+    assert results == [True, True, True]
+    assert sent == [2, 3]
+    assert queue.dropped == 1 and queue.max_depth == 2
+
+
+def test_drop_newest():
+    _, results, sent, _ = run_queue([(1, None), (2, None), (3, None)], FilebaseApiOverflowPolicy.drop_newest)
+    assert results == [True, True, False]
+    assert sent == [1, 2]
+
+
+def test_coalesce():
+    queue, _, sent, _ = run_queue([(1, "a"), (2, "b"), (3, "a")], FilebaseApiOverflowPolicy.coalesce)
+    assert sent == [3, 2]
+    assert queue.coalesced == 1 and queue.dropped == 0
+
+
+def test_disconnect():
+    queue, results, _, overflows = run_queue([(1, None), (2, None), (3, None)], FilebaseApiOverflowPolicy.disconnect)
+    assert results == [True, True, False]
+    assert overflows == [queue]
+
+
+def run_slow_queue(count, policy, droppable=False, block_timeout=None):
+    sent = []
+    overflows = []
+
+    async def send_frames(frames):
+        await asyncio.sleep(0.01)
+        sent.append(frames[0])
+
+    async def run():
+        queue = FilebaseApiOutboundQueue(send_frames, 2, policy, overflows.append, block_timeout)
+        results = [await queue.send([i], droppable=droppable) for i in range(count)]
+        while queue.depth > 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.02)
+        await queue.close()
+        return results
+
+    return asyncio.run(run()), sent, overflows
+
+
+def test_block_waits_for_client():
+    results, sent, overflows = run_slow_queue(6, FilebaseApiOverflowPolicy.block)
+    assert results == [True] * 6
+    assert sent == list(range(6))
+    assert overflows == []
+
+
+def test_block_timeout_overflows():
+    results, _, overflows = run_slow_queue(4, FilebaseApiOverflowPolicy.block, block_timeout=0.001)
+    assert False in results
+    assert len(overflows) > 0
+
+
+def test_responses_are_never_dropped():
+    results, sent, _ = run_slow_queue(6, FilebaseApiOverflowPolicy.drop_oldest)
+    assert results == [True] * 6
+    assert sent == list(range(6))
+
+
+def test_events_are_dropped():
+    results, sent, _ = run_slow_queue(6, FilebaseApiOverflowPolicy.drop_newest, droppable=True)
+    assert False in results
+    assert len(sent) < 6
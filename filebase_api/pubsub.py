@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Set
+
+from filebase_api.outbound import FilebaseApiOutboundQueue
+
+
+class FilebaseApiPubSub(object):
+    def __init__(self):
+        """Topic based publish/subscribe between the server and the active websocket connections
+        (FilebaseApiWebSocket). A published message is encoded once per codec and queued to
+        every subscriber's outbound publish queue (see FilebaseApiWebSocket.publish_queue), so slow clients
+        never slow down the publisher.
+
+        Published messages are sent as {"__topic": topic, "payload": payload}
+        """
+        super().__init__()
+        self._subscribers: Dict[str, Set["FilebaseApiWebSocket"]] = dict()  # noqa: F821
+        self._loop: asyncio.AbstractEventLoop = None
+        self._loop_thread_id: int = None
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def topics(self) -> List[str]:
+        """The topics that have subscribers"""
+        return list(self._subscribers.keys())
+
+    @property
+    def stats(self) -> dict:
+        """The pub/sub counters"""
+        return {
+            "topics": len(self._subscribers),
+            "subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    def subscribers(self, topic: str) -> Set["FilebaseApiWebSocket"]:  # noqa: F821
+        """The subscribers of a topic"""
+        return set(self._subscribers.get(topic, set()))
+
+    def subscribe(self, ws: "FilebaseApiWebSocket", topic: str):  # noqa: F821
+        """Subscribes a websocket connection to a topic. Must be called in the event loop.
+
+        Args:
+            ws (FilebaseApiWebSocket): The websocket.
+            topic (str): The topic.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+            self._loop_thread_id = threading.get_ident()
+        self._subscribers.setdefault(topic, set()).add(ws)
+        ws.topics.add(topic)
+
+    def unsubscribe(self, ws: "FilebaseApiWebSocket", topic: str = None):  # noqa: F821
+        """Unsubscribes a websocket connection from a topic.
+
+        Args:
+            ws (FilebaseApiWebSocket): The websocket.
+            topic (str, optional): The topic. If None, from all topics. Defaults to None.
+        """
+        for topic in [topic] if topic is not None else list(ws.topics):
+            ws.topics.discard(topic)
+            subscribers = self._subscribers.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(ws)
+            if len(subscribers) == 0:
+                del self._subscribers[topic]
+
+    def publish(self, topic: str, payload: Any, coalesce_key: Any = None) -> int:
+        """Publishes a message to all the topic subscribers. Thread safe, when called outside the event loop
+        the message is published in the event loop. Returns the number of subscribers.
+
+        Args:
+            topic (str): The topic.
+            payload (Any): The message payload.
+            coalesce_key (Any, optional): With the coalesce overflow policy, a queued message with the same key
+                is replaced by this message. Defaults to the topic.
+        """
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+        if self._loop is not None and threading.get_ident() != self._loop_thread_id:
+            self._loop.call_soon_threadsafe(self._publish, topic, payload, coalesce_key)
+        else:
+            self._publish(topic, payload, coalesce_key)
+        return len(subscribers)
+
+    def _publish(self, topic: str, payload: Any, coalesce_key: Any = None):
+        subscribers = list(self._subscribers.get(topic, []))
+        if len(subscribers) == 0:
+            return
+        self.published += 1
+
+        message = {"__topic": topic, "payload": payload}
+        frames_by_codec = dict()
+        key = coalesce_key if coalesce_key is not None else topic
+
+        for ws in subscribers:
+            codec = ws.codec
+            frames = frames_by_codec.get(codec.name)
+            if frames is None:
+                # encoded once per codec.
+                frames = codec.encode_frames(message)
+                frames_by_codec[codec.name] = frames
+            queue: FilebaseApiOutboundQueue = ws.publish_queue
+            if queue.put(frames, key):
+                self.delivered += 1
+            else:
+                self.dropped += 1
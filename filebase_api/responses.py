@@ -0,0 +1,324 @@
+import os
+import gzip
+import asyncio
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, Union, Dict, List, Tuple
+
+from sanic.request import Request
+from sanic.response import StreamingHTTPResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+# ordered by preference.
+SUPPORTED_ENCODINGS: List[str] = (["br"] if brotli is not None else []) + ["gzip"]
+PRECOMPRESSED_FILE_EXTENSIONS: Dict[str, str] = {"br": ".br", "gzip": ".gz"}
+DEFAULT_COMPRESSION_LEVELS: Dict[str, int] = {"br": 5, "gzip": 6}
+
+
+def compute_etag(data: Union[str, bytes]) -> str:
+    """Computes a strong etag (quoted content hash) for a value.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return '"' + hashlib.sha1(data).hexdigest() + '"'
+
+
+def compute_file_etag(file: Union[str, BinaryIO]) -> str:
+    """Computes a strong etag (quoted content hash) for a file.
+
+    Args:
+        file (Union[str, BinaryIO]): The file path, or an opened (binary) file.
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as raw:
+            return compute_file_etag(raw)
+
+    file_hash = hashlib.sha1()
+    file.seek(0)
+    chunk = file.read(FILE_HASH_CHUNK_SIZE)
+    while chunk:
+        file_hash.update(chunk)
+        chunk = file.read(FILE_HASH_CHUNK_SIZE)
+    return '"' + file_hash.hexdigest() + '"'
+
+
+def compute_stat_etag(mtime: float, size: int) -> str:
+    """Computes a strong etag from the file modified time and size (without reading the file).
+    """
+    return f'"{int(mtime * 1000000):x}-{size:x}"'
+
+
+def read_file_bytes(file_path: str) -> bytes:
+    """Reads a file as bytes"""
+    with open(file_path, "rb") as raw:
+        return raw.read()
+
+
+def open_file(file_path: str) -> Tuple[BinaryIO, os.stat_result]:
+    """Opens a file for (binary) reading. Returns the file and its stat, taken from the opened
+    file descriptor (the version of the file that is read).
+    """
+    raw = open(file_path, "rb")
+    try:
+        return raw, os.fstat(raw.fileno())
+    except Exception:
+        raw.close()
+        raise
+
+
+def read_file_range(raw: BinaryIO, start: int, size: int) -> bytes:
+    """Reads exactly size bytes from an opened file, starting at start. Raises an IOError if the file
+    was truncated.
+    """
+    raw.seek(start)
+    data = raw.read(size)
+    if len(data) < size:
+        raise IOError(f"File {raw.name} was truncated while reading")
+    return data
+
+
+def format_http_date(timestamp: float) -> str:
+    """Formats a timestamp as an http date (RFC 7231)"""
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(val: str) -> float:
+    """Parses an http date to a timestamp. Returns None if invalid."""
+    if val is None:
+        return None
+    try:
+        return parsedate_to_datetime(val).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def etag_matches(etag: str, header_value: str) -> bool:
+    """True if the etag matches an If-None-Match/If-Match header value (weak comparison).
+    """
+    if etag is None or header_value is None:
+        return False
+    header_value = header_value.strip()
+    if header_value == "*":
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in header_value.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str = None, last_modified: float = None) -> bool:
+    """True if the request conditional headers (If-None-Match, If-Modified-Since) match the response
+    validators, and a 304 (not modified) should be returned.
+
+    Args:
+        request (Request): The request.
+        etag (str, optional): The response etag. Defaults to None.
+        last_modified (float, optional): The response last modified timestamp. Defaults to None.
+    """
+    if request is None:
+        return False
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present (RFC 7232)
+        return etag_matches(etag, if_none_match)
+
+    if_modified_since = parse_http_date(request.headers.get("If-Modified-Since"))
+    if if_modified_since is None or last_modified is None:
+        return False
+    return int(last_modified) <= if_modified_since
+
+
+def parse_accept_encoding(header_value: str) -> Dict[str, float]:
+    """Parses an Accept-Encoding header value into a dictionary of encoding -> q value.
+    """
+    accepted = dict()
+    if header_value is None:
+        return accepted
+    for part in header_value.split(","):
+        part = part.strip()
+        if len(part) == 0:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def select_encoding(header_value: str, available: List[str] = None) -> str:
+    """Selects the response content encoding from an Accept-Encoding header value.
+    Returns None if no compression should be used.
+
+    Args:
+        header_value (str): The Accept-Encoding header value.
+        available (List[str], optional): The available encodings, by preference. Defaults to SUPPORTED_ENCODINGS.
+    """
+    accepted = parse_accept_encoding(header_value)
+    if len(accepted) == 0:
+        return None
+    selected = None
+    selected_q = 0.0
+    for encoding in available if available is not None else SUPPORTED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > selected_q:
+            selected = encoding
+            selected_q = q
+    return selected
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """Compresses the data with the content encoding (gzip or br)
+    """
+    level = level if level is not None else DEFAULT_COMPRESSION_LEVELS.get(encoding)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=level)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def minify_javascript(source: str) -> str:
+    """Minifies javascript source, if rjsmin is installed (otherwise returns the source).
+    """
+    if rjsmin is None:
+        return source
+    return rjsmin.jsmin(source)
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Returns the etag of an encoded (compressed) variant of a response.
+    """
+    if etag is None or encoding is None:
+        return etag
+    return etag[:-1] + "-" + encoding + '"' if etag.endswith('"') else etag + "-" + encoding
+
+
+class FilebaseContentRange(object):
+    __slots__ = ["start", "end", "size", "total"]
+
+    def __init__(self, start: int, end: int, total: int):
+        """A single byte range of a content (see the http Range header). Compatible with the
+        sanic file responses _range argument.
+
+        Args:
+            start (int): The first byte.
+            end (int): The last byte (inclusive).
+            total (int): The total content size.
+        """
+        self.start = start
+        self.end = end
+        self.total = total
+        self.size = end - start + 1
+
+    @property
+    def is_satisfiable(self) -> bool:
+        """True if the range can be served"""
+        return 0 <= self.start <= self.end < self.total
+
+    @classmethod
+    def parse(cls, header_value: str, total: int) -> "FilebaseContentRange":
+        """Parses a Range header value. Returns None if the range should be ignored (invalid or
+        multiple ranges), in which case the full content should be served.
+
+        Args:
+            header_value (str): The Range header value (bytes=start-end | bytes=start- | bytes=-suffix)
+            total (int): The total content size.
+        """
+        unit, _, value = header_value.partition("=")
+        if unit.strip().lower() != "bytes" or "," in value:
+            return None
+        start, _, end = value.strip().partition("-")
+        try:
+            if len(start) == 0:
+                suffix_length = int(end)
+                if suffix_length <= 0:
+                    return cls(total, total, total)
+                return cls(max(0, total - suffix_length), total - 1, total)
+            start = int(start)
+            end = min(int(end), total - 1) if len(end) > 0 else total - 1
+        except ValueError:
+            return None
+        if end < start and start < total:
+            return None
+        return cls(start, end, total)
+
+
+def is_range_allowed(request: Request, etag: str = None, last_modified: float = None) -> bool:
+    """True if the request Range header should be applied, by the If-Range header (if any).
+    """
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # only strong validators are allowed.
+        return etag is not None and not if_range.startswith("W/") and if_range == etag
+    if_range_date = parse_http_date(if_range)
+    return if_range_date is not None and last_modified is not None and int(last_modified) <= if_range_date
+
+
+def file_stream(
+    raw: BinaryIO,
+    mime_type: str,
+    size: int,
+    headers: dict = None,
+    content_range: FilebaseContentRange = None,
+    chunk_size: int = 256 * 1024,
+) -> StreamingHTTPResponse:
+    """Creates a response that streams an opened file (or a byte range of it) in chunks, keeping at most
+    one chunk in memory. Exactly Content-Length bytes are sent, if the file was truncated the connection
+    is closed. The file is closed when the stream completes.
+
+    Args:
+        raw (BinaryIO): The opened (binary) file, see open_file.
+        mime_type (str): The response mime type.
+        size (int): The file size (from the opened file stat).
+        headers (dict, optional): The response headers. Defaults to None.
+        content_range (FilebaseContentRange, optional): The byte range to send (206). Defaults to None.
+        chunk_size (int, optional): The read chunk size. Defaults to 256KB.
+    """
+    headers = headers or dict()
+    status = 200
+    start = 0
+    if content_range is not None:
+        headers["Content-Range"] = f"bytes {content_range.start}-{content_range.end}/{content_range.total}"
+        status = 206
+        start = content_range.start
+        size = content_range.size
+    headers["Content-Length"] = str(size)
+
+    async def stream(rsp: StreamingHTTPResponse):
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, raw.seek, start)
+            to_send = size
+            while to_send > 0:
+                chunk = await loop.run_in_executor(None, raw.read, min(chunk_size, to_send))
+                if len(chunk) == 0:
+                    # sanic closes the connection, the content length cannot be completed.
+                    raise IOError(f"File {raw.name} was truncated while streaming")
+                to_send -= len(chunk)
+                await rsp.write(chunk)
+        finally:
+            raw.close()
+
+    return StreamingHTTPResponse(stream, status=status, headers=headers, content_type=mime_type, chunked=False)
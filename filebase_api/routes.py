@@ -0,0 +1,268 @@
+import os
+import threading
+from typing import Container, Dict, List, Tuple
+
+from zcommon.fs import strip_path_extention
+from filebase_api.helpers import FilebaseApiConfig
+from filebase_api.responses import PRECOMPRESSED_FILE_EXTENSIONS
+
+
+class FilebaseApiRoute(object):
+    __slots__ = [
+        "sub_path",
+        "file_path",
+        "mime_type",
+        "is_jinja",
+        "module_path",
+        "mtime",
+        "size",
+        "precompressed",
+    ]
+
+    def __init__(
+        self,
+        sub_path: str,
+        file_path: str,
+        mime_type: str,
+        is_jinja: bool,
+        module_path: str = None,
+        mtime: float = None,
+        size: int = None,
+        precompressed: Dict[str, str] = None,
+    ):
+        """Precomputed information about a public file route. Access is not part of the route, it is checked
+        on lookup (see FilebaseApiRouteIndex.is_remote_access_allowed).
+
+        Args:
+            sub_path (str): The public route subpath.
+            file_path (str): The absolute file path.
+            mime_type (str): The file mime type.
+            is_jinja (bool): If true, the file is rendered as a jinja template.
+            module_path (str, optional): The absolute path to the companion code module (if any).
+            mtime (float, optional): The file modified time, at the time of the scan.
+            size (int, optional): The file size, at the time of the scan.
+            precompressed (Dict[str, str], optional): The precompressed sibling files (file.gz, file.br),
+                by content encoding.
+        """
+        self.sub_path = sub_path
+        self.file_path = file_path
+        self.mime_type = mime_type
+        self.is_jinja = is_jinja
+        self.module_path = module_path
+        self.mtime = mtime
+        self.size = size
+        self.precompressed = precompressed or dict()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.sub_path} -> {self.file_path})"
+
+
+class FilebaseApiRouteIndex(object):
+    def __init__(self, src_path: str, config: FilebaseApiConfig):
+        """An in memory index of the public routes (files) under the source path.
+        Rebuilt (and swapped) on demand, see build.
+
+        Args:
+            src_path (str): The absolute path to the source (public) directory.
+            config (FilebaseApiConfig): The api config.
+        """
+        super().__init__()
+        self.src_path = src_path
+        self.config = config
+
+        self._routes: Dict[str, FilebaseApiRoute] = dict()
+        self._modules: Dict[str, str] = dict()
+        self._index_redirect: str = None
+        self._build_lock = threading.Lock()
+
+    @property
+    def routes(self) -> Dict[str, FilebaseApiRoute]:
+        """The routes by public subpath"""
+        return self._routes
+
+    @property
+    def index_redirect(self) -> str:
+        """The first index file found in the source directory (if any)"""
+        return self._index_redirect
+
+    def _to_sub_path(self, file_path: str) -> str:
+        # None if outside the source directory.
+        src_path = os.path.normpath(self.src_path)
+        file_path = os.path.normpath(file_path)
+        if not file_path.startswith(src_path + os.sep):
+            return None
+        return os.path.relpath(file_path, src_path).replace(os.sep, "/")
+
+    def _scan_files(self, path: str = None) -> Dict[str, os.stat_result]:
+        files = dict()
+        path = path or self.src_path
+        if not os.path.isdir(path):
+            return files
+        # symlinked directories are followed, each (real) directory is scanned once.
+        visited = set()
+        for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+            real_path = os.path.realpath(dirpath)
+            if real_path in visited:
+                dirnames.clear()
+                continue
+            visited.add(real_path)
+            for name in filenames:
+                fpath = os.path.join(dirpath, name)
+                try:
+                    files[self._to_sub_path(fpath)] = os.stat(fpath)
+                except OSError:
+                    continue
+        return files
+
+    def _get_module_sub_path(self, sub_path: str) -> str:
+        if sub_path.endswith(self.config.module_file_marker):
+            return sub_path if self.config.is_remote_access_allowed(sub_path) else None
+        return strip_path_extention(sub_path) + self.config.module_file_marker
+
+    def _create_route(
+        self, sub_path: str, mtime: float, size: int, sub_paths: Container[str], modules: Dict[str, str]
+    ) -> FilebaseApiRoute:
+        file_path = os.path.join(self.src_path, sub_path)
+        return FilebaseApiRoute(
+            sub_path=sub_path,
+            file_path=file_path,
+            mime_type=self.config.mime_types.match_mime_type(file_path),
+            is_jinja=self.config.jinja_files.test(file_path),
+            module_path=modules.get(self._get_module_sub_path(sub_path)),
+            mtime=mtime,
+            size=size,
+            precompressed={
+                encoding: os.path.join(self.src_path, sub_path + ext)
+                for encoding, ext in PRECOMPRESSED_FILE_EXTENSIONS.items()
+                if sub_path + ext in sub_paths
+            },
+        )
+
+    def _find_index_redirect(self, sub_paths: Container[str]) -> str:
+        for index_path in self.config.index_files:
+            if index_path in sub_paths:
+                return index_path
+        return None
+
+    def build(self) -> "FilebaseApiRouteIndex":
+        """Scans the source directory and swaps in the new route index."""
+        with self._build_lock:
+            files = self._scan_files()
+            modules = dict()
+            for sub_path in files.keys():
+                if sub_path.endswith(self.config.module_file_marker):
+                    modules[sub_path] = os.path.join(self.src_path, sub_path)
+
+            routes = dict()
+            for sub_path, stat in files.items():
+                routes[sub_path] = self._create_route(sub_path, stat.st_mtime, stat.st_size, files, modules)
+
+            self._routes = routes
+            self._modules = modules
+            self._index_redirect = self._find_index_redirect(routes)
+        return self
+
+    def update(self, changed: List[str]) -> "FilebaseApiRouteIndex":
+        """Updates the routes of the changed (added, modified or removed) files and directories, without
+        scanning the source directory, and swaps in the updated route index.
+
+        Args:
+            changed (List[str]): The absolute paths of the changed files and directories.
+        """
+        with self._build_lock:
+            routes = dict(self._routes)
+            modules = dict(self._modules)
+            changed_sub_paths = set()
+            stats: Dict[str, Tuple[float, int]] = dict()
+            for fpath in changed:
+                sub_path = self._to_sub_path(fpath)
+                if sub_path is None:
+                    continue
+                for existing in [key for key in routes.keys() if key == sub_path or key.startswith(sub_path + "/")]:
+                    del routes[existing]
+                    modules.pop(existing, None)
+                    changed_sub_paths.add(existing)
+
+                try:
+                    files = self._scan_files(fpath) if os.path.isdir(fpath) else {sub_path: os.stat(fpath)}
+                except OSError:
+                    # removed.
+                    files = dict()
+                for file_sub_path, stat in files.items():
+                    stats[file_sub_path] = (stat.st_mtime, stat.st_size)
+                    if file_sub_path.endswith(self.config.module_file_marker):
+                        modules[file_sub_path] = os.path.join(self.src_path, file_sub_path)
+                changed_sub_paths.update(files.keys())
+
+            # the routes associated with the changed files (the pages of code modules, precompressed variants).
+            for sub_path in changed_sub_paths:
+                related = [
+                    sub_path[: -len(ext)] for ext in PRECOMPRESSED_FILE_EXTENSIONS.values() if sub_path.endswith(ext)
+                ]
+                if sub_path.endswith(self.config.module_file_marker):
+                    related += [key for key in routes.keys() if self._get_module_sub_path(key) == sub_path]
+                for related_sub_path in related:
+                    if related_sub_path in routes and related_sub_path not in stats:
+                        route = routes[related_sub_path]
+                        stats[related_sub_path] = (route.mtime, route.size)
+
+            sub_paths = set(routes.keys()) | set(stats.keys())
+            for sub_path, (mtime, size) in stats.items():
+                routes[sub_path] = self._create_route(sub_path, mtime, size, sub_paths, modules)
+
+            self._routes = routes
+            self._modules = modules
+            self._index_redirect = self._find_index_redirect(sub_paths)
+        return self
+
+    def _update_if_exists(self, sub_path: str) -> bool:
+        # lookup miss, the file may have been added after the index was built (e.g. not watched).
+        file_path = os.path.normpath(os.path.join(self.src_path, sub_path))
+        if self._to_sub_path(file_path) is None or not os.path.isfile(file_path):
+            return False
+        self.update([file_path])
+        return True
+
+    @classmethod
+    def normalize_sub_path(cls, sub_path: str) -> str:
+        """Normalizes a route subpath (no leading /)"""
+        return sub_path.strip().lstrip("/")
+
+    def get(self, sub_path: str) -> FilebaseApiRoute:
+        """Returns the route for the subpath, or None if not found. Files added after the index was built
+        are inserted on lookup.
+        """
+        sub_path = self.normalize_sub_path(sub_path)
+        route = self._routes.get(sub_path)
+        if route is None and self._update_if_exists(sub_path):
+            route = self._routes.get(sub_path)
+        return route
+
+    def is_remote_access_allowed(self, route: FilebaseApiRoute) -> bool:
+        """Returns true if the route can be served. Checked on every lookup by the config (cached) access
+        decisions, so config changes apply without rebuilding the index.
+
+        Args:
+            route (FilebaseApiRoute): The route.
+        """
+        return not self.config.private_path_marker.test(route.sub_path) and self.config.is_remote_access_allowed(
+            route.sub_path
+        )
+
+    def get_module_path(self, sub_path: str) -> str:
+        """Returns the absolute path of the code module associated with the subpath (if any).
+
+        Args:
+            sub_path (str): The page or code module subpath.
+        """
+        module_sub_path = self._get_module_sub_path(self.normalize_sub_path(sub_path))
+        if module_sub_path is None:
+            return None
+        module_path = self._modules.get(module_sub_path)
+        if module_path is None and self._update_if_exists(module_sub_path):
+            module_path = self._modules.get(module_sub_path)
+        return module_path
+
+    def list_module_paths(self) -> List[str]:
+        """The absolute paths of all code modules in the index"""
+        return list(self._modules.values())
@@ -0,0 +1,67 @@
+import os
+import shutil
+
+import pytest
+
+from filebase_api.helpers import FilebaseApiConfig
+from filebase_api.routes import FilebaseApiRouteIndex
+
+
+def create_files(src_path, files: dict):
+    for sub_path, content in files.items():
+        fpath = os.path.join(src_path, sub_path)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, "w") as raw:
+            raw.write(content)
+
+
+def test_route_index_inserts_files_on_lookup(tmp_path):
+    src_path = str(tmp_path)
+    create_files(src_path, {"index.html": "index"})
+    index = FilebaseApiRouteIndex(src_path, FilebaseApiConfig()).build()
+
+    # added after the index was built (not watched).
+    create_files(src_path, {"sub/new.html": "new", "index.code.py": ""})
+    assert index.get("sub/new.html").file_path == os.path.join(src_path, "sub", "new.html")
+    assert index.get_module_path("index.html") == os.path.join(src_path, "index.code.py")
+    assert index.get("index.html").module_path == os.path.join(src_path, "index.code.py")
+
+    assert index.get("missing.html") is None
+    assert index.get("../" + os.path.basename(src_path) + "/index.html") is None
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="Symlinks are not supported")
+def test_route_index_follows_symlinked_directories(tmp_path):
+    src_path = str(tmp_path / "public")
+    create_files(str(tmp_path), {"shared/a.css": "a", "public/index.html": "index"})
+    os.symlink(str(tmp_path / "shared"), os.path.join(src_path, "shared"))
+    # a cycle.
+    os.symlink(src_path, os.path.join(src_path, "shared", "loop"))
+
+    index = FilebaseApiRouteIndex(src_path, FilebaseApiConfig()).build()
+    assert index.get("shared/a.css") is not None
+    assert not any(sub_path.startswith("shared/loop/shared/") for sub_path in index.routes.keys())
+
+
+def test_route_index_updates_changed_paths(tmp_path):
+    src_path = str(tmp_path)
+    create_files(
+        src_path, {"index.html": "index", "a.js": "a", "b.css": "b", "docs/c.html": "c", "docs/d.html": "d"}
+    )
+    index = FilebaseApiRouteIndex(src_path, FilebaseApiConfig()).build()
+    unchanged = index.get("b.css")
+
+    create_files(src_path, {"index.code.py": "", "a.js.gz": "", "new.html": "new"})
+    shutil.rmtree(os.path.join(src_path, "docs"))
+    index.update([os.path.join(src_path, name) for name in ["index.code.py", "a.js.gz", "new.html", "docs"]])
+
+    assert index.routes["index.html"].module_path == os.path.join(src_path, "index.code.py")
+    assert index.routes["a.js"].precompressed == {"gzip": os.path.join(src_path, "a.js.gz")}
+    assert "new.html" in index.routes
+    assert not any(sub_path.startswith("docs/") for sub_path in index.routes.keys())
+
+    create_files(src_path, {"more/e.html": "e"})
+    index.update([os.path.join(src_path, "more")])
+    assert index.routes["more/e.html"].size == 1
+    # only the changed paths (and their pages or variants) are updated.
+    assert index.get("b.css") is unchanged
@@ -0,0 +1,221 @@
+import json
+from datetime import datetime
+from functools import partial
+from enum import Enum
+from typing import Any, Dict, List, Union
+
+from zcommon.textops import json_dump_with_types
+from zcommon.serialization import DictionarySerializableMixin
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DATETIME_MARKER = "DT::"
+FILEBASE_API_CODEC_SUBPROTOCOL_PREFIX = "fapi."
+
+# memoryview (struct) formats to element kinds (the dtype is [kind][bits])
+BUFFER_FORMAT_KINDS = {
+    "b": "int",
+    "h": "int",
+    "i": "int",
+    "l": "int",
+    "q": "int",
+    "H": "uint",
+    "I": "uint",
+    "L": "uint",
+    "Q": "uint",
+    "f": "float",
+    "d": "float",
+}
+
+
+def create_attachment_ref(value: Any, attachments: List[memoryview]) -> dict:
+    """If the value is a buffer (bytes, bytearray, memoryview, numpy array or any buffer protocol object),
+    adds it to the attachments and returns the attachment reference:
+
+    {"__attachment": [index], "byte_length": n, "dtype": [element type], "shape": [array shape]}
+
+    Otherwise returns None.
+
+    Args:
+        value (Any): The value.
+        attachments (List[memoryview]): The message attachments.
+    """
+    if getattr(value, "ndim", None) == 0:
+        # numpy scalars.
+        return None
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return None
+    if not view.c_contiguous:
+        view = memoryview(view.tobytes())
+
+    ref = {"__attachment": len(attachments), "byte_length": view.nbytes}
+    dtype = getattr(value, "dtype", None)
+    if dtype is not None:
+        ref["dtype"] = str(dtype)
+        ref["shape"] = list(value.shape)
+    elif view.format in BUFFER_FORMAT_KINDS:
+        ref["dtype"] = BUFFER_FORMAT_KINDS[view.format] + str(view.itemsize * 8)
+        ref["shape"] = list(view.shape)
+
+    attachments.append(view.cast("B") if view.format != "B" or view.ndim != 1 else view)
+    return ref
+
+
+def to_serializable(value: Any, attachments: List[memoryview] = None) -> Any:
+    """Converts a value that is not natively serializable (the codecs default hook). Compatible with
+    zcommon.textops.json_dump_with_types.
+
+    Args:
+        value (Any): The value.
+        attachments (List[memoryview], optional): If not None, buffers are sent as binary attachments,
+            see create_attachment_ref. Defaults to None.
+    """
+    if isinstance(value, DictionarySerializableMixin):
+        return value.__to_dictionary__()
+    if isinstance(value, datetime):
+        return DATETIME_MARKER + value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if attachments is not None:
+        ref = create_attachment_ref(value, attachments)
+        if ref is not None:
+            return ref
+    if hasattr(value, "tolist") and callable(value.tolist):
+        # numpy arrays and scalars.
+        return value.tolist()
+    return str(value)
+
+
+class FilebaseApiCodec(object):
+    name: str = None
+    is_binary: bool = False
+
+    @property
+    def subprotocol(self) -> str:
+        """The websocket subprotocol that selects this codec at handshake"""
+        return FILEBASE_API_CODEC_SUBPROTOCOL_PREFIX + self.name
+
+    def encode(self, value: Any, attachments: List[memoryview] = None) -> Union[str, bytes]:
+        """Encodes a message to a websocket frame (str = text frame, bytes = binary frame)
+
+        Args:
+            value (Any): The message.
+            attachments (List[memoryview], optional): If not None, buffer values are replaced by
+                references and added to the attachments. Defaults to None.
+        """
+        raise NotImplementedError()
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        """Decodes a websocket frame to a message"""
+        raise NotImplementedError()
+
+    def encode_attachments_envelope(self, encoded: Union[str, bytes], count: int) -> Union[str, bytes]:
+        """Wraps an encoded message that has attachments: {"__attachments": count, "__message": message}"""
+        raise NotImplementedError()
+
+    def encode_frames(self, value: Any) -> List[Union[str, bytes, memoryview]]:
+        """Encodes a message to websocket frames. If the message has buffer values, the frames are
+        the attachments envelope (see encode_attachments_envelope), followed by a binary frame per attachment.
+        The frames must be sent in order, without other frames in between.
+        """
+        attachments = []
+        encoded = self.encode(value, attachments)
+        if len(attachments) == 0:
+            return [encoded]
+        return [self.encode_attachments_envelope(encoded, len(attachments))] + attachments
+
+
+class FilebaseApiJsonCodec(FilebaseApiCodec):
+    name = "json"
+
+    def __init__(self, use_orjson: bool = None):
+        """The json codec (text frames), datetime values are sent as DT::[iso format] strings.
+
+        Args:
+            use_orjson (bool, optional): If true use orjson (much faster), if installed. Defaults to True.
+        """
+        super().__init__()
+        self.use_orjson = orjson is not None and use_orjson is not False
+
+    def encode(self, value: Any, attachments: List[memoryview] = None) -> str:
+        if self.use_orjson:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if attachments is None:
+                option |= orjson.OPT_SERIALIZE_NUMPY
+            return orjson.dumps(value, default=partial(to_serializable, attachments=attachments), option=option).decode(
+                "utf-8"
+            )
+        if attachments is None:
+            return json_dump_with_types(value)
+        return json.dumps(value, default=partial(to_serializable, attachments=attachments))
+
+    def encode_attachments_envelope(self, encoded: str, count: int) -> str:
+        return '{"__attachments":' + str(count) + ',"__message":' + encoded + "}"
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if self.use_orjson:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class FilebaseApiMsgpackCodec(FilebaseApiCodec):
+    name = "msgpack"
+    is_binary = True
+
+    def __init__(self):
+        """The msgpack codec (binary frames), datetime values are sent as msgpack timestamps. Requires
+        the msgpack package (and a msgpack library on the client, see filebase_api_client.js)
+        """
+        super().__init__()
+        assert msgpack is not None, ModuleNotFoundError("The msgpack codec requires the msgpack package")
+
+    @staticmethod
+    def _to_serializable(value: Any, attachments: List[memoryview] = None) -> Any:
+        if isinstance(value, datetime):
+            # naive datetime values are assumed to be local time.
+            return msgpack.Timestamp.from_datetime(value if value.tzinfo is not None else value.astimezone())
+        return to_serializable(value, attachments)
+
+    def encode(self, value: Any, attachments: List[memoryview] = None) -> bytes:
+        # bytes like values are packed natively (bin), other buffers (arrays) are attached.
+        return msgpack.packb(value, default=partial(self._to_serializable, attachments=attachments), use_bin_type=True)
+
+    def encode_attachments_envelope(self, encoded: bytes, count: int) -> bytes:
+        # a two items map, {"__attachments": count, "__message": message}
+        return b"\x82" + msgpack.packb("__attachments") + msgpack.packb(count) + msgpack.packb("__message") + encoded
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            # text frames are always json.
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False, timestamp=3, strict_map_key=False)
+
+
+def create_codecs(names: List[str]) -> Dict[str, FilebaseApiCodec]:
+    """Creates the codecs by name (json, msgpack), in order. Codecs that are unavailable (missing packages)
+    are skipped. The json codec is always included.
+
+    Args:
+        names (List[str]): The codec names, by preference.
+    """
+    codec_types = {codec_type.name: codec_type for codec_type in [FilebaseApiJsonCodec, FilebaseApiMsgpackCodec]}
+    codecs = dict()
+    for name in names:
+        if name not in codec_types:
+            raise ValueError(f"Unknown websocket codec: {name}")
+        if name == FilebaseApiMsgpackCodec.name and msgpack is None:
+            continue
+        codecs[name] = codec_types[name]()
+    if FilebaseApiJsonCodec.name not in codecs:
+        codecs[FilebaseApiJsonCodec.name] = FilebaseApiJsonCodec()
+    return codecs
@@ -0,0 +1,60 @@
+import json
+import pytest
+from enum import Enum
+from datetime import datetime
+from zcommon.textops import json_dump_with_types
+from filebase_api.serialization import FilebaseApiJsonCodec, FilebaseApiMsgpackCodec, create_codecs, orjson, msgpack
+
+
+class Color(Enum):
+    red = "red"
+
+
+VALUE = {"at": datetime(2020, 1, 2, 3, 4, 5), "color": Color.red, "values": [1, 2.5, None, "a"], "nested": {"a": 1}}
+
+
+@pytest.mark.parametrize("use_orjson", [False, True])
+def test_json_codec_compatible_with_json_dump_with_types(use_orjson):
+    if use_orjson and orjson is None:
+        pytest.skip("orjson not installed")
+    codec = FilebaseApiJsonCodec(use_orjson=use_orjson)
+    encoded = codec.encode(VALUE)
+    assert isinstance(encoded, str)
+    assert json.loads(encoded) == json.loads(json_dump_with_types(VALUE))
+    assert codec.decode(encoded)["at"] == "DT::2020-01-02T03:04:05"
+
+
+def test_msgpack_codec():
+    if msgpack is None:
+        pytest.skip("msgpack not installed")
+    codec = FilebaseApiMsgpackCodec()
+    decoded = codec.decode(codec.encode(VALUE))
+    assert decoded["at"] == VALUE["at"].astimezone()
+    assert decoded["color"] == "red" and decoded["values"] == VALUE["values"]
+
+
+def test_create_codecs():
+    assert list(create_codecs([]).keys()) == ["json"]
+    with pytest.raises(ValueError):
+        create_codecs(["xml"])
+
+
+def test_binary_attachments():
+    import array
+
+    value = {"data": b"abc", "values": array.array("f", [1, 2]), "n": 1}
+    envelope, *attachments = FilebaseApiJsonCodec().encode_frames(value)
+    envelope = json.loads(envelope)
+    assert envelope["__attachments"] == 2
+    assert envelope["__message"]["values"] == {"__attachment": 1, "byte_length": 8, "dtype": "float32", "shape": [2]}
+    assert [bytes(a) for a in attachments] == [b"abc", array.array("f", [1, 2]).tobytes()]
+
+    # no buffers, a single frame.
+    assert FilebaseApiJsonCodec().encode_frames({"n": 1}) == ['{"n":1}' if orjson is not None else '{"n": 1}']
+
+    if msgpack is not None:
+        codec = FilebaseApiMsgpackCodec()
+        envelope, *attachments = codec.encode_frames(value)
+        envelope = codec.decode(envelope)
+        # bytes are packed natively.
+        assert envelope["__attachments"] == 1 and envelope["__message"]["data"] == b"abc"
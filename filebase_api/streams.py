@@ -0,0 +1,134 @@
+import asyncio
+import inspect
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Generator
+
+from zcommon.shell import logger
+
+from filebase_api.executors import FilebaseExecutor
+
+
+async def iterate_generator_async(generator: Generator, executor: FilebaseExecutor = None) -> AsyncIterator:
+    """Iterates a (synchronous) generator asynchronously. Each item is generated in the executor (if any).
+
+    Args:
+        generator (Generator): The generator.
+        executor (FilebaseExecutor, optional): The executor to generate the items in. If None, the items
+            are generated on the event loop. Defaults to None.
+    """
+    end_marker = object()
+    # a cancelled call may still be generating in the executor, the generator is closed once it completes.
+    generator_lock = threading.Lock()
+
+    def generate_next():
+        with generator_lock:
+            return next(generator, end_marker)
+
+    def close():
+        with generator_lock:
+            generator.close()
+
+    try:
+        while True:
+            chunk = generate_next() if executor is None else await executor.run(generate_next)
+            if chunk is end_marker:
+                break
+            yield chunk
+    finally:
+        if executor is None:
+            generator.close()
+        else:
+            await asyncio.shield(asyncio.get_event_loop().run_in_executor(None, close))
+
+
+class FilebaseApiStream(object):
+    def __init__(
+        self,
+        command_id: Any,
+        iterator: AsyncIterator,
+        send: Callable[[dict], Awaitable],
+        credits: int = None,
+    ):
+        """Streams the chunks of a remote method (async) iterator to the client, as separate messages:
+
+        {"__command_id": id, "__chunk": chunk, "__seq": n} .. {"__command_id": id, "__end": true, "__count": n}
+
+        Where the end message has an __error if the iterator failed.
+
+        Args:
+            command_id (Any): The command id.
+            iterator (AsyncIterator): The chunks iterator.
+            send (Callable[[dict], Awaitable]): Sends a message to the client.
+            credits (int, optional): The number of chunks that can be sent before the client grants more
+                credits (flow control, see grant). If None, unlimited. Defaults to None.
+        """
+        super().__init__()
+        self.command_id = command_id
+        self.iterator = iterator
+        self.credits = credits
+        self.sent = 0
+
+        self._send = send
+        self._task: asyncio.Task = None
+        self._credits_granted = asyncio.Event()
+
+    @property
+    def task(self) -> asyncio.Task:
+        """The stream task (None if not started)"""
+        return self._task
+
+    @property
+    def is_waiting_for_credits(self) -> bool:
+        """True if the stream is paused until the client grants more credits"""
+        return self.credits is not None and self.credits <= 0
+
+    def start(self) -> asyncio.Task:
+        """Starts streaming in a new task"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    def grant(self, credits: int):
+        """Allows the stream to send more chunks.
+
+        Args:
+            credits (int): The number of chunks.
+        """
+        if self.credits is None:
+            return
+        self.credits += credits
+        if self.credits > 0:
+            self._credits_granted.set()
+
+    def cancel(self):
+        """Stops streaming (the iterator is closed)"""
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _wait_for_credits(self):
+        while self.is_waiting_for_credits:
+            self._credits_granted.clear()
+            await self._credits_granted.wait()
+
+    async def _run(self):
+        try:
+            while True:
+                # the next chunk is only generated once it can be sent.
+                await self._wait_for_credits()
+                try:
+                    chunk = await self.iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                if self.credits is not None:
+                    self.credits -= 1
+                await self._send({"__command_id": self.command_id, "__chunk": chunk, "__seq": self.sent})
+                self.sent += 1
+            await self._send({"__command_id": self.command_id, "__end": True, "__count": self.sent})
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Error while streaming command {self.command_id}: {ex}")
+            await self._send({"__command_id": self.command_id, "__end": True, "__count": self.sent, "__error": str(ex)})
+        finally:
+            if inspect.isasyncgen(self.iterator):
+                await self.iterator.aclose()
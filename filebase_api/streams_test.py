@@ -0,0 +1,33 @@
+import time
+import asyncio
+
+import pytest
+
+from filebase_api.executors import FilebaseExecutor
+from filebase_api.streams import iterate_generator_async
+
+
+def test_iterate_generator_cancelled_while_generating():
+    closed = []
+
+    def generate():
+        try:
+            yield 1
+            time.sleep(0.2)
+            yield 2
+        finally:
+            closed.append(True)
+
+    async def main():
+        iterator = iterate_generator_async(generate(), FilebaseExecutor(max_workers=2))
+        assert await iterator.__anext__() == 1
+
+        # cancelled while the next item is generated in the executor.
+        task = asyncio.ensure_future(iterator.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert closed == [True]
@@ -1,18 +1,186 @@
 import jinja2
 import os
+import time
+import threading
+from contextlib import contextmanager
 
-from typing import Dict, Callable
+from typing import Any, Dict, Callable, List, Tuple
 from jinja2.runtime import Macro
 
 from zcommon.fs import relative_abspath, is_relative_path
 from match_pattern import Pattern
-from filebase_api.helpers import FilebaseTemplateServiceConfig
+from filebase_api.helpers import FilebaseTemplateServiceConfig, FilebaseTemplateFreshness
+from filebase_api.cache import FilebaseLRUCache
+from filebase_api.watcher import FilebaseFileWatcher
+from filebase_api.executors import FilebaseExecutor
 
 
 class FilebaseTemplateServiceException(Exception):
     pass
 
 
+class FilebaseTemplateCacheSlot(object):
+    __slots__ = ["src", "mtime", "template", "version", "checked_at"]
+
+    def __init__(self, src: str, mtime: float, template: jinja2.Template, version: int):
+        """A cached file template. Replaced when the file changes.
+
+        Args:
+            src (str): The template file path.
+            mtime (float): The file modified time when the template was loaded.
+            template (jinja2.Template): The compiled template.
+            version (int): The template version, a running number that changes on every reload.
+        """
+        self.src = src
+        self.mtime = mtime
+        self.template = template
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+class FilebaseTemplateCache(object):
+    def __init__(
+        self,
+        environment: jinja2.Environment,
+        max_size: int = 256,
+        max_bytes: int = None,
+        freshness: FilebaseTemplateFreshness = FilebaseTemplateFreshness.always,
+        check_interval: float = 1.0,
+    ):
+        """A compiled templates cache. Holds one slot per template file (replaced on change),
+        and a bounded LRU of string templates.
+
+        Args:
+            environment (jinja2.Environment): The jinja environment to compile the templates with.
+            max_size (int, optional): The max number of string templates to keep. Defaults to 256.
+            max_bytes (int, optional): The max total size (source length) of the string templates
+                to keep. If None, unlimited. Defaults to None.
+            freshness (FilebaseTemplateFreshness, optional): How cached template files are checked for changes.
+                Defaults to always.
+            check_interval (float, optional): The min time between file checks when freshness is interval.
+                Defaults to 1.0.
+        """
+        super().__init__()
+        self.environment = environment
+        self.freshness = freshness
+        self.check_interval = check_interval
+        # the watcher that invalidates the changed files, with the watch freshness.
+        self.watcher: FilebaseFileWatcher = None
+        self._files: Dict[str, FilebaseTemplateCacheSlot] = dict()
+        self._strings = FilebaseLRUCache(max_size, max_bytes, size_of=lambda val: len(val[0]))
+        self._files_lock = threading.RLock()
+        self._last_version = 0
+
+        self.file_hits = 0
+        self.file_misses = 0
+        self.file_reloads = 0
+
+    @property
+    def stats(self) -> dict:
+        """The cache counters"""
+        return {
+            "files": {
+                "hits": self.file_hits,
+                "misses": self.file_misses,
+                "reloads": self.file_reloads,
+                "size": len(self._files),
+            },
+            "strings": self._strings.stats,
+        }
+
+    def compile(self, source: str, name: str = None, filename: str = None) -> jinja2.Template:
+        """Compiles a template source with the cache environment.
+        """
+        env = self.environment
+        return env.template_class.from_code(env, env.compile(source, name, filename), env.make_globals(None), None)
+
+    def _load_file_slot(self, src: str, mtime: float) -> FilebaseTemplateCacheSlot:
+        with open(src, "r") as raw:
+            source = raw.read()
+        with self._files_lock:
+            self._last_version += 1
+            slot = FilebaseTemplateCacheSlot(src, mtime, self.compile(source, src, src), self._last_version)
+            self._files[src] = slot
+        return slot
+
+    def _is_check_required(self, slot: FilebaseTemplateCacheSlot) -> bool:
+        if self.freshness == FilebaseTemplateFreshness.always:
+            return True
+        if self.freshness == FilebaseTemplateFreshness.interval or (
+            self.freshness == FilebaseTemplateFreshness.watch and (self.watcher is None or not self.watcher.is_running)
+        ):
+            return time.monotonic() - slot.checked_at >= self.check_interval
+        return False
+
+    def is_cached(self, src: str) -> bool:
+        """True if the template file has a loaded slot."""
+        return src in self._files
+
+    def get_file_slot(self, src: str) -> FilebaseTemplateCacheSlot:
+        """Returns the cache slot for a template file, loading (or reloading) the file if
+        it changed. The file is checked according to the cache freshness mode.
+
+        Args:
+            src (str): The absolute template file path.
+        """
+        slot = self._files.get(src)
+        if slot is not None and not self._is_check_required(slot):
+            self.file_hits += 1
+            return slot
+
+        mtime = os.path.getmtime(src)
+        if slot is not None and slot.mtime == mtime:
+            slot.checked_at = time.monotonic()
+            self.file_hits += 1
+            return slot
+
+        if slot is None:
+            self.file_misses += 1
+        else:
+            self.file_reloads += 1
+        return self._load_file_slot(src, mtime)
+
+    def get_file_template(self, src: str) -> jinja2.Template:
+        """Returns the compiled template for a template file.
+
+        Args:
+            src (str): The absolute template file path.
+        """
+        return self.get_file_slot(src).template
+
+    def get_string_template(self, source: str, name: str = None) -> jinja2.Template:
+        """Returns the compiled template for a template string.
+
+        Args:
+            source (str): The template source.
+            name (str, optional): The template name. If None, the source hash is used. Defaults to None.
+        """
+        key = name or hash(source)
+        cached = self._strings.get(key)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+
+        template = self.compile(source, name)
+        self._strings.set(key, (source, template))
+        return template
+
+    def invalidate(self, path: str) -> bool:
+        """Removes a template file (or named string template) from the cache. Returns true if removed.
+
+        Args:
+            path (str): The absolute template file path, or the string template name.
+        """
+        with self._files_lock:
+            removed = self._files.pop(path, None) is not None
+        return self._strings.invalidate(path) or removed
+
+    def clear(self):
+        """Clears all cached templates."""
+        with self._files_lock:
+            self._files.clear()
+        self._strings.clear()
+
+
 class FilebaseTemplateService(object):
     _macros: Dict[str, Macro] = None
 
@@ -56,6 +224,21 @@ class FilebaseTemplateService(object):
 
         self._template_loader = jinja2.DictLoader({})
         self._jinja_environment: jinja2.Environment = jinja2.Environment(loader=self._template_loader)
+        self._template_cache = FilebaseTemplateCache(
+            self._jinja_environment,
+            max_size=self._config.template_cache_size,
+            max_bytes=self._config.template_cache_max_bytes,
+            freshness=self._config.template_freshness,
+            check_interval=self._config.template_check_interval,
+        )
+        self._file_watcher: FilebaseFileWatcher = None
+        # the imported files recorded while rendering, per thread (see record_dependencies)
+        self._recorded_dependencies = threading.local()
+        self._render_executor = FilebaseExecutor(
+            max_workers=self._config.render_threads,
+            max_queue=self._config.render_max_queue,
+            name=f"{self.__class__.__name__}-render",
+        )
 
         if load_environment:
             self.load_environment()
@@ -84,6 +267,71 @@ class FilebaseTemplateService(object):
         """
         return self._jinja_environment
 
+    @property
+    def template_cache(self) -> FilebaseTemplateCache:
+        """The compiled templates cache.
+        """
+        return self._template_cache
+
+    @property
+    def render_executor(self) -> FilebaseExecutor:
+        """The executor used for async rendering (see render_file_async)"""
+        return self._render_executor
+
+    @property
+    def file_watcher(self) -> FilebaseFileWatcher:
+        """The root path files watcher (None if not started)"""
+        return self._file_watcher
+
+    def start_file_watcher(self):
+        """Starts watching the root path files for changes. Changed templates are invalidated."""
+        if self._file_watcher is None:
+            self._file_watcher = FilebaseFileWatcher([self.root_path], interval=self.config.watch_interval)
+            self._file_watcher.on(FilebaseFileWatcher.changed_event_name, self._on_source_files_changed)
+        self._file_watcher.start()
+        self._template_cache.watcher = self._file_watcher
+
+    def stop_file_watcher(self):
+        """Stops watching the root path files."""
+        if self._file_watcher is not None:
+            self._file_watcher.stop()
+
+    def _on_source_files_changed(self, changed: List[str]):
+        for fpath in changed:
+            self.template_cache.invalidate(fpath)
+
+    def warm_up_templates(self) -> int:
+        """Loads (compiles) all the template files in the source directory. Returns the number of
+        templates loaded.
+        """
+        if not os.path.isdir(self.src_path):
+            return 0
+        template_files = self.config.jinja_files.scan_path(self.src_path, include_directories=False)
+        for fpath in template_files:
+            self.template_cache.get_file_slot(fpath)
+        return len(template_files)
+
+    def invalidate(self, path: str) -> bool:
+        """Removes a template from the templates cache, forcing a reload on next render.
+
+        Args:
+            path (str): The template file path (relative or absolute) or the string template name.
+
+        Returns:
+            bool: True if a template was removed.
+        """
+        if self.template_cache.invalidate(path):
+            return True
+        return self.template_cache.invalidate(self.resolve_path(path))
+
+    @property
+    def src_path(self) -> str:
+        """The absolute path to the template source directory.
+        """
+        if self.config.src_subpath is None:
+            return self.root_path
+        return os.path.join(self.root_path, self.config.src_subpath)
+
     def resolve_path(self, src: str) -> str:
         """Resolves an a jinja template relative path to an absolute path.
         """
@@ -103,18 +351,66 @@ class FilebaseTemplateService(object):
             str: The jinja template result.
         """
         fpath = self.resolve_path(file_path)
-        assert os.path.isfile(fpath), ValueError(f"import file path dose not exist or is not a file @ {fpath}")
         if as_jinja_template is None:
             as_jinja_template = self.config.jinja_files.test(fpath)
 
+        dependencies = getattr(self._recorded_dependencies, "files", None)
+        if dependencies is not None:
+            dependencies.append((fpath, as_jinja_template, self.get_file_version(fpath, as_jinja_template)))
+
+        if not (as_jinja_template and self.template_cache.is_cached(fpath)):
+            # cached templates are checked by the cache (see config.template_freshness)
+            assert os.path.isfile(fpath), ValueError(f"import file path dose not exist or is not a file @ {fpath}")
+
         if as_jinja_template:
             return self.render_file(fpath)
         else:
             file_text = None
-            with open(fpath, "R") as raw:
+            with open(fpath, "r") as raw:
                 file_text = raw.read()
             return file_text
 
+    def get_file_version(self, fpath: str, as_jinja_template: bool) -> Any:
+        """Returns the version of a template file (see FilebaseTemplateCacheSlot.version), or the
+        modified time of a text file. Raises an error if the file is missing.
+
+        Args:
+            fpath (str): The absolute file path.
+            as_jinja_template (bool): If true, the file is a jinja template.
+        """
+        if as_jinja_template:
+            return self.template_cache.get_file_slot(fpath).version
+        return os.path.getmtime(fpath)
+
+    @contextmanager
+    def record_dependencies(self):
+        """Records the files imported (import_file) while rendering in the current thread. Yields the
+        list of (file path, as jinja template, version), see is_dependency_changed.
+        """
+        previous = getattr(self._recorded_dependencies, "files", None)
+        dependencies = []
+        self._recorded_dependencies.files = dependencies
+        try:
+            yield dependencies
+        finally:
+            self._recorded_dependencies.files = previous
+            if previous is not None:
+                previous.extend(dependencies)
+
+    def is_dependency_changed(self, dependencies: List[Tuple[str, bool, Any]]) -> bool:
+        """Returns true if any of the recorded dependencies (see record_dependencies) changed or was removed.
+
+        Args:
+            dependencies (List[Tuple[str, bool, Any]]): The recorded dependencies.
+        """
+        for fpath, as_jinja_template, version in dependencies:
+            try:
+                if self.get_file_version(fpath, as_jinja_template) != version:
+                    return True
+            except OSError:
+                return True
+        return False
+
     def attach_method(self, m: Callable = None, name: str = None):
         """Attach a method to the jinja globals.
 
@@ -162,37 +458,8 @@ class FilebaseTemplateService(object):
 
                     self.globals[macro.name] = macro
 
-    @classmethod
-    def __compose_template_key(cls, template: str, name: str):
-        return f"{cls.__name__}:{name or hash(template)}"
-
-    @classmethod
-    def __get_file_key(cls, src):
-        changed_ts = os.path.getmtime(src)
-        return cls.__compose_template_key(None, f"{src}@{changed_ts}")
-
-    def __get_template_from_code(self, template: str, name: str):
-        template_key = self.__compose_template_key(template, name)
-
-        if template_key not in self._template_loader.mapping:
-            self._template_loader.mapping[template_key] = template
-
-        return self.jinja_environment.get_template(template_key)
-
     def _get_file_render_template(self, src: str):
-        src = self.resolve_path(src)
-        file_key = self.__get_file_key(src)
-
-        if file_key in self._template_loader.mapping:
-            return self.jinja_environment.get_template(file_key)
-
-        code = ""
-        with open(src, "r") as raw:
-            code = raw.read()
-
-        template = self.__get_template_from_code(code, file_key)
-
-        return template
+        return self.template_cache.get_file_template(self.resolve_path(src))
 
     def render_template(self, template: str, *args, name: str = None, **kwargs) -> str:
         """Render a template
@@ -205,11 +472,11 @@ class FilebaseTemplateService(object):
         Returns:
             str: The rendered template.
         """
-        template = self.__get_template_from_code(template, name)
+        template = self.template_cache.get_string_template(template, name)
         return template.render(*args, name=name, **kwargs)
 
     async def render_template_async(self, template: str, *args, name: str = None, **kwargs):
-        """Render a template asyncronically.
+        """Render a template asyncronically, in the render executor.
 
         Args:
             template (str): The template to use
@@ -219,8 +486,7 @@ class FilebaseTemplateService(object):
         Returns:
             str: The rendered template.
         """
-        template = self.__get_template_from_code(template, name)
-        return await template.render_async(*args, name=name, **kwargs)
+        return await self.render_executor.run(self.render_template, template, *args, name=name, **kwargs)
 
     def render_file(self, src: str, *args, **kwargs):
         """Render a file as template
@@ -234,8 +500,19 @@ class FilebaseTemplateService(object):
         """
         return self._get_file_render_template(src).render(*args, **kwargs)
 
+    def render_file_with_dependencies(self, src: str, *args, **kwargs) -> Tuple[str, List[Tuple[str, bool, Any]]]:
+        """Render a file as template, and returns the rendered template and the files it imported
+        (see record_dependencies).
+
+        Args:
+            src (str): The template file to use
+        """
+        with self.record_dependencies() as dependencies:
+            rendered = self.render_file(src, *args, **kwargs)
+        return rendered, dependencies
+
     async def render_file_async(self, src: str, *args, **kwargs):
-        """Render a file as template asynchronically.
+        """Render a file as template asynchronically, in the render executor.
 
         Args:
             src (str): The template file to use
@@ -244,5 +521,4 @@ class FilebaseTemplateService(object):
         Returns:
             str: The rendered template.
         """
-        # dose async render is not supported in python 3.7. Therefore using regular render.
-        return (self._get_file_render_template(src)).render(*args, **kwargs)
+        return await self.render_executor.run(self.render_file, src, *args, **kwargs)
@@ -1,3 +1,5 @@
+import os
+import asyncio
 import pytest
 from filebase_api import templates
 
@@ -9,5 +11,68 @@ def test_render_time_vars():
     assert service.render_template(TEMPALTE, my_var="test") == "test"
 
 
+def test_string_templates_cache_is_bounded():
+    service = templates.FilebaseTemplateService(config={"template_cache_size": 2})
+    for i in range(5):
+        assert service.render_template("{{my_var}}" + str(i), my_var="v") == "v" + str(i)
+    assert service.template_cache.stats["strings"]["size"] == 2
+    assert service.template_cache.stats["strings"]["evictions"] == 3
+
+
+def test_file_template_slot_replaced_on_change(tmp_path):
+    fpath = str(tmp_path / "page.html")
+    with open(fpath, "w") as raw:
+        raw.write("first {{my_var}}")
+
+    service = templates.FilebaseTemplateService(str(tmp_path))
+    assert service.render_file(fpath, my_var="a") == "first a"
+
+    with open(fpath, "w") as raw:
+        raw.write("second {{my_var}}")
+    os.utime(fpath, (0, 0))
+
+    assert service.render_file(fpath, my_var="a") == "second a"
+    assert service.template_cache.stats["files"]["size"] == 1
+
+    assert service.invalidate(fpath)
+    assert service.template_cache.stats["files"]["size"] == 0
+
+
+def test_production_freshness_skips_file_checks(tmp_path):
+    fpath = str(tmp_path / "page.html")
+    with open(fpath, "w") as raw:
+        raw.write("first")
+
+    service = templates.FilebaseTemplateService(str(tmp_path), config={"template_freshness": "production"})
+    assert service.render_file(fpath) == "first"
+
+    os.remove(fpath)
+    assert service.render_file(fpath) == "first"
+
+
+def test_watch_freshness_without_watcher_checks_files(tmp_path):
+    fpath = str(tmp_path / "page.html")
+    with open(fpath, "w") as raw:
+        raw.write("v1")
+
+    service = templates.FilebaseTemplateService(
+        str(tmp_path), config={"template_freshness": "watch", "template_check_interval": 0, "watch_files": False}
+    )
+    assert service.render_file(fpath) == "v1"
+
+    with open(fpath, "w") as raw:
+        raw.write("v2")
+    os.utime(fpath, (0, 0))
+    # no watcher is running, checked as interval.
+    assert service.render_file(fpath) == "v2"
+
+
+def test_render_template_async():
+    service = templates.FilebaseTemplateService()
+    rendered = asyncio.run(service.render_template_async("{{my_var}}", my_var="a"))
+    assert rendered == "a"
+    assert service.render_executor.stats["completed"] == 1
+
+
 if __name__ == "__main__":
     pytest.main(["-x", __file__])
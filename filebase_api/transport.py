@@ -0,0 +1,122 @@
+from typing import Any, List
+
+from sanic.exceptions import InvalidUsage
+from sanic.websocket import WebSocketProtocol
+from websockets import InvalidHandshake, WebSocketCommonProtocol, handshake
+from websockets.headers import build_extension, parse_extension
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+# websocket frame opcodes (see RFC 6455)
+WEBSOCKET_DATA_OPCODES = (1, 2)
+WEBSOCKET_CONTROL_OPCODES = (8, 9, 10)
+
+
+class FilebaseApiDeflateExtension(object):
+    def __init__(self, extension: Any, min_size: int = None):
+        """The permessage-deflate extension, where messages smaller than the min size are sent uncompressed
+        (compressing small messages costs more cpu than it saves).
+
+        Args:
+            extension (PerMessageDeflate): The negotiated websockets permessage-deflate extension.
+            min_size (int, optional): The min message size (bytes) to compress, if None compress
+                all messages. Defaults to None.
+        """
+        super().__init__()
+        self.extension = extension
+        self.min_size = min_size
+        self.enabled = True
+        self._skip_message = False
+
+    @property
+    def name(self) -> str:
+        return self.extension.name
+
+    def decode(self, frame, *args, **kwargs):
+        return self.extension.decode(frame, *args, **kwargs)
+
+    def encode(self, frame):
+        if frame.opcode in WEBSOCKET_CONTROL_OPCODES:
+            return frame
+        if frame.opcode in WEBSOCKET_DATA_OPCODES:
+            # continuation frames follow the first frame of the message.
+            self._skip_message = not self.enabled or (self.min_size is not None and len(frame.data) < self.min_size)
+        if self._skip_message:
+            return frame
+        return self.extension.encode(frame)
+
+
+class FilebaseApiWebSocketProtocol(WebSocketProtocol):
+    """The sanic websocket protocol, with permessage-deflate compression. Run the sanic app with
+    protocol=FilebaseApiWebSocketProtocol to enable (see FilebaseApiConfig.websocket_compression).
+
+    The compression is configured through the sanic app config,
+        WEBSOCKET_COMPRESSION (bool) - enable compression (default True).
+        WEBSOCKET_COMPRESSION_THRESHOLD (int) - the min message size to compress (default 1024 bytes)
+        WEBSOCKET_COMPRESSION_LEVEL (int) - the zlib compression level (default zlib default)
+    """
+
+    def _negotiate_extensions(self, request, headers: dict) -> List[FilebaseApiDeflateExtension]:
+        config = self.app.config
+        if not config.get("WEBSOCKET_COMPRESSION", True):
+            return []
+        compress_settings = None
+        if config.get("WEBSOCKET_COMPRESSION_LEVEL") is not None:
+            compress_settings = {"level": config.WEBSOCKET_COMPRESSION_LEVEL}
+        factory = ServerPerMessageDeflateFactory(compress_settings=compress_settings)
+
+        for header_value in request.headers.getall("Sec-WebSocket-Extensions", []):
+            for name, params in parse_extension(header_value):
+                if name != factory.name:
+                    continue
+                try:
+                    response_params, extension = factory.process_request_params(params, [])
+                except Exception:
+                    # parameters not supported, try the next offer.
+                    continue
+                headers["Sec-WebSocket-Extensions"] = build_extension([(name, response_params)])
+                return [FilebaseApiDeflateExtension(extension, config.get("WEBSOCKET_COMPRESSION_THRESHOLD", 1024))]
+        return []
+
+    async def websocket_handshake(self, request, subprotocols=None):
+        # same as sanic WebSocketProtocol.websocket_handshake, with extensions.
+        headers = {}
+
+        try:
+            key = handshake.check_request(request.headers)
+            handshake.build_response(headers, key)
+        except InvalidHandshake:
+            raise InvalidUsage("Invalid websocket request")
+
+        subprotocol = None
+        if subprotocols and "Sec-Websocket-Protocol" in request.headers:
+            client_subprotocols = [p.strip() for p in request.headers["Sec-Websocket-Protocol"].split(",")]
+            for p in client_subprotocols:
+                if p in subprotocols:
+                    subprotocol = p
+                    headers["Sec-Websocket-Protocol"] = subprotocol
+                    break
+
+        extensions = self._negotiate_extensions(request, headers)
+
+        rv = b"HTTP/1.1 101 Switching Protocols\r\n"
+        for k, v in headers.items():
+            rv += k.encode("utf-8") + b": " + v.encode("utf-8") + b"\r\n"
+        rv += b"\r\n"
+        request.transport.write(rv)
+
+        self.websocket = WebSocketCommonProtocol(
+            close_timeout=self.websocket_timeout,
+            max_size=self.websocket_max_size,
+            max_queue=self.websocket_max_queue,
+            read_limit=self.websocket_read_limit,
+            write_limit=self.websocket_write_limit,
+            ping_interval=self.websocket_ping_interval,
+            ping_timeout=self.websocket_ping_timeout,
+        )
+        self.websocket.is_client = False
+        self.websocket.side = "server"
+        self.websocket.subprotocol = subprotocol
+        self.websocket.extensions = extensions
+        self.websocket.connection_made(request.transport)
+        self.websocket.connection_open()
+        return self.websocket
@@ -0,0 +1,181 @@
+import os
+import threading
+from typing import Dict, List, Set, Tuple
+
+from zcommon.shell import logger
+from zthreading.events import EventHandler
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class FilebaseFileWatcher(EventHandler):
+    changed_event_name = "changed"
+
+    def __init__(self, paths: List[str], interval: float = 1.0, use_inotify: bool = True, on_event=None):
+        """Watches a collection of directories (recursively) for file changes. Emits "changed"
+        with the list of changed (created, modified, removed) file paths.
+
+        Uses inotify (inotify_simple package) where available, otherwise polls
+        the file timestamps every interval.
+
+        Args:
+            paths (List[str]): The directories to watch.
+            interval (float, optional): The poll interval (or inotify events collection interval), in seconds.
+                Defaults to 1.0.
+            use_inotify (bool, optional): If false, always use polling. Defaults to True.
+            on_event ([type], optional): Called on any event. Defaults to None.
+        """
+        super().__init__(on_event=on_event)
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.interval = interval
+        self.use_inotify = use_inotify and inotify_simple is not None
+
+        self._thread: threading.Thread = None
+        self._stop_event = threading.Event()
+        self._snapshot_state: Dict[str, Tuple[int, int]] = None
+        self._inotify = None
+        self._watched_directories: Dict[int, str] = dict()
+
+    @property
+    def is_running(self) -> bool:
+        """True if the watcher thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def mode(self) -> str:
+        """The watch mode (inotify or polling)"""
+        return "inotify" if self.use_inotify else "polling"
+
+    def start(self) -> "FilebaseFileWatcher":
+        """Starts watching (in a background thread), if not already started."""
+        if self.is_running:
+            return self
+        self._stop_event.clear()
+
+        # The baseline is taken before returning, so changes made right after start are detected.
+        if self.use_inotify:
+            self._start_inotify()
+        else:
+            self._snapshot_state = self._snapshot()
+
+        self._thread = threading.Thread(
+            target=self._watch_inotify if self.use_inotify else self._watch_polling,
+            name=f"{self.__class__.__name__}-{id(self)}",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stops watching.
+
+        Args:
+            timeout (float, optional): The time to wait for the watcher thread to stop. Defaults to None.
+        """
+        self._stop_event.set()
+        if self.is_running and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _emit_changed(self, changed: Set[str]):
+        if len(changed) == 0:
+            return
+        try:
+            self.emit(self.changed_event_name, sorted(changed))
+        except Exception as ex:
+            logger.error(f"Error while processing file changes: {ex}")
+
+    def _iterate_directories(self):
+        for src_path in self.paths:
+            if not os.path.isdir(src_path):
+                continue
+            for dirpath, _, _ in os.walk(src_path):
+                yield dirpath
+
+    # region polling
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = dict()
+        for src_path in self.paths:
+            if not os.path.isdir(src_path):
+                continue
+            for dirpath, _, filenames in os.walk(src_path):
+                for name in filenames:
+                    fpath = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(fpath)
+                    except OSError:
+                        continue
+                    snapshot[fpath] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _watch_polling(self):
+        while not self._stop_event.wait(self.interval):
+            last = self._snapshot_state
+            current = self._snapshot()
+            changed = set(
+                fpath for fpath in set(last.keys()) | set(current.keys()) if last.get(fpath) != current.get(fpath)
+            )
+            self._snapshot_state = current
+            self._emit_changed(changed)
+
+    # endregion
+
+    # region inotify
+
+    def _add_inotify_watch(self, dirpath: str):
+        flags = inotify_simple.flags
+        watch_flags = (
+            flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO
+        )
+        try:
+            self._watched_directories[self._inotify.add_watch(dirpath, watch_flags)] = dirpath
+        except OSError:
+            pass
+
+    def _remove_inotify_watches(self, dirpath: str):
+        # the directory and its sub directories.
+        for wd, watched_path in list(self._watched_directories.items()):
+            if watched_path == dirpath or watched_path.startswith(dirpath + os.sep):
+                del self._watched_directories[wd]
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    # already removed (deleted directory).
+                    pass
+
+    def _start_inotify(self):
+        self._inotify = inotify_simple.INotify()
+        self._watched_directories = dict()
+        for dirpath in self._iterate_directories():
+            self._add_inotify_watch(dirpath)
+
+    def _watch_inotify(self):
+        flags = inotify_simple.flags
+        try:
+            while not self._stop_event.is_set():
+                changed = set()
+                for event in self._inotify.read(timeout=int(self.interval * 1000), read_delay=50):
+                    dirpath = self._watched_directories.get(event.wd)
+                    if dirpath is None:
+                        continue
+                    fpath = os.path.join(dirpath, event.name)
+                    if event.mask & flags.ISDIR:
+                        if event.mask & (flags.CREATE | flags.MOVED_TO):
+                            for sub_dirpath, _, filenames in os.walk(fpath):
+                                self._add_inotify_watch(sub_dirpath)
+                                changed.update(os.path.join(sub_dirpath, name) for name in filenames)
+                        elif event.mask & (flags.DELETE | flags.MOVED_FROM):
+                            # deleted or moved out, the files under the directory were removed.
+                            self._remove_inotify_watches(fpath)
+                            changed.add(fpath)
+                        continue
+                    changed.add(fpath)
+                self._emit_changed(changed)
+        finally:
+            self._inotify.close()
+            self._inotify = None
+
+    # endregion
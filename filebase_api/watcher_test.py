@@ -0,0 +1,36 @@
+import os
+import time
+import shutil
+import pytest
+from filebase_api.watcher import FilebaseFileWatcher, inotify_simple
+
+
+def wait_for_change(changes: list, path: str):
+    for _ in range(100):
+        if any(path in changed for changed in changes):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.skipif(inotify_simple is None, reason="requires inotify_simple")
+def test_inotify_removed_directories(tmp_path):
+    src_path = tmp_path / "src"
+    for name in ["deleted", "moved"]:
+        os.makedirs(src_path / name / "sub")
+        (src_path / name / "sub" / "a.html").write_text("a")
+
+    changes = []
+    watcher = FilebaseFileWatcher([str(src_path)], interval=0.05)
+    watcher.on(FilebaseFileWatcher.changed_event_name, lambda changed: changes.append(changed))
+    watcher.start()
+    try:
+        shutil.rmtree(src_path / "deleted")
+        assert wait_for_change(changes, str(src_path / "deleted"))
+
+        os.rename(src_path / "moved", tmp_path / "moved")
+        assert wait_for_change(changes, str(src_path / "moved"))
+        # no longer watched once moved out of the tree.
+        assert all(not path.startswith(str(src_path / "moved")) for path in watcher._watched_directories.values())
+    finally:
+        watcher.stop()
@@ -1,4 +1,11 @@
+import time
+import atexit
+import signal
+import socket
 import asyncio
+import threading
+import multiprocessing
+from typing import List
 
 from sanic import Sanic
 from sanic.log import logger as sanic_logger
@@ -9,6 +16,73 @@ from zcommon.textops import random_string
 from zthreading.events import EventHandler, get_active_loop
 from zthreading.tasks import Task
 from filebase_api.webservice import FilebaseApi
+from filebase_api.transport import FilebaseApiWebSocketProtocol
+
+# the time (seconds) given to websocket clients to complete the close handshake when stopping.
+WEB_SERVER_CLOSE_GRACE = 1
+
+
+class WebServerWorkers(object):
+    def __init__(self, count: int):
+        """A group of web server worker processes (forked), with their shared state.
+
+        Args:
+            count (int): The number of workers.
+        """
+        super().__init__()
+        context = multiprocessing.get_context("fork")
+        self.processes: List[multiprocessing.Process] = [None] * count
+        self.ready = [context.Event() for _ in range(count)]
+        self.heartbeats = context.Array("d", count, lock=False)
+        # the drain timeout of the workers when stopped (see FilebaseApi.drain).
+        self.drain_timeout = context.Value("d", 0, lock=False)
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Waits for all the workers to start serving"""
+        deadline = None if timeout is None else time.time() + timeout
+        for ready in self.ready:
+            if not ready.wait(None if deadline is None else max(0, deadline - time.time())):
+                return False
+        return True
+
+    def health(self, heartbeat_timeout: float) -> List[dict]:
+        """The workers health state"""
+        health = []
+        now = time.time()
+        for index, process in enumerate(self.processes):
+            last_heartbeat = self.heartbeats[index] or None
+            is_alive = process.is_alive()
+            health.append(
+                {
+                    "index": index,
+                    "pid": process.pid,
+                    "alive": is_alive,
+                    "exitcode": process.exitcode,
+                    "ready": self.ready[index].is_set(),
+                    "last_heartbeat": last_heartbeat,
+                    "healthy": is_alive and last_heartbeat is not None and now - last_heartbeat < heartbeat_timeout,
+                }
+            )
+        return health
+
+    def stop(self, timeout: float = None) -> bool:
+        """Drains and stops the workers (SIGTERM), workers that did not stop within the timeout (plus the
+        close grace period) are killed. Returns true if all the workers stopped cleanly.
+        """
+        self.drain_timeout.value = timeout if timeout is not None else float("inf")
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = None if timeout is None else time.time() + timeout + WEB_SERVER_CLOSE_GRACE
+        is_clean = True
+        for process in self.processes:
+            process.join(None if deadline is None else max(0, deadline - time.time()))
+            if process.is_alive():
+                is_clean = False
+                logger.warning(f"Web server worker {process.pid} did not stop, killing")
+                process.kill()
+                process.join()
+        return is_clean
 
 
 class WebServer(EventHandler):
@@ -24,20 +98,55 @@ class WebServer(EventHandler):
         serve_path: str = "",
         server_id: str = None,
         on_event=None,
+        workers: int = 1,
+        reuse_port: bool = False,
+        worker_heartbeat_interval: float = 1,
     ):
+        """A web server (sanic) serving a filebase api.
+
+        Args:
+            root_path (str): The path to the server root folder.
+            port (int, optional): The port, if 0 a free port is selected (workers without reuse_port).
+                Defaults to 8080.
+            host (str, optional): The host. Defaults to "localhost".
+            serve_path (str, optional): Not used. Defaults to "".
+            server_id (str, optional): The server id. Defaults to the class name and object id.
+            on_event (Callable, optional): Called on any event. Defaults to None.
+            workers (int, optional): The number of worker processes. If 1, the server runs in this process (in a
+                thread, see start). Otherwise, the service is warmed up (see FilebaseApi.warm_up) and the worker
+                processes are forked. Defaults to 1.
+            reuse_port (bool, optional): If true, each worker binds its own socket with SO_REUSEPORT (the kernel
+                balances connections between the workers). Otherwise the workers share a socket bound before
+                forking. Defaults to False.
+            worker_heartbeat_interval (float, optional): The worker heartbeat interval (seconds), a worker that
+                did not send a heartbeat for 3 intervals is unhealthy (see worker_health). Defaults to 1.
+        """
         super().__init__(on_event=on_event)
         self.server_id = server_id or f"{self.__class__.__name__}-{id(self)}"
         self.server_port = port
         self.server_host = host
         self.log_level = "WARNING"
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.worker_heartbeat_interval = worker_heartbeat_interval
 
         self._asyncio_server: asyncio.AbstractServer = None
         self._asyncio_server_task: asyncio.Task = None
 
+        self._loop: asyncio.AbstractEventLoop = None
+        self._listen_socket: socket.socket = None
+        self._workers: WebServerWorkers = None
+        self._workers_lock = threading.RLock()
+        self._workers_stop_event = threading.Event()
+        self._workers_reload_event = threading.Event()
+        self._workers_stop_timeout: float = None
+        self._supervisor: multiprocessing.Process = None
+        self._supervisor_conn = None
+
         self._sanic = Sanic(self.server_id, configure_logging=False)
 
         self._filebaseapi_service = FilebaseApi(root_path)
-        self._filebaseapi_service.register(self._sanic)
+        self._is_registered = False
 
     @property
     def sanic(self) -> Sanic:
@@ -46,7 +155,9 @@ class WebServer(EventHandler):
 
     @property
     def is_running(self):
-        """True if the sanic server task is running"""
+        """True if the sanic server task (or the workers supervisor) is running"""
+        if self._supervisor is not None:
+            return self._supervisor.is_alive()
         return self._server_task is not None and self._server_task.is_running
 
     @property
@@ -54,24 +165,286 @@ class WebServer(EventHandler):
         """The serve uri"""
         return f"http://{self.server_host}:{self.server_port}"
 
+    @property
+    def filebase_api(self) -> FilebaseApi:
+        """The served filebase api"""
+        return self._filebaseapi_service
+
+    @property
+    def worker_health(self) -> List[dict]:
+        """The health state of the worker processes (worker mode, see workers)"""
+        if self._supervisor is not None:
+            return self._request_supervisor("health") or []
+        return [] if self._workers is None else self._workers.health(3 * self.worker_heartbeat_interval)
+
+    def _register(self):
+        if not self._is_registered:
+            self._filebaseapi_service.register(self._sanic)
+            self._is_registered = True
+
+    def _create_listen_socket(self, reuse_port: bool = False) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.server_host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            assert hasattr(socket, "SO_REUSEPORT"), Exception("SO_REUSEPORT is not supported on this platform")
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.server_host, self.server_port))
+        sock.listen(100)
+        sock.set_inheritable(True)
+        return sock
+
+    async def _drain_and_stop(self, server, timeout: float):
+        """Stops accepting connections, drains the service (see FilebaseApi.drain) and stops the loop"""
+        try:
+            if server is not None:
+                server.server.close()
+            await self.filebase_api.drain(timeout)
+            # let the closed connections handlers complete.
+            pending = [task for task in list(self.filebase_api.connection_handlers) if not task.done()]
+            if len(pending) > 0:
+                await asyncio.wait(pending, timeout=WEB_SERVER_CLOSE_GRACE)
+        finally:
+            asyncio.get_event_loop().stop()
+
+    def _start_worker(self, workers: "WebServerWorkers", index: int):
+        process = multiprocessing.get_context("fork").Process(
+            target=self._worker_main,
+            args=(workers, index),
+            name=f"WebServer-{self.server_id}-worker-{index}",
+            daemon=True,
+        )
+        workers.ready[index].clear()
+        workers.heartbeats[index] = 0
+        process.start()
+        workers.processes[index] = process
+
+    def _worker_main(self, workers: "WebServerWorkers", index: int):
+        # the worker process (forked).
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        sanic_access_logger.setLevel(self.log_level)
+        sanic_logger.setLevel(self.log_level)
+
+        sock = self._listen_socket if not self.reuse_port else self._create_listen_socket(reuse_port=True)
+        if self.filebase_api.config.watch_files:
+            # threads are not copied when forking.
+            self.filebase_api.start_file_watcher()
+
+        server = loop.run_until_complete(
+            self.sanic.create_server(sock=sock, protocol=FilebaseApiWebSocketProtocol, return_asyncio_server=True)
+        )
+        server.after_start()
+
+        def on_stop_signal():
+            if not self.filebase_api.is_draining:
+                asyncio.ensure_future(self._drain_and_stop(server, workers.drain_timeout.value))
+
+        for sig in [signal.SIGTERM, signal.SIGINT]:
+            loop.add_signal_handler(sig, on_stop_signal)
+        # reloads are handled by the supervisor.
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        def heartbeat():
+            workers.heartbeats[index] = time.time()
+            loop.call_later(self.worker_heartbeat_interval, heartbeat)
+
+        heartbeat()
+        workers.ready[index].set()
+        loop.run_forever()
+
+        server.before_stop()
+        loop.run_until_complete(server.close())
+        server.after_stop()
+        self.filebase_api.stop_file_watcher()
+        self.filebase_api.shutdown_executors(wait=False)
+
+    def _start_worker_group(self, ready_timeout: float = 30) -> "WebServerWorkers":
+        workers = WebServerWorkers(self.workers)
+        for index in range(self.workers):
+            self._start_worker(workers, index)
+        if not workers.wait_ready(ready_timeout):
+            logger.warning(f"Web server {self.server_id} workers did not start within {ready_timeout} seconds")
+        return workers
+
+    def _bind_workers_socket(self):
+        if not self.reuse_port and self._listen_socket is None:
+            self._listen_socket = self._create_listen_socket()
+            self.server_port = self._listen_socket.getsockname()[1]
+
+    def _start_workers(self):
+        assert "fork" in multiprocessing.get_all_start_methods(), Exception(
+            "Web server workers require the fork start method (not supported on this platform)"
+        )
+        assert threading.current_thread() is threading.main_thread(), Exception(
+            "Web server workers must be forked from the main thread (use start with run_async=True)"
+        )
+        self._workers_stop_event.clear()
+
+        # the workers are forked after warm up, and share the prepared service.
+        warm_up = self.filebase_api.warm_up()
+        logger.info(f"Web server {self.server_id} warmed up: {warm_up}")
+        self.filebase_api.stop_file_watcher()
+        self._bind_workers_socket()
+
+        with self._workers_lock:
+            self._workers = self._start_worker_group()
+        logger.info(
+            f"Web server {style.GREEN(self.server_id)} is available @ {style.GREEN(self.uri)}"
+            + f" ({self.workers} workers)"
+        )
+
+    def _process_supervisor_request(self, conn, request: str, timeout: float):
+        if request == "stop":
+            self._workers_stop_timeout = timeout
+            self._workers_stop_event.set()
+        elif request == "reload":
+            conn.send(self.reload(timeout))
+        elif request == "health":
+            conn.send(self.worker_health)
+
+    def _supervise_workers(self, conn=None):
+        # restarts workers that exited unexpectedly and reloads on request (SIGHUP), until stopped. Runs in
+        # the main thread, the workers are never forked from a multi threaded process.
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *args: self._workers_reload_event.set())
+
+        while not self._workers_stop_event.is_set():
+            if conn is None:
+                self._workers_stop_event.wait(self.worker_heartbeat_interval)
+            elif conn.poll(self.worker_heartbeat_interval):
+                try:
+                    request, timeout = conn.recv()
+                except EOFError:
+                    # the server process exited.
+                    self._workers_stop_event.set()
+                    break
+                self._process_supervisor_request(conn, request, timeout)
+            if self._workers_stop_event.is_set():
+                break
+            if self._workers_reload_event.is_set():
+                self._workers_reload_event.clear()
+                self.reload()
+            with self._workers_lock:
+                workers = self._workers
+                for index, process in enumerate(workers.processes):
+                    if not process.is_alive() and not self._workers_stop_event.is_set():
+                        logger.warning(
+                            f"Web server {self.server_id} worker {index} (pid {process.pid}) exited"
+                            + f" with code {process.exitcode}, restarting"
+                        )
+                        self._start_worker(workers, index)
+
+        is_clean = self._stop_workers(self._workers_stop_timeout)
+        if conn is not None:
+            conn.send(is_clean)
+        logger.info(f"Web server {self.server_id} was stopped.")
+
+    def _supervisor_main(self, conn):
+        # the workers supervisor process (forked), single threaded.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *args: self._workers_stop_event.set())
+        self._start_workers()
+        conn.send(self.server_port)
+        self._supervise_workers(conn)
+
+    def _start_supervisor(self):
+        # the workers are supervised (restarted, reloaded) by a forked single threaded process, since
+        # forking from the threads of this process is not safe.
+        self.filebase_api.stop_file_watcher()
+        self._bind_workers_socket()
+        context = multiprocessing.get_context("fork")
+        conn, supervisor_conn = context.Pipe()
+        supervisor = context.Process(
+            target=self._supervisor_main,
+            args=(supervisor_conn,),
+            name=f"WebServer-{self.server_id}-supervisor",
+        )
+        supervisor.start()
+        supervisor_conn.close()
+        if self._listen_socket is not None:
+            # owned by the supervisor.
+            self._listen_socket.close()
+            self._listen_socket = None
+
+        try:
+            self.server_port = conn.recv()
+        except EOFError:
+            supervisor.join()
+            raise Exception(f"Web server {self.server_id} workers supervisor exited with code {supervisor.exitcode}")
+        self._supervisor_conn = conn
+        self._supervisor = supervisor
+        atexit.register(self.stop)
+
+    def _request_supervisor(self, request: str, timeout: float = None):
+        with self._workers_lock:
+            try:
+                self._supervisor_conn.send((request, timeout))
+                return self._supervisor_conn.recv()
+            except (EOFError, OSError):
+                return None
+
+    def reload(self, clean_stop_timeout: float = 10) -> bool:
+        """Zero downtime reload (worker mode): reloads the changed code and templates, starts new workers
+        and then drains and stops the old workers (see FilebaseApi.drain). Send SIGHUP to the server
+        process (or to the workers supervisor process, if started with run_async=True) to reload.
+
+        Args:
+            clean_stop_timeout (float, optional): The max time to wait for the old workers to complete
+                in flight requests and commands. Defaults to 10 seconds.
+
+        Returns:
+            bool: True if the old workers stopped cleanly.
+        """
+        assert self.workers > 1, Exception("Reload requires worker mode (workers > 1)")
+        if self._supervisor is not None:
+            return self._request_supervisor("reload", clean_stop_timeout) or False
+        with self._workers_lock:
+            warm_up = self.filebase_api.warm_up(invalidate=True)
+            logger.info(f"Web server {self.server_id} reloading: {warm_up}")
+            retired = self._workers
+            self._workers = self._start_worker_group()
+        return retired.stop(clean_stop_timeout)
+
+    def _stop_workers(self, timeout: float = None) -> bool:
+        self._workers_stop_event.set()
+        with self._workers_lock:
+            is_clean = self._workers is None or self._workers.stop(timeout)
+        if self._listen_socket is not None:
+            self._listen_socket.close()
+            self._listen_socket = None
+        return is_clean
+
     def _web_server_task(self, register_sys_signals: bool = False):
         sanic_access_logger.setLevel(self.log_level)
         sanic_logger.setLevel(self.log_level)
         logger.info(f"Web server {style.GREEN(self.server_id)} is available @ {style.GREEN(self.uri)}")
 
         self._asyncio_server = self.sanic.create_server(
-            host=self.server_host, port=self.server_port, return_asyncio_server=True
+            host=self.server_host,
+            port=self.server_port,
+            protocol=FilebaseApiWebSocketProtocol,
+            return_asyncio_server=True,
         )
 
         # change the event policy to asyncio
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
         loop = get_active_loop()
+        self._loop = loop
         self._asyncio_server_task = loop.create_task(self._asyncio_server)
 
         # running the asyncio loop
         loop.run_forever()
 
+        server_task = self._asyncio_server_task
+        if server_task.done() and server_task.exception() is None:
+            # complete the closed connections.
+            loop.run_until_complete(server_task.result().close())
+        self.filebase_api.stop_file_watcher()
+        self.filebase_api.shutdown_executors(wait=False)
+
         # self.sanic.run(host=self.server_host, port=self.server_port, register_sys_signals=register_sys_signals)
         logger.info(f"Web server {self.server_id} was stopped.")
 
@@ -86,6 +459,14 @@ class WebServer(EventHandler):
         """
         if self.is_running:
             return
+        self._register()
+        if self.workers > 1:
+            if not run_async:
+                self._start_workers()
+                self._supervise_workers()
+            else:
+                self._start_supervisor()
+            return self
         if not run_async:
             self._web_server_task(register_sys_signals=True)
         else:
@@ -98,7 +479,9 @@ class WebServer(EventHandler):
         return self
 
     def stop(self, clean_stop_timeout: float = 0.5):
-        """Stops the server if running
+        """Stops the server if running. The server stops accepting connections, the active pages are
+        notified (the server_draining event) and the in flight requests and commands are allowed to
+        complete (see FilebaseApi.drain).
 
         Args:
             clean_stop_timeout (float, optional): If not none, will attempt to let the sanic server
@@ -107,13 +490,27 @@ class WebServer(EventHandler):
         """
         if not self.is_running:
             return False
-        self.sanic.stop()
-        self._server_task.join(0.5)
+        if self.workers > 1:
+            supervisor = self._supervisor
+            is_clean = self._request_supervisor("stop", clean_stop_timeout)
+            supervisor.join(clean_stop_timeout)
+            self._supervisor_conn.close()
+            self._supervisor = None
+            self._supervisor_conn = None
+            atexit.unregister(self.stop)
+            return is_clean
+
+        server_task = self._asyncio_server_task
+        server = server_task.result() if server_task is not None and server_task.done() else None
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._drain_and_stop(server, clean_stop_timeout), self._loop)
+        # websocket connections are given a grace period to complete the close handshake.
+        self._server_task.join(None if clean_stop_timeout is None else clean_stop_timeout + WEB_SERVER_CLOSE_GRACE)
         if self.is_running:
+            thread = self._server_task._thread
             logger.warning(
                 f"Web server {self.server_id} did not cleanly stop within {clean_stop_timeout} seconds. "
-                + f"Force stopping thread {self._server_task._action_thread.name} "
-                + f"({self._server_task._action_thread.ident})"
+                + f"Force stopping thread {thread.name} ({thread.ident})"
             )
             return self._server_task.stop()
 
@@ -125,11 +522,18 @@ class WebServer(EventHandler):
         """
         if not self.is_running:
             raise Exception("Cannot join a non running  server")
+        if self._supervisor is not None:
+            return self._supervisor.join(timeout)
         return self._server_task.join(timeout)
 
     @classmethod
     def start_global_web_server(
-        cls, root_path: str, host: str = "localhost", port: int = 8080, throw_error_if_running: bool = False
+        cls,
+        root_path: str,
+        host: str = "localhost",
+        port: int = 8080,
+        throw_error_if_running: bool = False,
+        workers: int = 1,
     ):
         """A helper method. Start a server with the above default params.
 
@@ -139,6 +543,7 @@ class WebServer(EventHandler):
             port (int, optional): The port. Defaults to 8080.
             throw_error_if_running (bool, optional): Throw an error if a global server 
             is already running. Defaults to False.
+            workers (int, optional): The number of worker processes, see WebServer. Defaults to 1.
 
         Raises:
             Exception: [description]
@@ -155,7 +560,7 @@ class WebServer(EventHandler):
         server = (
             cls._global_web_server
             if hasattr(cls, "_global_web_server") and cls._global_web_server is not None
-            else cls(root_path=root_path, host=host, server_id="global", port=port)
+            else cls(root_path=root_path, host=host, server_id="global", port=port, workers=workers)
         )
         cls._global_web_server = server
         if not server.is_running:
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import urllib.request
+import pytest
+import websockets
+from filebase_api import webservice
+from filebase_api.webserver import WebServer
+
+REMOTE_CODE_MODULE = """
+import asyncio
+from filebase_api import fapi_remote
+
+
+@fapi_remote
+async def wait(page, delay):
+    await asyncio.sleep(delay)
+    return delay
+"""
+
+
+def create_site(root_path, files: dict):
+    os.makedirs(os.path.join(root_path, "public"), exist_ok=True)
+    for sub_path, content in files.items():
+        with open(os.path.join(root_path, "public", sub_path), "w") as raw:
+            raw.write(content)
+    return str(root_path)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Web server workers require fork")
+def test_web_server_workers(tmp_path):
+    create_site(tmp_path, {"index.html": "index"})
+
+    server = WebServer(str(tmp_path), port=0, host="127.0.0.1", workers=2, worker_heartbeat_interval=0.1)
+    server.filebase_api.config.watch_files = False
+    server.start()
+    try:
+        with urllib.request.urlopen(server.uri + "/index.html", timeout=5) as rsp:
+            assert rsp.read() == b"index"
+
+        time.sleep(0.2)
+        health = server.worker_health
+        assert len(health) == 2
+        assert all(worker["alive"] and worker["ready"] and worker["healthy"] for worker in health)
+        assert len(set(worker["pid"] for worker in health)) == 2
+
+        # crashed workers are restarted.
+        os.kill(health[0]["pid"], signal.SIGKILL)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            worker = server.worker_health[0]
+            if worker["pid"] != health[0]["pid"] and worker["ready"]:
+                break
+            time.sleep(0.05)
+        assert server.worker_health[0]["pid"] != health[0]["pid"]
+        assert server.worker_health[0]["ready"]
+
+        # zero downtime reload, the new workers serve the changed files.
+        old_pids = set(worker["pid"] for worker in server.worker_health)
+        create_site(tmp_path, {"index.html": "changed"})
+        assert server.reload(5)
+        assert old_pids.isdisjoint(worker["pid"] for worker in server.worker_health)
+        with urllib.request.urlopen(server.uri + "/index.html", timeout=5) as rsp:
+            assert rsp.read() == b"changed"
+    finally:
+        server.stop(5)
+
+    assert not server.is_running
+    for worker in server.worker_health + health:
+        with pytest.raises(ProcessLookupError):
+            os.kill(worker["pid"], 0)
+
+
+def test_web_server_stop_drains_commands(tmp_path):
+    create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    server = WebServer(str(tmp_path), port=get_free_port(), host="127.0.0.1")
+    server.filebase_api.config.watch_files = False
+    server.start()
+    # registered on start, after the config changes.
+    assert server.filebase_api.file_watcher is None
+
+    async def session():
+        url = (
+            f"ws://127.0.0.1:{server.server_port}/{webservice.FILEBASE_API_WEBSOCKET_MARKER}"
+            + f"?{webservice.FILEBASE_API_PAGE_TYPE_MARKER}=index.html"
+        )
+        async with websockets.connect(url) as ws:
+            await ws.send(json.dumps({"wait": [0.3], "__command_id": 0}))
+            await asyncio.sleep(0.05)
+            stopping = asyncio.get_event_loop().run_in_executor(None, server.stop, 5)
+            messages = [json.loads(await asyncio.wait_for(ws.recv(), 5)) for _ in range(2)]
+            await asyncio.wait_for(ws.wait_closed(), 5)
+            await stopping
+            return messages, ws.close_code
+
+    time.sleep(0.2)
+    (draining, rsp), close_code = asyncio.run(session())
+    assert draining["__event_name"] == "server_draining"
+    assert rsp == {"wait": 0.3, "__command_id": 0}
+    assert close_code == 1012
+    assert not server.is_running
+
+
+def test_web_server_stop_releases_resources(tmp_path):
+    create_site(tmp_path, {"index.html": "index"})
+    server = WebServer(str(tmp_path), port=get_free_port(), host="127.0.0.1")
+    server.filebase_api.config.watch_files = True
+    server.start()
+    time.sleep(0.2)
+    with urllib.request.urlopen(server.uri + "/index.html", timeout=5) as rsp:
+        assert rsp.read() == b"index"
+    assert server.filebase_api.file_watcher.is_running
+
+    server.stop(5)
+    assert not server.is_running
+    assert not server.filebase_api.file_watcher.is_running
+    assert server.filebase_api.io_executor._pool is None
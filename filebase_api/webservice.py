@@ -1,4 +1,5 @@
 import os
+import time
 import json
 import traceback
 import inspect
@@ -7,7 +8,8 @@ import jinja2
 import sanic.response as response
 
 from weakref import WeakSet
-from typing import Set
+from functools import partial
+from typing import BinaryIO, Callable, Dict, Set, List, Tuple, Union
 
 from sanic import Sanic
 from sanic.request import Request
@@ -17,8 +19,7 @@ from sanic.exceptions import NotFound, ServerError
 from concurrent.futures import CancelledError
 
 from zcommon.shell import logger
-from zcommon.fs import strip_path_extention
-from zcommon.textops import json_dump_with_types
+from zcommon.textops import create_unique_string_id
 from zthreading.events import AsyncEventHandler
 
 from filebase_api.helpers import (
@@ -27,13 +28,43 @@ from filebase_api.helpers import (
     FilebaseApiWebSocket,
     FilebaseApiPage,
     FilebaseApiCoreRoutes,
+    FilebaseApiClientBundle,
+    FilebaseApiPageCachePolicy,
+    FilebaseApiRemoteMethodExecutionMode,
     FILEBASE_API_CORE_ROUTES_MARKER,
     FILEBASE_API_WEBSOCKET_MARKER,
     FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER,
+    FILEBASE_API_CLIENT_BUNDLE_MARKER,
     FILEBASE_API_PAGE_TYPE_MARKER,
+    FILEBASE_API_SERVER_DRAINING_EVENT_NAME,
 )
 
 from filebase_api.templates import FilebaseTemplateService
+from filebase_api.routes import FilebaseApiRouteIndex, FilebaseApiRoute
+from filebase_api.cache import FilebaseLRUCache
+from filebase_api.commands import FilebaseApiCommandDispatcher, invoke_remote_method_in_process
+from filebase_api.executors import FilebaseExecutor, FilebaseExecutorOverloadedException
+from filebase_api.streams import FilebaseApiStream, iterate_generator_async
+from filebase_api.serialization import FilebaseApiCodec, create_codecs
+from filebase_api.pubsub import FilebaseApiPubSub
+from filebase_api.modules import FilebaseApiModuleRegistry
+from filebase_api.calls import FilebaseApiCallException
+from filebase_api.transport import FilebaseApiDeflateExtension
+from filebase_api.responses import (
+    compute_etag,
+    compute_file_etag,
+    compute_stat_etag,
+    format_http_date,
+    is_not_modified,
+    select_encoding,
+    compress,
+    variant_etag,
+    open_file,
+    read_file_range,
+    is_range_allowed,
+    FilebaseContentRange,
+    file_stream,
+)
 
 
 class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
@@ -64,7 +95,38 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
         self._uri = uri.strip().strip("/")
         self._name = name
         self._active_pages = WeakSet()
+        self._connection_handlers = WeakSet()
+        self._command_dispatchers = WeakSet()
+        self._requests_in_flight = 0
+        self._is_draining = False
         self._core_routes = FilebaseApiCoreRoutes()
+        self._route_index = FilebaseApiRouteIndex(self.src_path, self.config).build()
+        self._page_cache = FilebaseLRUCache(
+            self.config.page_cache_size, self.config.page_cache_max_bytes, size_of=lambda val: len(val[1])
+        )
+        self._page_id_placeholder = f"__filebase_api_page_id_{create_unique_string_id()}__"
+        self._file_etags = FilebaseLRUCache(4096)
+        self._compressed_variants = FilebaseLRUCache(None, self.config.compression_cache_max_bytes)
+        self._client_bundles = FilebaseLRUCache(1024)
+        self._codecs = create_codecs(self.config.websocket_codecs)
+        self._pubsub = FilebaseApiPubSub()
+        self._module_registry = FilebaseApiModuleRegistry()
+        self._io_executor = FilebaseExecutor(
+            max_workers=self.config.io_threads,
+            max_queue=self.config.io_max_queue,
+            name=f"{self.__class__.__name__}-io",
+        )
+        self._remote_thread_executor = FilebaseExecutor(
+            max_workers=self.config.remote_threads,
+            max_queue=self.config.remote_threads_max_queue,
+            name=f"{self.__class__.__name__}-remote",
+        )
+        self._remote_process_executor = FilebaseExecutor(
+            max_workers=self.config.remote_processes or os.cpu_count(),
+            max_queue=self.config.remote_processes_max_queue,
+            name=f"{self.__class__.__name__}-remote-process",
+            use_processes=True,
+        )
 
     @property
     def config(self) -> FilebaseApiConfig:
@@ -76,13 +138,251 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
         """The service core routes"""
         return self._core_routes
 
+    @property
+    def route_index(self) -> FilebaseApiRouteIndex:
+        """The in memory index of the public routes"""
+        return self._route_index
+
+    @property
+    def page_cache(self) -> FilebaseLRUCache:
+        """The rendered pages output cache, see FilebaseApiPageCachePolicy"""
+        return self._page_cache
+
+    @property
+    def codecs(self) -> Dict[str, FilebaseApiCodec]:
+        """The websocket message codecs by name, see FilebaseApiConfig.websocket_codecs"""
+        return self._codecs
+
+    @property
+    def module_registry(self) -> FilebaseApiModuleRegistry:
+        """The loaded code modules"""
+        return self._module_registry
+
+    @property
+    def pubsub(self) -> FilebaseApiPubSub:
+        """The topics publish/subscribe registry"""
+        return self._pubsub
+
+    def publish(self, topic: str, payload, coalesce_key=None) -> int:
+        """Publishes a message to all the pages subscribed to the topic (from python, FilebaseApiPage.subscribe,
+        or the client, fapi.subscribe). The message is encoded once (per codec). Thread safe.
+        Returns the number of subscribers.
+
+        Args:
+            topic (str): The topic.
+            payload (any): The message payload.
+            coalesce_key (any, optional): With the coalesce overflow policy (pubsub_overflow_policy), a queued
+                message with the same key is replaced. Defaults to the topic.
+        """
+        return self.pubsub.publish(topic, payload, coalesce_key)
+
+    def _select_codec(self, websocket: WebSocketConnection) -> FilebaseApiCodec:
+        subprotocol = getattr(websocket, "subprotocol", None) or ""
+        for codec in self.codecs.values():
+            if codec.subprotocol == subprotocol:
+                return codec
+        return self.codecs["json"]
+
+    @property
+    def io_executor(self) -> FilebaseExecutor:
+        """The executor of static file work (etag hashing, file reads and compression) and code module imports"""
+        return self._io_executor
+
+    @property
+    def remote_thread_executor(self) -> FilebaseExecutor:
+        """The executor of synchronous remote methods (thread execution mode)"""
+        return self._remote_thread_executor
+
+    @property
+    def remote_process_executor(self) -> FilebaseExecutor:
+        """The executor of remote methods in process execution mode"""
+        return self._remote_process_executor
+
+    @property
+    def executor_stats(self) -> dict:
+        """The counters (in flight, queue depth ...) of the api executors"""
+        return {
+            "render": self.render_executor.stats,
+            "io": self.io_executor.stats,
+            "remote_threads": self.remote_thread_executor.stats,
+            "remote_processes": self.remote_process_executor.stats,
+        }
+
+    def shutdown_executors(self, wait: bool = True):
+        """Shuts down the api executors pools (see executor_stats), new pools are created on next use.
+
+        Args:
+            wait (bool, optional): If true, wait for the running calls to complete. Defaults to True.
+        """
+        for executor in [
+            self.render_executor,
+            self.io_executor,
+            self.remote_thread_executor,
+            self.remote_process_executor,
+        ]:
+            executor.shutdown(wait=wait)
+
+    @property
+    def websocket_stats(self) -> dict:
+        """The outbound queues counters (depth, dropped ...) of the active websocket connections"""
+        queues = [page.websocket.outbound_stats for page in list(self.active_pages) if page.websocket is not None]
+        return {
+            "connections": len(queues),
+            "outbound_depth": sum(stats["outbound"]["depth"] for stats in queues),
+            "publish_depth": sum(stats["publish"]["depth"] for stats in queues),
+            "max_depth": max([stats["outbound"]["max_depth"] for stats in queues], default=0),
+            "dropped": sum(stats["outbound"]["dropped"] + stats["publish"]["dropped"] for stats in queues),
+            "coalesced": sum(stats["outbound"]["coalesced"] + stats["publish"]["coalesced"] for stats in queues),
+            "lagging": sum(1 for stats in queues if stats["disconnected_as_lagging"]),
+        }
+
+    def _on_source_files_changed(self, changed: List[str]):
+        super()._on_source_files_changed(changed)
+        src_path = self.src_path + os.sep
+        changed_sources = [fpath for fpath in changed if fpath.startswith(src_path)]
+        if len(changed_sources) > 0:
+            self.route_index.update(changed_sources)
+        changed_modules = [fpath for fpath in changed if fpath.endswith(self.config.module_file_marker)]
+        # modules under removed (or moved) directories.
+        changed_modules += [
+            module_path
+            for module_path in self.module_registry.modules.keys()
+            if any(module_path.startswith(fpath + os.sep) for fpath in changed)
+        ]
+        if len(changed_modules) > 0:
+            self.module_registry.reload(changed_modules)
+            # rendered pages print the client bundle url of the module version.
+            self.page_cache.clear()
+            self._client_bundles.clear()
+
+    def warm_up(self, invalidate: bool = False) -> dict:
+        """Prepares the service before serving (e.g. before forking the web server worker processes, which
+        then share the prepared state): rebuilds the route index, compiles the templates and loads the code
+        modules. Returns the number of routes, templates and modules loaded.
+
+        Args:
+            invalidate (bool, optional): If true, clear the templates and pages caches first (reload the
+                changed code). Defaults to False.
+        """
+        if invalidate:
+            self.template_cache.clear()
+            self.page_cache.clear()
+            self._file_etags.clear()
+            self._compressed_variants.clear()
+            self._client_bundles.clear()
+        self.route_index.build()
+        templates = self.warm_up_templates()
+        modules = self.load_code_modules()
+        return {"routes": len(self.route_index.routes), "templates": templates, "modules": modules}
+
+    def load_code_modules(self) -> int:
+        """Loads all the code modules in the route index (see module_registry). Returns the number
+        of modules loaded."""
+        return self.module_registry.load(
+            self.route_index.list_module_paths(), threads=self.config.preload_code_modules_threads
+        )
+
+    @property
+    def is_draining(self) -> bool:
+        """True if the service is draining (see drain), new websocket connections are refused"""
+        return self._is_draining
+
+    @property
+    def in_flight(self) -> dict:
+        """The number of requests, websocket commands, streams and queued outbound messages in progress"""
+        pages = [page for page in list(self.active_pages) if page.websocket is not None]
+        return {
+            "requests": self._requests_in_flight,
+            "commands": sum(dispatcher.in_flight for dispatcher in list(self._command_dispatchers)),
+            "streams": sum(len(page.websocket.streams) for page in pages),
+            "outbound": sum(page.websocket.outbound_queue.depth for page in pages),
+        }
+
+    async def drain(self, timeout: float = None, close_websockets: bool = True) -> bool:
+        """Drains the service before stopping: refuses new websocket connections, notifies the active pages
+        (the server_draining event, bound to the client) and waits for the in flight requests, commands
+        and streams to complete. Returns true if everything completed within the timeout.
+
+        Args:
+            timeout (float, optional): The max time to wait (seconds), if None wait forever. Defaults to None.
+            close_websockets (bool, optional): If true, close the websocket connections when done
+                (code 1012, service restart). Defaults to True.
+        """
+        self._is_draining = True
+        pages = [page for page in list(self.active_pages) if page.websocket is not None]
+        for page in pages:
+            try:
+                await page.emit(FILEBASE_API_SERVER_DRAINING_EVENT_NAME, timeout=timeout)
+            except Exception as ex:
+                logger.error(f"Error while notifying page {page.sub_path} on drain: {ex}")
+
+        deadline = None if timeout is None else time.time() + timeout
+        drained = True
+        while sum(self.in_flight.values()) > 0:
+            if deadline is not None and time.time() > deadline:
+                drained = False
+                logger.warning(f"Drain timed out with work in flight: {self.in_flight}")
+                break
+            await asyncio.sleep(0.05)
+
+        if close_websockets and len(pages) > 0:
+            closing = [
+                asyncio.ensure_future(page.websocket.websocket.close(code=1012, reason="Server restarting"))
+                for page in pages
+            ]
+            # do not wait long for clients to complete the close handshake.
+            close_deadline = time.time() + 1
+            await asyncio.wait(closing, timeout=1)
+            # let the connection handlers clean up.
+            while len(self.active_pages) > 0 and time.time() < close_deadline:
+                await asyncio.sleep(0.01)
+        return drained
+
+    @property
+    def connection_handlers(self) -> Set[asyncio.Task]:
+        """The running websocket connection handler tasks (weak ref set)"""
+        return self._connection_handlers
+
     @property
     def active_pages(self) -> Set[FilebaseApiWebSocket]:
         """The currently active pages in memory (weak ref set)"""
         return self._active_pages
 
+    def get_client_bundle(self, page: FilebaseApiPage) -> FilebaseApiClientBundle:
+        """Returns the client bundle of the page (see FilebaseApiClientBundle), generated once per
+        code module version.
+
+        Args:
+            page (FilebaseApiPage): The page.
+        """
+        module_info = page.module_info if page.has_code_module and page.expose_client_js_bindings else None
+        # by module version, the bundles do not reference the (replaced) modules.
+        key = (module_info.module_path, self.module_registry.version) if module_info is not None else None
+        bundle = self._client_bundles.get(key)
+        if bundle is None:
+            bundle = FilebaseApiClientBundle(
+                self.core_routes.client_source,
+                module_info.client_bindings if module_info is not None else None,
+                minify=self.config.client_bundle_minify,
+            )
+            self._client_bundles.set(key, bundle)
+        return bundle
+
     @jinja2.contextfunction
-    def _print_filebase_api_scripts(self, context):
+    def _print_filebase_api_scripts(self, context, inline: bool = None):
+        """Prints the filebase api client scripts (the template global filebase_api).
+
+        Args:
+            inline (bool, optional): If true, print the client bundle inline and open the websocket at once
+                (saves the scripts requests). If None, the config client_bundle_inline. Defaults to None.
+        """
+        page: FilebaseApiPage = context.get("page")
+        if self.config.client_bundle and isinstance(page, FilebaseApiPage):
+            bundle = self.get_client_bundle(page)
+            if inline if inline is not None else self.config.client_bundle_inline:
+                return bundle.get_inline_script()
+            return f'<script language="javascript" src="{bundle.get_url(page.sub_path)}"></script>'
+
         scripts = self.core_routes.keys()
 
         def make_script(filepath: str, info: str = None):
@@ -95,147 +395,548 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
         super()._load_globals()
         self.attach_method(self._print_filebase_api_scripts, "filebase_api")
 
-    def _load_module_info_from_subpath(self, sub_path: str) -> FilebaseApiModuleInfo:
+    async def _load_module_info_from_subpath(self, sub_path: str) -> FilebaseApiModuleInfo:
         if sub_path is None:
             return None
 
-        sub_path = sub_path.strip().lstrip("/")
-
-        if not sub_path.endswith(self.config.module_file_marker):
-            file_path = self.resolve_path(strip_path_extention(sub_path) + self.config.module_file_marker)
-        else:
-            if not self.config.is_remote_access_allowed(sub_path):
-                return None
-
-            file_path = self.resolve_path(sub_path)
-
-        if not os.path.isfile(file_path):
+        file_path = self.route_index.get_module_path(sub_path)
+        if file_path is None:
             return None
 
         # loading the websocket commands
-        return FilebaseApiModuleInfo.load_from_path(file_path)
+        return await self.module_registry.get_async(file_path, self.io_executor)
 
-    def _get_page_from_request(self, rqst: Request, sub_path: str = None):
+    async def _get_page_from_request(self, rqst: Request, sub_path: str = None):
         sub_path = dict(rqst.query_args).get(FILEBASE_API_PAGE_TYPE_MARKER) or sub_path
         if sub_path is None:
             return None
-        return FilebaseApiPage(self, sub_path, self._load_module_info_from_subpath(sub_path), rqst)
+        return FilebaseApiPage(self, sub_path, await self._load_module_info_from_subpath(sub_path), rqst)
 
     async def _process_filebase_request(self, rqst: Request, sub_path: str = None):
-        page = self._get_page_from_request(rqst, sub_path)
+        page = await self._get_page_from_request(rqst, sub_path)
         rsp = await self._process_filebase_page(page, sub_path)
         return rsp
 
     async def _process_filebase_page(self, page: FilebaseApiPage, sub_path: str) -> response.HTTPResponse:
         if page is None:
-            for index_path in self.config.index_files:
-                if os.path.exists(self.resolve_path(index_path)):
-                    return response.redirect(index_path)
+            if self.route_index.index_redirect is not None:
+                return response.redirect(self.route_index.index_redirect)
             raise NotFound("Not found or blocked uri")
 
         if sub_path.startswith(FILEBASE_API_CORE_ROUTES_MARKER + "/"):
-            sub_path = sub_path[len(FILEBASE_API_CORE_ROUTES_MARKER + "/") :]  # noqa: 203
-            mime_type = self.config.mime_types.match_mime_type(sub_path)
+            return await self._process_core_route(page, sub_path)
 
-            core_route_raw = None
+        route = self.route_index.get(sub_path)
+        if route is None or not self.route_index.is_remote_access_allowed(route):
+            raise NotFound("Not found or blocked uri")
 
-            if sub_path == FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER:
-                core_route_raw = (
-                    "\n".join(page.websocket_javascript_command_functions.values())
-                    if page.has_code_module and page.expose_client_js_bindings
-                    else "// no available bindings"
-                )
-            elif sub_path in self._core_routes:
-                core_route_raw = self._core_routes[sub_path]
+        if page.has_code_module and "on_load" in page.websocket_command_functions:
+            page.websocket_command_functions.get("on_load")(page)
 
-            if core_route_raw is None:
-                raise NotFound("Core route not found")
-            return response.text(core_route_raw, content_type=mime_type)
+        # regular files.
+        if not route.is_jinja:
+            return await self._create_file_response(page.request, route)
+
+        return await self._create_text_response(
+            page.request, route.sub_path, await self._render_page(route, page), route.mime_type
+        )
+
+    async def _process_core_route(self, page: FilebaseApiPage, sub_path: str) -> response.HTTPResponse:
+        core_sub_path = sub_path[len(FILEBASE_API_CORE_ROUTES_MARKER + "/") :]  # noqa: 203
+        mime_type = self.config.mime_types.match_mime_type(core_sub_path)
 
-        file_path = self.resolve_path(sub_path)
-        mime_type = self.config.mime_types.match_mime_type(file_path)
+        core_route_raw = None
+        etag = None
+        last_modified = None
+        cache_control = None
 
-        if (
-            not os.path.isfile(file_path)
-            or self.config.private_path_marker.test(sub_path)
-            or not self.config.is_remote_access_allowed(sub_path)
-        ):
+        if core_sub_path == FILEBASE_API_REMOTE_METHODS_COLLECTION_MARKER:
+            core_route_raw = (
+                page.module_info.client_bindings
+                if page.has_code_module and page.expose_client_js_bindings
+                else "// no available bindings"
+            )
+        elif core_sub_path.startswith(FILEBASE_API_CLIENT_BUNDLE_MARKER + "."):
+            bundle = self.get_client_bundle(page)
+            core_route_raw = bundle.source
+            etag = bundle.etag
+            if core_sub_path == bundle.filename:
+                # otherwise an old version url, not cached.
+                cache_control = self.config.client_bundle_cache_control
+        elif core_sub_path in self._core_routes:
+            core_route_raw = self._core_routes[core_sub_path]
+            etag = self._core_routes.etags.get(core_sub_path)
+            last_modified = self._core_routes.loaded_at
+
+        if core_route_raw is None:
+            raise NotFound("Core route not found")
+        return await self._create_text_response(
+            page.request,
+            sub_path,
+            core_route_raw,
+            mime_type,
+            etag,
+            last_modified,
+            cache_compressed=etag is not None,
+            cache_control=cache_control,
+        )
+
+    def _create_cache_headers(
+        self,
+        sub_path: str,
+        etag: str = None,
+        last_modified: float = None,
+        encoding: str = None,
+        vary: bool = False,
+        cache_control: str = None,
+    ) -> dict:
+        headers = dict()
+        if etag is not None:
+            headers["ETag"] = etag
+        if last_modified is not None:
+            headers["Last-Modified"] = format_http_date(last_modified)
+        cache_control = cache_control or self.config.match_cache_control(sub_path)
+        if cache_control is not None:
+            headers["Cache-Control"] = cache_control
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if vary or encoding is not None:
+            headers["Vary"] = "Accept-Encoding"
+        return headers
+
+    async def _compress(self, data: bytes, encoding: str, cache_key=None) -> bytes:
+        """Compresses the data (off the event loop). If a cache key is provided, the
+        compressed variant is cached.
+        """
+        if cache_key is not None:
+            compressed = self._compressed_variants.get((cache_key, encoding))
+            if compressed is not None:
+                return compressed
+
+        compressed = await self.io_executor.run(compress, data, encoding, self.config.compress_level)
+
+        if cache_key is not None:
+            self._compressed_variants.set((cache_key, encoding), compressed)
+        return compressed
+
+    async def _create_text_response(
+        self,
+        rqst: Request,
+        sub_path: str,
+        text: str,
+        mime_type: str,
+        etag: str = None,
+        last_modified: float = None,
+        cache_compressed: bool = False,
+        cache_control: str = None,
+    ) -> response.HTTPResponse:
+        """Creates a text response with validators (etag, last modified), compressed by the
+        request Accept-Encoding. Returns 304 (not modified) if the request validators match.
+        """
+        etag = etag or compute_etag(text)
+        data = text.encode("utf-8")
+
+        is_compressible = self.config.is_compressible(mime_type, len(data))
+        encoding = select_encoding(rqst.headers.get("Accept-Encoding")) if is_compressible else None
+        response_etag = variant_etag(etag, encoding)
+
+        headers = self._create_cache_headers(
+            sub_path, response_etag, last_modified, encoding, is_compressible, cache_control
+        )
+        if is_not_modified(rqst, response_etag, last_modified):
+            return response.HTTPResponse(status=304, headers=headers)
+
+        if encoding is not None:
+            data = await self._compress(data, encoding, etag if cache_compressed else None)
+        return response.raw(data, content_type=mime_type, headers=headers)
+
+    async def _get_file_etag(self, route: FilebaseApiRoute, raw: BinaryIO, mtime: float, size: int) -> str:
+        """Returns the file etag (content hash), computed once per file version. Large (streamed) files
+        are not hashed, the etag is computed from the file modified time and size.
+
+        Args:
+            route (FilebaseApiRoute): The file route.
+            raw (BinaryIO): The opened file.
+            mtime (float): The opened file modified time.
+            size (int): The opened file size.
+        """
+        if size >= self.config.stream_min_size:
+            return compute_stat_etag(mtime, size)
+
+        etag_key = (route.file_path, mtime, size)
+        etag = self._file_etags.get(etag_key)
+        if etag is None:
+            etag = await self.io_executor.run(compute_file_etag, raw)
+            self._file_etags.set(etag_key, etag)
+        return etag
+
+    async def _create_file_response(self, rqst: Request, route: FilebaseApiRoute) -> response.HTTPResponse:
+        """Creates a static file response with validators (etag, last modified), compressed by the
+        request Accept-Encoding, or a partial response (206) by the request Range. Returns 304 (not modified)
+        if the request validators match. Large files are streamed.
+        """
+        # the validators and sizes are taken from the opened file, the route index may be stale.
+        try:
+            raw, stat = await self.io_executor.run(open_file, route.file_path)
+        except FileNotFoundError:
             raise NotFound("Not found or blocked uri")
 
-        if page.has_code_module and "on_load" in page.websocket_command_functions:
-            page.websocket_command_functions.get("on_load")(page)
+        try:
+            rsp = await self._create_opened_file_response(rqst, route, raw, stat.st_mtime, stat.st_size)
+        except BaseException:
+            raw.close()
+            raise
+        if not isinstance(rsp, response.StreamingHTTPResponse):
+            # the streamed responses close the file when done.
+            raw.close()
+        return rsp
 
-        # regular files.
-        if not self.config.jinja_files.test(file_path):
-            return await response.file(file_path, mime_type=mime_type)
+    async def _create_opened_file_response(
+        self, rqst: Request, route: FilebaseApiRoute, raw: BinaryIO, mtime: float, size: int
+    ) -> response.HTTPResponse:
+        etag = await self._get_file_etag(route, raw, mtime, size)
 
-        return response.text(self.render_file(file_path, page=page), content_type=mime_type)
+        range_header = rqst.headers.get("Range")
+        if range_header is not None and not is_range_allowed(rqst, etag, mtime):
+            range_header = None
+
+        encoding = None
+        precompressed_path = None
+        is_compressible = False
+        if self.config.compression_enabled and range_header is None:
+            accept_encoding = rqst.headers.get("Accept-Encoding")
+            encoding = select_encoding(accept_encoding, list(route.precompressed.keys()))
+            if encoding is not None:
+                precompressed_path = route.precompressed[encoding]
+            else:
+                is_compressible = self.config.is_compressible(route.mime_type, size)
+                encoding = select_encoding(accept_encoding) if is_compressible else None
+
+        response_etag = variant_etag(etag, encoding)
+        headers = self._create_cache_headers(
+            route.sub_path, response_etag, mtime, encoding, is_compressible or len(route.precompressed) > 0
+        )
+        headers["Accept-Ranges"] = "bytes"
+        if is_not_modified(rqst, response_etag, mtime):
+            return response.HTTPResponse(status=304, headers=headers)
+
+        if precompressed_path is not None:
+            return await response.file(precompressed_path, mime_type=route.mime_type, headers=headers)
+
+        if encoding is not None:
+            data = self._compressed_variants.get((etag, encoding))
+            if data is None:
+                data = await self.io_executor.run(read_file_range, raw, 0, size)
+                data = await self._compress(data, encoding, etag)
+            return response.raw(data, content_type=route.mime_type, headers=headers)
+
+        content_range = None
+        if range_header is not None:
+            content_range = FilebaseContentRange.parse(range_header, size)
+            if content_range is not None and not content_range.is_satisfiable:
+                return response.HTTPResponse(status=416, headers={"Content-Range": f"bytes */{size}"})
+
+        if (content_range.size if content_range is not None else size) >= self.config.stream_min_size:
+            return file_stream(
+                raw,
+                route.mime_type,
+                size,
+                headers=headers,
+                content_range=content_range,
+                chunk_size=self.config.stream_chunk_size,
+            )
+
+        if content_range is None:
+            data = await self.io_executor.run(read_file_range, raw, 0, size)
+            return response.raw(data, content_type=route.mime_type, headers=headers)
+        data = await self.io_executor.run(read_file_range, raw, content_range.start, content_range.size)
+        headers["Content-Range"] = f"bytes {content_range.start}-{content_range.end}/{content_range.total}"
+        return response.raw(data, status=206, content_type=route.mime_type, headers=headers)
+
+    def _get_page_cache_policy(self, route: FilebaseApiRoute, page: FilebaseApiPage) -> FilebaseApiPageCachePolicy:
+        if page.has_code_module and page.module_info.cache_policy is not None:
+            return page.module_info.cache_policy
+        return self.config.match_page_cache_policy(route.sub_path)
+
+    def _render_cached_page(self, route: FilebaseApiRoute, page: FilebaseApiPage, policy: FilebaseApiPageCachePolicy):
+        # executed in the render executor, the template and dependency checks may stat, read and compile files.
+        template_version = self.template_cache.get_file_slot(route.file_path).version
+        cache_key = (route.file_path, template_version, page.sub_path, policy.create_vary_key(page.request))
+        cached = self.page_cache.get(cache_key)
+
+        # (cached at, rendered, imported files)
+        if cached is not None and not policy.is_expired(cached[0]) and not self.is_dependency_changed(cached[2]):
+            return cached[1]
+
+        # rendered with a placeholder page id, which is replaced per page.
+        page_id = page._page_id
+        page._page_id = self._page_id_placeholder
+        try:
+            rendered, dependencies = self.render_file_with_dependencies(route.file_path, page=page)
+        finally:
+            page._page_id = page_id
+        self.page_cache.set(cache_key, (time.monotonic(), rendered, dependencies))
+        return rendered
+
+    async def _render_page(self, route: FilebaseApiRoute, page: FilebaseApiPage) -> str:
+        """Renders a page template, using the page output cache if the page has a cache policy.
+        """
+        policy = self._get_page_cache_policy(route, page)
+        if policy is None:
+            return await self.render_file_async(route.file_path, page=page)
+
+        rendered = await self.render_executor.run(self._render_cached_page, route, page, policy)
+        return rendered.replace(self._page_id_placeholder, page.page_id)
+
+    def _get_remote_method_execution_mode(
+        self, page: FilebaseApiPage, name: str
+    ) -> FilebaseApiRemoteMethodExecutionMode:
+        config = page.module_info.get_module_command_handler_config(name)
+        return (config.execution_mode if config is not None else None) or self.config.remote_method_execution_mode
+
+    async def _invoke_remote_method(self, page: FilebaseApiPage, name: str, command, args: list, kwargs: dict):
+        if inspect.iscoroutinefunction(command):
+            return await command(page, *args, **kwargs)
+        if inspect.isasyncgenfunction(command):
+            # not streamed, collect the chunks.
+            return [chunk async for chunk in command(page, *args, **kwargs)]
+
+        execution_mode = self._get_remote_method_execution_mode(page, name)
+        if execution_mode == FilebaseApiRemoteMethodExecutionMode.process:
+            return await self.remote_process_executor.run(
+                invoke_remote_method_in_process, page.module_info.module_path, name, args, kwargs
+            )
+
+        call = partial(command, page, *args, **kwargs)
+        if inspect.isgeneratorfunction(command):
+            generate = call
+
+            def call():
+                return list(generate())
+
+        if execution_mode == FilebaseApiRemoteMethodExecutionMode.inline:
+            return call()
+        return await self.remote_thread_executor.run(call)
+
+    def _iterate_remote_method(self, page: FilebaseApiPage, name: str, command, args: list, kwargs: dict):
+        if inspect.isasyncgenfunction(command):
+            return command(page, *args, **kwargs)
+        if inspect.isgeneratorfunction(command):
+            executor = (
+                None
+                if self._get_remote_method_execution_mode(page, name) == FilebaseApiRemoteMethodExecutionMode.inline
+                else self.remote_thread_executor
+            )
+            return iterate_generator_async(command(page, *args, **kwargs), executor)
+
+        async def iterate_result():
+            yield await self._invoke_remote_method(page, name, command, args, kwargs)
+
+        return iterate_result()
+
+    async def _on_websocket_command_error(self, ex: Exception):
+        await self.emit("websocket_error", ex)
+        if not isinstance(ex, FilebaseApiCallException):
+            # bad call arguments are client errors.
+            traceback.print_exception(type(ex), ex, ex.__traceback__)
+        logger.error(str(ex))
+
+    def _resolve_remote_method(self, page: FilebaseApiPage, name: str, args) -> Tuple[Callable, list, dict]:
+        plan = page.module_info.call_plans.get(name) if page.has_code_module else None
+        if plan is None:
+            raise Exception("Command not found: " + name)
+
+        args, kwargs = plan.bind(args)
+        return plan.method, args, kwargs
+
+    async def _execute_remote_method(self, page: FilebaseApiPage, name: str, args):
+        command, args, kwargs = self._resolve_remote_method(page, name, args)
+        return await self._invoke_remote_method(page, name, command, args, kwargs)
+
+    async def _start_websocket_stream(self, page: FilebaseApiPage, data: dict) -> dict:
+        """Starts streaming the result chunks of a remote method, see FilebaseApiStream. The command
+        ({name: args, "__command_id": id, "__stream": credits}) must call a single remote method.
+        Returns None, or the stream end message if the stream could not be started.
+        """
+        command_id = data.get("__command_id", "")
+        try:
+            command_names = [name for name in data.keys() if name not in ("__command_id", "__stream")]
+            assert len(command_names) == 1, ValueError("A streamed command must call a single remote method")
+            name = command_names[0]
+            command, args, kwargs = self._resolve_remote_method(page, name, data[name])
+
+            credits = data["__stream"]
+            if not isinstance(credits, int) or isinstance(credits, bool):
+                credits = None
+
+            async def send_message(message: dict):
+                await page.websocket.send(message, as_json=True)
+
+            page.websocket.start_stream(
+                FilebaseApiStream(
+                    command_id,
+                    self._iterate_remote_method(page, name, command, args, kwargs),
+                    send=send_message,
+                    credits=credits,
+                )
+            )
+            return None
+        except Exception as ex:
+            await self._on_websocket_command_error(ex)
+            return {"__command_id": command_id, "__end": True, "__count": 0, "__error": str(ex)}
+
+    async def _execute_websocket_command(self, page: FilebaseApiPage, data: dict) -> dict:
+        """Executes a single websocket command ({name: args, ..., "__command_id": id}). The named remote
+        methods are executed concurrently, and failures are reported per method (__errors). __error is set
+        if all the methods failed.
+
+        Args:
+            page (FilebaseApiPage): The websocket page.
+            data (dict): The command.
+        """
+        if not isinstance(data, dict):
+            ex = ValueError("A websocket command must use json to communicate")
+            await self._on_websocket_command_error(ex)
+            return {"__error": str(ex), "__command_id": ""}
+
+        if "__stream" in data:
+            return await self._start_websocket_stream(page, data)
+
+        command_id = data.get("__command_id", "")
+        command_names = [name for name in data.keys() if name != "__command_id"]
+
+        async def execute(name: str):
+            try:
+                return await self._execute_remote_method(page, name, data[name]), None
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                await self._on_websocket_command_error(ex)
+                return None, ex
+
+        if len(command_names) == 1:
+            results = [await execute(command_names[0])]
+        else:
+            results = await asyncio.gather(*[execute(name) for name in command_names])
+
+        rsp = dict()
+        errors = dict()
+        for name, (rslt, ex) in zip(command_names, results):
+            if ex is not None:
+                errors[name] = str(ex)
+            else:
+                rsp[name] = rslt
+
+        if len(errors) > 0:
+            rsp["__errors"] = errors
+            if len(errors) == len(command_names):
+                rsp["__error"] = "; ".join(errors.values())
+
+        rsp["__command_id"] = command_id
+        return rsp
+
+    async def _process_websocket_command(self, page: FilebaseApiPage, data: Union[str, dict]) -> dict:
+        """Executes a websocket command message, and returns the response to send. A batch message
+        ({"__batch": [command, ...]}) executes its commands concurrently and is answered with a
+        single batch message ({"__batch": [response, ...]}).
+
+        Args:
+            page (FilebaseApiPage): The websocket page.
+            data (Union[str, dict]): The command message (json or parsed)
+        """
+        try:
+            if isinstance(data, str):
+                data = json.loads(data)
+            assert isinstance(data, dict), ValueError("A websocket command must use json to communicate")
+        except Exception as ex:
+            await self._on_websocket_command_error(ex)
+            return {"__error": str(ex), "__command_id": ""}
+
+        if "__batch" not in data:
+            return await self._execute_websocket_command(page, data)
+
+        batch = data["__batch"]
+        if not isinstance(batch, list):
+            ex = ValueError("A websocket command batch must be a list of commands")
+            await self._on_websocket_command_error(ex)
+            return {"__error": str(ex), "__command_id": ""}
+
+        responses = await asyncio.gather(*[self._execute_websocket_command(page, cmnd) for cmnd in batch])
+        return {"__batch": [rsp for rsp in responses if rsp is not None]}
+
+    async def _process_websocket_control_message(self, page: FilebaseApiPage, message: dict) -> bool:
+        """Processes a client control message (streams flow control, pub/sub subscriptions).
+        Returns false if the message is not a control message.
+        """
+        try:
+            if page.websocket.process_stream_control_message(message):
+                return True
+        except ValueError as ex:
+            # client input, reported to the client without closing the connection.
+            await page.websocket.send({"__warning": str(ex), "__command_id": message.get("__command_id")}, True)
+            return True
+
+        if "__subscribe" in message:
+            topic = message["__subscribe"]
+            if isinstance(topic, str) and self.config.pubsub_client_topics.test(topic):
+                page.subscribe(topic)
+            else:
+                await page.websocket.send({"__warning": f"Subscription to topic {topic} is not allowed"}, True)
+            return True
+
+        if "__unsubscribe" in message:
+            topic = message["__unsubscribe"]
+            if topic is None or isinstance(topic, str):
+                page.unsubscribe(topic)
+            else:
+                await page.websocket.send({"__warning": f"Invalid topic {repr(topic)[:50]}"}, True)
+            return True
+
+        return False
 
     async def _process_websocket_request(self, rqst: Request, websocket: WebSocketConnection):
         page = None
         ws = None
+        dispatcher = None
         try:
-            ws = FilebaseApiWebSocket(websocket)
-            page = self._get_page_from_request(rqst, None)
+            page = await self._get_page_from_request(rqst, None)
 
             if not page.has_code_module:
                 raise NotFound("Websocket unavailable")
 
+            if self.is_draining:
+                await websocket.close(code=1012, reason="Server restarting")
+                return
+
+            ws = FilebaseApiWebSocket(
+                websocket,
+                codec=self._select_codec(websocket),
+                publish_queue_size=page.get_setting("pubsub_queue_size"),
+                publish_overflow_policy=page.get_setting("pubsub_overflow_policy"),
+                outbound_queue_size=page.get_setting("websocket_outbound_queue_size"),
+                outbound_overflow_policy=page.get_setting("websocket_outbound_overflow_policy"),
+                outbound_block_timeout=page.get_setting("websocket_outbound_block_timeout"),
+            )
+
             page._ws = ws
+            page.bind_event(FILEBASE_API_SERVER_DRAINING_EVENT_NAME)
+            self._apply_page_websocket_transport(page, websocket)
+            idle_timeout = page.get_setting("websocket_idle_timeout")
+            max_message_size = page.get_setting("websocket_max_message_size")
 
-            async def process_command(page: FilebaseApiPage, data):
-                command_id = ""
-                try:
-                    data = json.loads(data)
-                    assert isinstance(data, dict), ValueError("A websocket command must use json to communicate")
-
-                    possible_commands = []
-                    valid_commands = dict()
-
-                    for command_name in data.keys():
-                        if command_name == "__command_id":
-                            command_id = data[command_name]
-                            continue
-                        possible_commands.append(command_name)
-
-                    for command_name in possible_commands:
-                        assert command_name in page.websocket_command_functions, Exception(
-                            "Command not found: " + command_name
-                        )
-                        args = []
-                        if not isinstance(data[command_name], (dict, list)):
-                            if data[command_name] is not None:
-                                args = [data[command_name]]
-                        else:
-                            args = data[command_name]
-                        valid_commands[command_name] = args
-
-                    rsp = dict()
-
-                    for command_name in valid_commands:
-                        command = page.websocket_command_functions[command_name]
-                        args = valid_commands[command_name]
-                        kwargs = {}
-
-                        if isinstance(args, dict):
-                            kwargs = args
-                            args = []
-
-                        if inspect.iscoroutinefunction(command):
-                            rslt = await command(page, *args, **kwargs)
-                        else:
-                            rslt = command(page, *args, **kwargs)
-
-                        rsp[command_name] = rslt
-
-                    rsp["__command_id"] = command_id
-
-                    await ws.send(json_dump_with_types(rsp))
-                except Exception as ex:
-                    await self.emit("websocket_error", ex)
-                    await ws.send(json_dump_with_types({"__error": str(ex), "__command_id": command_id}))
-                    traceback.print_exception(type(ex), ex, ex.__traceback__)
-                    logger.error(str(ex))
+            async def process_command(data):
+                return await self._process_websocket_command(page, data)
+
+            async def send_response(rsp: dict):
+                await ws.send(rsp, as_json=True)
+
+            dispatcher = FilebaseApiCommandDispatcher(
+                process_command,
+                send_response,
+                max_in_flight=page.get_setting("websocket_max_in_flight_commands"),
+                ordered=page.get_setting("websocket_ordered_responses"),
+            )
+            self._command_dispatchers.add(dispatcher)
 
             if page.has_code_module and "on_ws_open" in page.websocket_command_functions:
                 on_ws_open = page.websocket_command_functions["on_ws_open"]
@@ -248,7 +949,6 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
                 page.register_event_if_exists("message", page)
                 page.register_event_if_exists("close", page)
 
-            page.on("message", process_command)
             page.pipe(ws)
 
             self._active_pages.add(page)
@@ -256,7 +956,11 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
             while True:
                 data = None
                 try:
-                    data = await websocket.recv()
+                    data = await asyncio.wait_for(websocket.recv(), idle_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"Closing idle websocket connection to {page.sub_path}")
+                    await websocket.close(code=1001, reason="Idle timeout")
+                    break
                 except ConnectionClosed:
                     break
                 except asyncio.CancelledError:
@@ -271,8 +975,25 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
                 if data is None:
                     # completed. Needs closing...
                     break
+
+                if max_message_size is not None and len(data) > max_message_size:
+                    # the connection max_size applies from the next frame.
+                    await websocket.close(code=1009, reason="Message too big")
+                    break
+
                 await page.emit("message", page, data)
 
+                try:
+                    message = ws.codec.decode(data)
+                except Exception:
+                    message = data
+
+                if isinstance(message, dict) and await self._process_websocket_control_message(page, message):
+                    continue
+
+                # commands are executed concurrently, see websocket_max_in_flight_commands
+                await dispatcher.dispatch(message)
+
         except Exception as ex:
             traceback.print_exc()
             logger.error(ex)
@@ -282,33 +1003,106 @@ class FilebaseApi(FilebaseTemplateService, AsyncEventHandler):
                 await ws.emit("error", ex)
             raise ex
         finally:
+            if dispatcher is not None:
+                # the connection is gone, no one is waiting for the responses.
+                await dispatcher.cancel()
+            if ws is not None:
+                self.pubsub.unsubscribe(ws)
+                await ws.cancel_streams()
+                await ws.close_outbound()
             if ws is not None:
                 del ws
             if page is not None:
+                self._active_pages.discard(page)
                 del page
 
+    def _configure_websocket_transport(self, sanic: Sanic):
+        """Applies the websocket transport config to the sanic app config (WEBSOCKET_*). Compression
+        requires the FilebaseApiWebSocketProtocol (see transport.py).
+        """
+        sanic_config = {
+            "WEBSOCKET_COMPRESSION": self.config.websocket_compression,
+            "WEBSOCKET_COMPRESSION_THRESHOLD": self.config.websocket_compression_threshold,
+            "WEBSOCKET_COMPRESSION_LEVEL": self.config.websocket_compression_level,
+            "WEBSOCKET_MAX_SIZE": self.config.websocket_max_message_size,
+            "WEBSOCKET_MAX_QUEUE": self.config.websocket_max_queue,
+            "WEBSOCKET_PING_INTERVAL": self.config.websocket_ping_interval,
+            "WEBSOCKET_PING_TIMEOUT": self.config.websocket_ping_timeout,
+        }
+        for key, val in sanic_config.items():
+            if val is not None:
+                sanic.config[key] = val
+        if self.config.websocket_ping_interval == 0:
+            # no keepalive pings.
+            sanic.config.WEBSOCKET_PING_INTERVAL = None
+
+    def _apply_page_websocket_transport(self, page: FilebaseApiPage, websocket: WebSocketConnection):
+        """Applies the page overrides (fapi_[setting] in the code module) of the websocket transport
+        config to the connection.
+        """
+        max_size = page.get_setting("websocket_max_message_size")
+        if max_size is not None:
+            # frames are rejected while being read (see also the message size check in the receive loop).
+            websocket.max_size = max_size
+
+        ping_interval = page.get_setting("websocket_ping_interval")
+        if ping_interval is not None:
+            websocket.ping_interval = ping_interval or None
+        ping_timeout = page.get_setting("websocket_ping_timeout")
+        if ping_timeout is not None:
+            websocket.ping_timeout = ping_timeout
+
+        for extension in getattr(websocket, "extensions", None) or []:
+            if isinstance(extension, FilebaseApiDeflateExtension):
+                extension.enabled = page.get_setting("websocket_compression")
+                extension.min_size = page.get_setting("websocket_compression_threshold")
+
     def register(self, sanic: Sanic):
-        """Register this service to a sanic server.
+        """Register this service to a sanic server. To enable websocket compression, run the sanic app
+        with protocol=FilebaseApiWebSocketProtocol.
 
         Args:
             sanic (Sanic): The sanic server.
         """
         async def invoke_websocket(*args, **kwargs):
+            self._connection_handlers.add(asyncio.current_task())
             return await self._process_websocket_request(*args, **kwargs)
 
         async def invoke_request(*args, **kwargs):
+            self._requests_in_flight += 1
             try:
                 rsp = await self._process_filebase_request(*args, **kwargs)
             except asyncio.CancelledError:
                 return response.empty()
             except SanicException as ex:
                 raise ex
+            except FilebaseExecutorOverloadedException as ex:
+                logger.warning(f"Request rejected, {ex}")
+                return response.text(
+                    "Service unavailable, server overloaded",
+                    status=503,
+                    headers={"Retry-After": str(self.config.overload_retry_after)},
+                )
             except Exception as ex:
                 logger.error(ex)
                 raise ServerError("Internal server error")
+            finally:
+                self._requests_in_flight -= 1
             return rsp
 
-        sanic.add_websocket_route(invoke_websocket, uri="/" + FILEBASE_API_WEBSOCKET_MARKER)
+        if self.config.watch_files:
+            self.start_file_watcher()
+
+        if self.config.preload_code_modules:
+            self.load_code_modules()
+
+        self._configure_websocket_transport(sanic)
+
+        sanic.add_websocket_route(
+            invoke_websocket,
+            uri="/" + FILEBASE_API_WEBSOCKET_MARKER,
+            subprotocols=[codec.subprotocol for codec in self.codecs.values()],
+        )
 
         for uri in [self._uri, self._uri + "/<sub_path:" + r"/?.+" + ">"]:
             common_uri = "/" + uri.strip().strip("/")
@@ -0,0 +1,656 @@
+import os
+import re
+import gzip
+import array
+import json
+import time
+import socket
+import shutil
+import subprocess
+import asyncio
+import pytest
+import websockets
+from typing import Tuple
+from sanic import Sanic
+from zcommon.textops import random_string
+from filebase_api import webservice, responses
+from filebase_api.transport import FilebaseApiWebSocketProtocol
+from filebase_api.helpers import FilebaseApiClientBundle
+
+
+def create_site(root_path, files: dict):
+    for sub_path, content in files.items():
+        fpath = os.path.join(root_path, "public", sub_path)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, "w") as raw:
+            raw.write(content)
+    return str(root_path)
+
+
+def create_app(root_path, **config) -> Tuple[Sanic, webservice.FilebaseApi]:
+    config.setdefault("watch_files", False)
+    app = Sanic("test-" + random_string(6), configure_logging=False)
+    api = webservice.FilebaseApi(root_path, config=config)
+    api.register(app)
+    return app, api
+
+
+def run_websocket_session(app: Sanic, page_sub_path: str, session, subprotocols=None):
+    """Runs the app, connects a websocket client for the page and runs the (async) session with it.
+    Returns the session result.
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    results = dict()
+
+    async def run_session(sanic, loop):
+        url = (
+            f"ws://127.0.0.1:{port}/{webservice.FILEBASE_API_WEBSOCKET_MARKER}"
+            + f"?{webservice.FILEBASE_API_PAGE_TYPE_MARKER}={page_sub_path}"
+        )
+        try:
+            async with websockets.connect(url, subprotocols=subprotocols) as ws:
+                results["value"] = await session(ws)
+        except Exception as ex:
+            results["error"] = ex
+        finally:
+            # let the server finish closing the connection.
+            await asyncio.sleep(0.05)
+            sanic.stop()
+
+    app.register_listener(run_session, "after_server_start")
+    app.run(sock=sock, auto_reload=False, access_log=False, protocol=FilebaseApiWebSocketProtocol)
+    if "error" in results:
+        raise results["error"]
+    return results.get("value")
+
+
+def test_route_index_serving(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "{{page.sub_path}}", "data.csv": "a,b", "a.private.html": "x"})
+    app, _ = create_app(root_path)
+
+    _, rsp = app.test_client.get("/", allow_redirects=False)
+    assert rsp.status == 302
+
+    _, rsp = app.test_client.get("/index.html")
+    assert rsp.status == 200 and rsp.text == "index.html"
+
+    _, rsp = app.test_client.get("/data.csv")
+    assert rsp.status == 200 and rsp.headers["content-type"] == "text/csv"
+
+    _, rsp = app.test_client.get("/a.private.html")
+    assert rsp.status == 404
+
+
+def test_route_access_follows_config_changes(tmp_path):
+    root_path = create_site(tmp_path, {"data.csv": "a,b"})
+    app, api = create_app(root_path)
+
+    _, rsp = app.test_client.get("/data.csv")
+    assert rsp.status == 200
+
+    api.config.private_files = "*.csv"
+    _, rsp = app.test_client.get("/data.csv")
+    assert rsp.status == 404
+
+
+def test_route_index_refreshed_by_watcher(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index"})
+    api = webservice.FilebaseApi(root_path, config={"watch_interval": 0.05})
+    api.start_file_watcher()
+    try:
+        assert api.route_index.get("new.html") is None
+        create_site(tmp_path, {"new.html": "new"})
+        for _ in range(100):
+            if api.route_index.get("new.html") is not None:
+                break
+            time.sleep(0.05)
+        assert api.route_index.get("new.html") is not None
+    finally:
+        api.stop_file_watcher()
+
+
+def test_page_output_cache(tmp_path):
+    root_path = create_site(
+        tmp_path,
+        {
+            "index.html": "{{page.page_id}} {{counter()}}",
+            "index.code.py": 'fapi_cache_policy = {"vary_by_query_args": ["lang"]}',
+        },
+    )
+    app, api = create_app(root_path)
+    calls = []
+    api.attach_method(lambda: calls.append(1) or len(calls), "counter")
+
+    _, first = app.test_client.get("/index.html")
+    _, second = app.test_client.get("/index.html")
+    _, other_lang = app.test_client.get("/index.html?lang=en")
+
+    assert first.text.endswith(" 1") and second.text.endswith(" 1")
+    assert first.text != second.text
+    assert first.text.startswith("index.html-")
+    assert other_lang.text.endswith(" 2")
+    # the cache lookups (template and imported files checks) run in the render executor.
+    assert api.render_executor.stats["completed"] == 3
+
+
+def test_page_output_cache_tracks_imported_files(tmp_path):
+    root_path = create_site(
+        tmp_path,
+        {
+            "index.html": "{{import_file('part.html')}}",
+            "part.html": "v1",
+            "index.code.py": "fapi_cache_policy = 'static'",
+        },
+    )
+    app, _ = create_app(root_path, template_freshness="always")
+
+    _, rsp = app.test_client.get("/index.html")
+    assert rsp.text == "v1"
+
+    part_path = os.path.join(root_path, "public", "part.html")
+    with open(part_path, "w") as raw:
+        raw.write("v2")
+    os.utime(part_path, (0, 0))
+
+    _, rsp = app.test_client.get("/index.html")
+    assert rsp.text == "v2"
+
+
+def test_render_overload_rejected_with_503(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "data.csv": "a,b"})
+    app, api = create_app(root_path, render_threads=1, render_max_queue=1, overload_retry_after=3)
+
+    # all the render threads are busy, and the queue is full.
+    api.render_executor.in_flight = 2
+    try:
+        _, rsp = app.test_client.get("/index.html")
+        assert rsp.status == 503 and rsp.headers["retry-after"] == "3"
+        # static files use the io executor.
+        _, rsp = app.test_client.get("/data.csv", headers={"Accept-Encoding": "gzip"})
+        assert rsp.status == 200
+    finally:
+        api.render_executor.in_flight = 0
+
+
+def test_conditional_get(tmp_path):
+    root_path = create_site(tmp_path, {"data.csv": "a,b"})
+    app, _ = create_app(root_path, cache_control={"*.csv": "public, max-age=60"})
+
+    _, rsp = app.test_client.get("/data.csv")
+    assert rsp.status == 200 and rsp.headers["cache-control"] == "public, max-age=60"
+    etag = rsp.headers["etag"]
+    last_modified = rsp.headers["last-modified"]
+
+    _, rsp = app.test_client.get("/data.csv", headers={"If-None-Match": etag})
+    assert rsp.status == 304
+
+    _, rsp = app.test_client.get("/data.csv", headers={"If-Modified-Since": last_modified})
+    assert rsp.status == 304
+
+    # edited after the route index was built (not watched).
+    fpath = os.path.join(root_path, "public", "data.csv")
+    create_site(root_path, {"data.csv": "c,d"})
+    os.utime(fpath, (os.stat(fpath).st_atime, os.stat(fpath).st_mtime + 10))
+    _, rsp = app.test_client.get("/data.csv", headers={"If-None-Match": etag})
+    assert rsp.status == 200 and rsp.text == "c,d" and rsp.headers["etag"] != etag
+
+    _, rsp = app.test_client.get("/__filebase_api_core/filebase_api_client.js")
+    assert rsp.status == 200
+    _, rsp = app.test_client.get(
+        "/__filebase_api_core/filebase_api_client.js", headers={"If-None-Match": rsp.headers["etag"]}
+    )
+    assert rsp.status == 304
+
+
+def test_client_bundle(tmp_path):
+    code = "from filebase_api import fapi_remote\n\n@fapi_remote\ndef value(page, a):\n    return a\n"
+    root_path = create_site(tmp_path, {"index.html": "{{filebase_api()}}", "index.code.py": code})
+    app, api = create_app(root_path)
+
+    _, page_rsp = app.test_client.get("/index.html")
+    url = re.search(r'src="([^"]+)"', page_rsp.text).group(1)
+    assert url.startswith("/__filebase_api_core/__filebase_api_bundle.")
+
+    _, rsp = app.test_client.get(url)
+    assert rsp.status == 200 and "immutable" in rsp.headers["cache-control"]
+    assert "class FilebaseApi" in rsp.text and "fapi_value" in rsp.text
+    # generated once per module version.
+    _, page_rsp = app.test_client.get("/index.html")
+    assert url in page_rsp.text and len(api._client_bundles) == 1
+
+    _, rsp = app.test_client.get(url.replace("__filebase_api_bundle.", "__filebase_api_bundle.0"))
+    assert rsp.status == 200 and "cache-control" not in rsp.headers
+
+    # replaced on module reload.
+    create_site(root_path, {"index.code.py": code.replace("def value", "def other")})
+    api._on_source_files_changed([os.path.join(root_path, "public", "index.code.py")])
+    _, page_rsp = app.test_client.get("/index.html")
+    changed_url = re.search(r'src="([^"]+)"', page_rsp.text).group(1)
+    assert changed_url != url and len(api._client_bundles) == 1
+    _, rsp = app.test_client.get(changed_url)
+    assert "fapi_other" in rsp.text and "fapi_value" not in rsp.text
+
+
+CLIENT_BATCH_ERRORS_SCRIPT = """
+globalThis.window = globalThis
+window.location = { host: "localhost", pathname: "/index.html" }
+window.addEventListener = () => {}
+%s
+const sent = []
+fapi.send_message = (message) => sent.push(message)
+fapi.micro_batching = true
+
+async function main() {
+    const commands = [fapi.exec_command({ a: [] }), fapi.exec_command({ b: [], c: [] })]
+    await new Promise((resolve) => setTimeout(resolve, 10))
+    fapi.process_message({
+        __batch: [
+            { a: 1, __command_id: 0 },
+            { b: 2, __errors: { c: "failed" }, __command_id: 1 },
+        ],
+    })
+    const results = await Promise.allSettled(commands)
+    console.log(JSON.stringify({
+        sent: sent,
+        results: results.map((rslt) => rslt.status == "fulfilled" ? rslt.value : {
+            error: rslt.reason.message, errors: rslt.reason.errors, b: rslt.reason.response.b
+        }),
+    }))
+}
+main()
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Requires node")
+def test_client_rejects_partly_failed_commands(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index"})
+    app, _ = create_app(root_path)
+    _, rsp = app.test_client.get("/__filebase_api_core/filebase_api_client.js")
+
+    script = tmp_path / "client_test.js"
+    script.write_text(CLIENT_BATCH_ERRORS_SCRIPT % rsp.text)
+    output = json.loads(subprocess.check_output(["node", str(script)], timeout=30))
+
+    assert len(output["sent"]) == 1 and len(output["sent"][0]["__batch"]) == 2
+    assert output["results"][0] == {"a": 1, "__command_id": 0}
+    assert output["results"][1] == {"error": "c: failed", "errors": {"c": "failed"}, "b": 2}
+
+
+def test_client_bundle_inline(tmp_path):
+    code = "from filebase_api import fapi_remote\n\n@fapi_remote\ndef value(page, a):\n    return a\n"
+    root_path = create_site(tmp_path, {"index.html": "{{filebase_api(inline=True)}}", "index.code.py": code})
+    app, _ = create_app(root_path)
+
+    _, rsp = app.test_client.get("/index.html")
+    assert rsp.text.startswith('<script language="javascript">\n') and "src=" not in rsp.text
+    assert "fapi_value" in rsp.text and rsp.text.endswith("filebase_api.register_websocket()\n</script>")
+    assert rsp.text.count("</script>") == 1
+
+    inline = FilebaseApiClientBundle("let tag = '</SCRIPT>'").get_inline_script(connect=False)
+    assert "'<\\/SCRIPT>'" in inline and inline.count("</script>") == 1
+
+
+def test_compressed_responses(tmp_path):
+    root_path = create_site(tmp_path, {"data.csv": "a,b\n" * 1000, "small.csv": "a,b"})
+    with open(os.path.join(root_path, "public", "data.csv.gz"), "wb") as raw:
+        raw.write(gzip.compress(b"precompressed"))
+    app, api = create_app(root_path)
+
+    _, rsp = app.test_client.get("/data.csv", headers={"Accept-Encoding": "gzip"})
+    assert rsp.headers["content-encoding"] == "gzip" and rsp.text == "precompressed"
+
+    del api.route_index.routes["data.csv"].precompressed["gzip"]
+    _, rsp = app.test_client.get("/data.csv", headers={"Accept-Encoding": "gzip"})
+    assert rsp.headers["content-encoding"] == "gzip" and rsp.text == "a,b\n" * 1000
+    assert rsp.headers["etag"].endswith('-gzip"')
+
+    _, rsp = app.test_client.get("/small.csv", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in rsp.headers
+
+    _, rsp = app.test_client.get("/__filebase_api_core/filebase_api_client.js", headers={"Accept-Encoding": "gzip"})
+    assert rsp.headers["content-encoding"] == "gzip"
+
+
+@pytest.mark.parametrize("stream_min_size", [0, 1024 * 1024])
+def test_range_requests(tmp_path, stream_min_size):
+    content = "".join(str(i % 10) for i in range(5000))
+    root_path = create_site(tmp_path, {"data.bin": content})
+    app, api = create_app(root_path, stream_min_size=stream_min_size, stream_chunk_size=1000)
+
+    _, rsp = app.test_client.get("/data.bin", headers={"Accept-Encoding": "identity"})
+    assert rsp.status == 200 and rsp.text == content
+    etag = rsp.headers["etag"]
+    # opened (hashed and read), streamed files are not hashed.
+    assert api.executor_stats["io"]["completed"] == (1 if stream_min_size == 0 else 3)
+
+    _, rsp = app.test_client.get("/data.bin", headers={"Range": "bytes=100-2599"})
+    assert rsp.status == 206 and rsp.text == content[100:2600]
+    assert rsp.headers["content-range"] == "bytes 100-2599/5000"
+
+    _, rsp = app.test_client.get("/data.bin", headers={"Range": "bytes=-10"})
+    assert rsp.status == 206 and rsp.text == content[-10:]
+
+    _, rsp = app.test_client.get("/data.bin", headers={"Range": "bytes=6000-"})
+    assert rsp.status == 416
+
+    _, rsp = app.test_client.get("/data.bin", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert rsp.status == 206
+    _, rsp = app.test_client.get("/data.bin", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert rsp.status == 200
+
+
+@pytest.mark.parametrize("stream_min_size", [0, 1024 * 1024])
+def test_file_changed_after_indexing(tmp_path, stream_min_size):
+    root_path = create_site(tmp_path, {"data.bin": "x" * 3000})
+    app, _ = create_app(root_path, stream_min_size=stream_min_size, stream_chunk_size=1000)
+
+    # the size is taken from the opened file, not the route index.
+    for content in ["y" * 5000, "z" * 100]:
+        create_site(root_path, {"data.bin": content})
+        _, rsp = app.test_client.get("/data.bin", headers={"Accept-Encoding": "identity"})
+        assert rsp.status == 200 and rsp.text == content
+        assert rsp.headers["content-length"] == str(len(content))
+
+
+def test_streamed_file_changed_while_serving(tmp_path, monkeypatch):
+    root_path = create_site(tmp_path, {"data.bin": "x" * 3000})
+    app, _ = create_app(root_path, stream_min_size=0, stream_chunk_size=1000)
+    changes = []
+
+    def open_and_change(file_path):
+        opened = responses.open_file(file_path)
+        with open(file_path, "r+b") as raw:
+            changes.pop(0)(raw)
+        return opened
+
+    monkeypatch.setattr(webservice, "open_file", open_and_change)
+
+    # exactly content length bytes are sent.
+    changes.append(lambda raw: raw.seek(0, os.SEEK_END) and raw.write(b"y" * 2000))
+    _, rsp = app.test_client.get("/data.bin", headers={"Accept-Encoding": "identity"})
+    assert rsp.text == "x" * 3000 and rsp.headers["content-length"] == "3000"
+
+    # truncated, the connection is closed.
+    changes.append(lambda raw: raw.truncate(100))
+    with pytest.raises(ValueError, match="peer closed connection"):
+        app.test_client.get("/data.bin", headers={"Accept-Encoding": "identity"})
+
+
+REMOTE_CODE_MODULE = """
+import os
+import time
+import array
+import asyncio
+from datetime import datetime, timedelta
+from filebase_api import fapi_remote, fapi_remote_config
+
+
+@fapi_remote
+async def wait(page, delay):
+    await asyncio.sleep(delay)
+    return delay
+
+
+@fapi_remote
+def block(page, delay):
+    time.sleep(delay)
+    return delay
+
+
+@fapi_remote
+async def rows(page, count):
+    for i in range(count):
+        yield i
+
+
+@fapi_remote
+def sync_rows(page, count):
+    for i in range(count):
+        yield i
+
+
+@fapi_remote
+def tile(page, size):
+    return {"data": bytes(range(size)), "values": array.array("d", [0.5] * size)}
+
+
+@fapi_remote
+@fapi_remote_config(execution_mode="process")
+def process_id(page):
+    assert page is None
+    return os.getpid()
+
+
+@fapi_remote
+async def announce(page, topic, value):
+    return page.api.publish(topic, value)
+
+
+@fapi_remote
+@fapi_remote_config(coerce_args=True)
+async def shift(page, at: datetime, days: int = 1):
+    return (at + timedelta(days=days)).isoformat()
+
+
+@fapi_remote
+async def type_of(page, value: int):
+    return type(value).__name__
+"""
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_websocket_commands_run_concurrently(tmp_path, ordered):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path, websocket_ordered_responses=ordered)
+
+    async def session(ws):
+        for command_id, delay in enumerate([0.3, 0.01]):
+            await ws.send(json.dumps({"wait": [delay], "__command_id": command_id}))
+        return [json.loads(await asyncio.wait_for(ws.recv(), 5))["__command_id"] for _ in range(2)]
+
+    assert run_websocket_session(app, "index.html", session) == ([0, 1] if ordered else [1, 0])
+
+
+def test_websocket_sync_commands_execution_modes(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, api = create_app(root_path)
+
+    async def session(ws):
+        await ws.send(json.dumps({"block": [0.3], "__command_id": 0}))
+        await ws.send(json.dumps({"block": [0.01], "__command_id": 1}))
+        await ws.send(json.dumps({"process_id": None, "__command_id": 2}))
+        responses = [json.loads(await asyncio.wait_for(ws.recv(), 5)) for _ in range(3)]
+        return {rsp["__command_id"]: rsp for rsp in responses}
+
+    try:
+        responses = run_websocket_session(app, "index.html", session)
+    finally:
+        api.remote_process_executor.shutdown()
+
+    # the blocking call did not block the event loop.
+    order = list(responses.keys())
+    assert order.index(1) < order.index(0)
+    assert responses[2]["process_id"] != os.getpid()
+    assert api.executor_stats["remote_threads"]["completed"] == 2
+    assert api.executor_stats["remote_processes"]["completed"] == 1
+
+
+def test_websocket_batch_commands(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path)
+
+    async def session(ws):
+        start = time.monotonic()
+        await ws.send(json.dumps({"wait": [0.2], "block": [0.2], "missing": None, "__command_id": 0}))
+        multi = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        elapsed = time.monotonic() - start
+
+        commands = [{"wait": [0.01], "__command_id": 1}, {"missing": None, "__command_id": 2}]
+        await ws.send(json.dumps({"__batch": commands}))
+        batch = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        return multi, elapsed, batch
+
+    multi, elapsed, batch = run_websocket_session(app, "index.html", session)
+
+    # executed concurrently, with partial results.
+    assert elapsed < 0.35
+    assert multi["wait"] == 0.2 and multi["block"] == 0.2
+    assert "missing" in multi["__errors"] and "__error" not in multi
+
+    assert [rsp["__command_id"] for rsp in batch["__batch"]] == [1, 2]
+    assert batch["__batch"][0]["wait"] == 0.01
+    assert "__error" in batch["__batch"][1]
+
+
+def test_websocket_command_arguments_binding(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path)
+
+    async def session(ws):
+        responses = []
+        for command_id, args in enumerate(
+            [["DT::2020-01-02T03:04:05", "2"], {"at": "2020-01-02T03:04:05Z"}, {"at": "2020-01-02", "hours": 1}, []]
+        ):
+            await ws.send(json.dumps({"shift": args, "__command_id": command_id}))
+            responses.append(json.loads(await asyncio.wait_for(ws.recv(), 5)))
+        # not coerced by default.
+        await ws.send(json.dumps({"type_of": ["2"], "__command_id": 4}))
+        responses.append(json.loads(await asyncio.wait_for(ws.recv(), 5)))
+        return responses
+
+    coerced, by_name, unexpected, missing, uncoerced = run_websocket_session(app, "index.html", session)
+    assert coerced["shift"] == "2020-01-04T03:04:05"
+    assert by_name["shift"] == "2020-01-03T03:04:05+00:00"
+    assert uncoerced["type_of"] == "str"
+    assert "unexpected argument 'hours'" in unexpected["__error"]
+    assert "missing required arguments: 'at'" in missing["__error"]
+
+
+def test_websocket_streamed_commands(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path)
+
+    async def receive(ws, timeout=5):
+        return json.loads(await asyncio.wait_for(ws.recv(), timeout))
+
+    async def session(ws):
+        await ws.send(json.dumps({"rows": [10], "__command_id": 0, "__stream": 3}))
+        first = [await receive(ws) for _ in range(3)]
+        # out of credits
+        with pytest.raises(asyncio.TimeoutError):
+            await receive(ws, 0.1)
+
+        # invalid credits are reported, the connection stays open.
+        await ws.send(json.dumps({"__command_id": 0, "__stream_credit": "many"}))
+        warning = await receive(ws)
+        assert "Invalid stream credit" in warning["__warning"] and warning["__command_id"] == 0
+
+        await ws.send(json.dumps({"__command_id": 0, "__stream_credit": 10}))
+        rest = [await receive(ws) for _ in range(8)]
+
+        await ws.send(json.dumps({"sync_rows": [3], "__command_id": 1}))
+        collected = await receive(ws)
+
+        await ws.send(json.dumps({"rows": [1000], "__command_id": 2, "__stream": 1}))
+        await receive(ws)
+        await ws.send(json.dumps({"__command_id": 2, "__stream_cancel": True}))
+        await ws.send(json.dumps({"wait": [0], "__command_id": 3}))
+        after_cancel = await receive(ws)
+        return first + rest, collected, after_cancel
+
+    chunks, collected, after_cancel = run_websocket_session(app, "index.html", session)
+
+    assert [rsp["__chunk"] for rsp in chunks[:-1]] == list(range(10))
+    assert chunks[-1]["__end"] is True and chunks[-1]["__count"] == 10
+    assert collected["sync_rows"] == [0, 1, 2]
+    assert after_cancel["__command_id"] == 3
+
+
+def test_websocket_msgpack_codec(tmp_path):
+    msgpack = pytest.importorskip("msgpack")
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path)
+
+    async def session(ws):
+        await ws.send(msgpack.packb({"wait": [0.01], "__command_id": 0}))
+        return ws.subprotocol, await asyncio.wait_for(ws.recv(), 5)
+
+    subprotocol, rsp = run_websocket_session(app, "index.html", session, subprotocols=["fapi.msgpack", "fapi.json"])
+    assert subprotocol == "fapi.msgpack"
+    assert isinstance(rsp, bytes)
+    assert msgpack.unpackb(rsp) == {"wait": 0.01, "__command_id": 0}
+
+
+def test_websocket_binary_attachments(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path)
+
+    async def session(ws):
+        await ws.send(json.dumps({"tile": [4], "__command_id": 0}))
+        return [await asyncio.wait_for(ws.recv(), 5) for _ in range(3)]
+
+    envelope, data, values = run_websocket_session(app, "index.html", session)
+    envelope = json.loads(envelope)
+    assert envelope["__attachments"] == 2
+    rsp = envelope["__message"]["tile"]
+    assert rsp["data"] == {"__attachment": 0, "byte_length": 4}
+    assert rsp["values"] == {"__attachment": 1, "byte_length": 32, "dtype": "float64", "shape": [4]}
+    assert data == bytes(range(4))
+    assert array.array("d", values).tolist() == [0.5] * 4
+
+
+def test_websocket_pubsub(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, api = create_app(root_path, pubsub_client_topics="prices.*")
+
+    async def receive(ws):
+        return json.loads(await asyncio.wait_for(ws.recv(), 5))
+
+    async def session(ws):
+        await ws.send(json.dumps({"__subscribe": "secrets"}))
+        denied = await receive(ws)
+        await ws.send(json.dumps({"__subscribe": "prices.a"}))
+        await ws.send(json.dumps({"announce": ["prices.a", 42], "__command_id": 0}))
+        return denied, sorted([await receive(ws), await receive(ws)], key=lambda rsp: "__topic" in rsp)
+
+    denied, (rsp, published) = run_websocket_session(app, "index.html", session)
+    assert "__warning" in denied
+    assert rsp["announce"] == 1
+    assert published == {"__topic": "prices.a", "payload": 42}
+    assert api.pubsub.topics == []
+
+
+def test_websocket_compression(tmp_path):
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": REMOTE_CODE_MODULE})
+    app, _ = create_app(root_path, websocket_compression_threshold=100)
+
+    async def session(ws):
+        await ws.send(json.dumps({"sync_rows": [1000], "__command_id": 0}))
+        return [ext.name for ext in ws.extensions], json.loads(await asyncio.wait_for(ws.recv(), 5))
+
+    extensions, rsp = run_websocket_session(app, "index.html", session)
+    assert extensions == ["permessage-deflate"]
+    assert rsp["sync_rows"] == list(range(1000))
+
+
+def test_websocket_page_transport_settings(tmp_path):
+    code = REMOTE_CODE_MODULE + "\nfapi_websocket_idle_timeout = 0.2\nfapi_websocket_max_message_size = 64\n"
+    root_path = create_site(tmp_path, {"index.html": "index", "index.code.py": code})
+
+    async def idle_session(ws):
+        await asyncio.wait_for(ws.wait_closed(), 5)
+        return ws.close_code
+
+    async def large_message_session(ws):
+        await ws.send(json.dumps({"wait": [0], "__command_id": "x" * 100}))
+        await asyncio.wait_for(ws.wait_closed(), 5)
+        return ws.close_code
+
+    assert run_websocket_session(create_app(root_path)[0], "index.html", idle_session) == 1001
+    assert run_websocket_session(create_app(root_path)[0], "index.html", large_message_session) == 1009
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])